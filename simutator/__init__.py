@@ -6,6 +6,25 @@ except:
     __version__ = "local"
 
 
-__all__ = ["genome_mutator", "simulate_reads", "tasks", "utils"]
+__all__ = [
+    "delta",
+    "evaluate",
+    "fasta_index",
+    "genome_mutator",
+    "interval_index",
+    "journal",
+    "liftover",
+    "long_reads",
+    "mutation_table",
+    "packed_sequence",
+    "progress",
+    "read_truth",
+    "scheduler",
+    "simulate_reads",
+    "structural_variants",
+    "substitution_model",
+    "tasks",
+    "utils",
+]
 
 from simutator import *
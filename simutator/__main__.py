@@ -56,13 +56,248 @@ def main(args=None):
     )
 
     subparser_mutate_fasta.add_argument(
-        "fasta_in", help="FASTA filename of genome to be mutated"
+        "--random",
+        help="Comma-separated list of snp:ins:del:mi, where: snp, ins, del = expected number of SNPs, insertions, deletions per base; mi=max indel length. Variants are put at random positions, instead of at regular intervals, and do not overlap each other",
+        metavar="LIST1[,LIST2,...]",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--inversions",
+        help="Comma-separated list of <distance between inversions>:<inversion lengths>. Needs uncompressed FASTA input",
+        metavar="INT1:INT2[,INT3:INT4,...]",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--tandem_dups",
+        help="Comma-separated list of dist:len:copies, where: dist=distance between tandem duplications; len=length of the duplicated sequence; copies=number of copies after duplicating (at least 2). Needs uncompressed FASTA input",
+        metavar="LIST1[,LIST2,...]",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--translocations",
+        help="Comma-separated list of numbers of reciprocal translocations between pairs of sequences. Each sequence is in at most one translocation. Needs uncompressed FASTA input",
+        metavar="INT[,INT,...]",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--ts_tv",
+        type=float,
+        help="Transition/transversion ratio of SNPs (including SNPs in complex variants). Default is that all three possible new bases are equally likely",
+        metavar="FLOAT",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--substitution_matrix",
+        help="File of relative chances of each base changing to each other base, for SNPs (including SNPs in complex variants). Must have 4 lines, one for each of A, C, G, T. Each line is the base, then the weights for A, C, G, T (the weight of a base changing to itself is ignored)",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--delta",
+        action="store_true",
+        help="Do not write mutated FASTA files. Instead write a delta file of the mutations, from which the mutated genome can be made using the materialize command",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--liftover",
+        action="store_true",
+        help="Also write a liftover file, for use with the liftover command to map coordinates between the original and mutated genomes",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--table",
+        choices=sorted(simutator.mutation_table.FILE_FORMATS),
+        help="Also write a table of the mutations in this format. The parquet format needs pyarrow to be installed",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--no_vcf",
+        action="store_true",
+        help="Do not write VCF files. Use this with --table to only write tables of mutations",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Read the next sequence and write mutated sequences in background threads, at the same time as mutating. Can be faster, particularly on network filesystems, but uses more memory",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--reference_cache",
+        action="store_true",
+        help="Load the genome from a cache file that stores it in 2-bit format. The cache file is <fasta_in>.simutator_cache, and is made if it does not exist or is older than fasta_in",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--include_bed",
+        help="BED file of regions where mutations can be added. Each mutation must be completely inside one region. Sequences not in the BED file are not mutated",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--exclude_bed",
+        help="BED file of regions where mutations must not be added, for example gaps or centromeres. No mutation overlaps these regions",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--regions",
+        help="List of regions to mutate, separated by semicolons or spaces (not commas), in the form name or name:start-end, where start and end are 1-based coordinates, which can have commas, eg chr1:1,000-2,000. Only these regions are read from the FASTA file, which must be uncompressed. By default only the mutated regions are written, and the VCF file of the original genome has coordinates of the whole sequences. Cannot be used with --pipeline or --reference_cache",
+        metavar="NAME[:START-END][,...]",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--regions_full_genome",
+        action="store_true",
+        help="With --regions, write the whole mutated genome instead of only the regions. Sequences without a region are copied from the input file without being parsed. Needed to use --delta or --liftover with --regions",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of mutated genomes to make at the same time. The genome is loaded once into a memory-mapped 2-bit cache file (see --reference_cache), which is shared by all the processes. If --reference_cache is not used, a temporary cache file is made [%(default)s]",
+        metavar="INT",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--progress_interval",
+        type=float,
+        default=60,
+        help="Log progress of each mutated genome (bases done, rate, estimated time left) at most every this many seconds [%(default)s]",
+        metavar="SECONDS",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--metrics_dir",
+        help="Write progress as Prometheus textfiles (one per mutated genome, ending .prom) in this directory, for the textfile collector of a node exporter",
+        metavar="DIR",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--max_memory",
+        type=simutator.scheduler.parse_memory,
+        help="With --processes, only make mutated genomes at the same time if their total estimated peak memory is at most this amount, eg 16G. Memory of each genome is estimated from the sequence lengths and the expected number of mutations",
+        metavar="MEMORY",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--fasta_out",
+        help="Write the mutated genome to this file, instead of a file named from outprefix. Use - for stdout. Only allowed when making one mutated genome",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--vcf_original",
+        help="Write the VCF file with respect to the original genome to this file, instead of a file named from outprefix. Use - for stdout. Only allowed when making one mutated genome",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--vcf_mutated",
+        help="Write the VCF file with respect to the mutated genome to this file, instead of a file named from outprefix. Use - for stdout. Only allowed when making one mutated genome",
+        metavar="FILENAME",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a run that was stopped, using the same options. Mutated genomes that were finished are not made again, and unfinished ones continue from the last checkpoint. Use with --seed to get the same files as a run that was not stopped",
+    )
+
+    subparser_mutate_fasta.add_argument(
+        "fasta_in",
+        help="FASTA filename of genome to be mutated. Use - to read from stdin, which is only allowed when making one mutated genome",
     )
 
     subparser_mutate_fasta.add_argument("outprefix", help="Prefix of output files")
 
     subparser_mutate_fasta.set_defaults(func=simutator.tasks.mutate_fasta.run)
 
+    # ----------------------- evaluate --------------------------------------------
+    subparser_evaluate = subparsers.add_parser(
+        "evaluate",
+        help="Compare variant calls with truth VCF file",
+        usage="simutator evaluate [options] <truth.vcf> <calls.vcf> <out.json>",
+        description="Compare variant calls with truth VCF file made by mutate_fasta, reporting TP/FP/FN and precision/recall per variant type",
+    )
+
+    subparser_evaluate.add_argument(
+        "--ref_fasta",
+        help="Uncompressed FASTA file of the reference genome of the VCF files. If used, indels are left-aligned before comparing",
+        metavar="FILENAME",
+    )
+
+    subparser_evaluate.add_argument(
+        "--include_filtered",
+        action="store_true",
+        help="Include calls that do not have PASS or . in the FILTER column",
+    )
+
+    subparser_evaluate.add_argument(
+        "truth_vcf",
+        help="Truth VCF file. Usually this is the .original.vcf file made by mutate_fasta",
+    )
+
+    subparser_evaluate.add_argument(
+        "calls_vcf", help="Sorted VCF file of calls to evaluate (can be gzipped)"
+    )
+
+    subparser_evaluate.add_argument("json_out", help="Output JSON file of results")
+
+    subparser_evaluate.set_defaults(func=simutator.tasks.evaluate.run)
+
+    # ----------------------- liftover --------------------------------------------
+    subparser_liftover = subparsers.add_parser(
+        "liftover",
+        help="Map coordinates between original and mutated genomes",
+        usage="simutator liftover [options] <in.liftover> <in.bed> <out.bed>",
+        description="Map intervals in a BED file between original and mutated genomes, using liftover file made by mutate_fasta --liftover",
+    )
+
+    subparser_liftover.add_argument(
+        "--to_original",
+        action="store_true",
+        help="Map from mutated genome to original genome. Default is to map from original to mutated genome",
+    )
+
+    subparser_liftover.add_argument(
+        "liftover_in", help="Liftover filename made by mutate_fasta --liftover"
+    )
+
+    subparser_liftover.add_argument("bed_in", help="Input BED file")
+    subparser_liftover.add_argument("bed_out", help="Output BED file")
+
+    subparser_liftover.set_defaults(func=simutator.tasks.liftover.run)
+
+    # ----------------------- materialize -----------------------------------------
+    subparser_materialize = subparsers.add_parser(
+        "materialize",
+        help="Make mutated genome from original FASTA and delta file",
+        usage="simutator materialize [options] <in.fasta> <in.delta> <out.fasta>",
+        description="Make mutated genome, or regions of it, from original FASTA file and delta file made by mutate_fasta --delta",
+    )
+
+    subparser_materialize.add_argument(
+        "--region",
+        action="append",
+        help="Only output this sequence, or region of a sequence, in the form name or name:start-end, where start and end are 1-based coordinates in the mutated sequence. Name can be original or mutated sequence name. This option can be used more than once",
+        metavar="NAME[:START-END]",
+    )
+
+    subparser_materialize.add_argument(
+        "fasta_in",
+        help="Uncompressed FASTA filename of original genome (ie the input to mutate_fasta)",
+    )
+
+    subparser_materialize.add_argument(
+        "delta_in", help="Delta filename made by mutate_fasta --delta"
+    )
+
+    subparser_materialize.add_argument("fasta_out", help="Output FASTA filename")
+
+    subparser_materialize.set_defaults(func=simutator.tasks.materialize.run)
+
     # ----------------------- simulate_reads --------------------------------------
     subparser_simulate_reads = subparsers.add_parser(
         "simulate_reads",
@@ -122,7 +357,93 @@ def main(args=None):
     )
 
     subparser_simulate_reads.add_argument(
-        "fasta_in", help="FASTA filename from which  to simulate reads"
+        "--long_reads",
+        action="store_true",
+        help="Simulate long reads (like Nanopore or PacBio) instead of Illumina reads. Does not use ART. Uses the options --read_depth, --long_read_length, --long_read_length_sd, --long_read_errors, --seed. Cannot be used with --output_shards or --truth_vcf. Other ART options are ignored",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--long_read_length",
+        nargs="*",
+        type=int,
+        help="Space-separated list of mean long read lengths %(default)s",
+        default=[10000],
+        metavar="INT",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--long_read_length_sd",
+        type=int,
+        help="Standard deviation of long read length. Lengths are lognormally distributed [%(default)s]",
+        default=5000,
+        metavar="INT",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--long_read_errors",
+        help="Rates of substitution, insertion and deletion errors per base in long reads [%(default)s]",
+        default="0.005:0.0025:0.0025",
+        metavar="SUB:INS:DEL",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--output_shards",
+        type=int,
+        help="Split the reads of each simulation into this many pairs of gzipped FASTQ files, keeping read pairs together. The shards are listed in the output JSON file [%(default)s]",
+        default=1,
+        metavar="INT",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--truth_vcf",
+        help="VCF file made by mutate_fasta with respect to the mutated genome (the .mutated.vcf file), where in.fasta is that mutated genome. If used, also writes a table for each set of reads, of where each read came from in the mutated and original genomes, and the variants it overlaps",
+        metavar="FILENAME",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Number of sets of reads to simulate at the same time [%(default)s]",
+        metavar="INT",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--progress_interval",
+        type=float,
+        default=60,
+        help="Log progress of each set of reads (bases done, rate, estimated time left) at most every this many seconds [%(default)s]",
+        metavar="SECONDS",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--metrics_dir",
+        help="Write progress as Prometheus textfiles (one per set of reads and one for all of them, ending .prom) in this directory, for the textfile collector of a node exporter",
+        metavar="DIR",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--max_memory",
+        type=simutator.scheduler.parse_memory,
+        help="With --processes, only simulate sets of reads at the same time if their total estimated peak memory is at most this amount, eg 16G. Memory is estimated from the genome length",
+        metavar="MEMORY",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--stdout",
+        action="store_true",
+        help="Write reads to stdout as uncompressed FASTQ, instead of to gzipped files. Paired reads are interleaved. Only one set of reads can be made (ie one value for each option that takes a list). The JSON file is still written",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue a run that was stopped, using the same options. Sets of reads that were finished are not made again",
+    )
+
+    subparser_simulate_reads.add_argument(
+        "fasta_in",
+        help="FASTA filename from which  to simulate reads. Use - to read from stdin",
     )
 
     subparser_simulate_reads.add_argument("outprefix", help="Prefix of output files")
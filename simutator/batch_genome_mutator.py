@@ -1,6 +1,22 @@
+import functools
 import logging
+import os
+import re
 
-from simutator import genome_mutator
+from simutator import (
+    delta,
+    fasta_index,
+    genome_mutator,
+    interval_index,
+    journal,
+    mutation_table,
+    packed_sequence,
+    progress,
+    scheduler,
+    structural_variants,
+    substitution_model,
+    utils,
+)
 
 
 def _parse_indels_option_string(s):
@@ -28,6 +44,29 @@ def _parse_complex_option_string(s):
     return complex_vars
 
 
+def _parse_random_option_string(s):
+    random_vars = []
+    for x in s.split(","):
+        snp, ins, dels, max_indel = x.split(":")
+        random_vars.append(
+            {
+                "snp": float(snp),
+                "ins": float(ins),
+                "del": float(dels),
+                "max_indel_len": int(max_indel),
+            }
+        )
+    return random_vars
+
+
+def _parse_tandem_dups_option_string(s):
+    tandem_dups = []
+    for x in s.split(","):
+        dist, length, copies = [int(y) for y in x.split(":")]
+        tandem_dups.append({"dist": dist, "len": length, "copies": copies})
+    return tandem_dups
+
+
 def mutations_from_options(options):
     mutations = {}
     if options.snps is not None:
@@ -55,47 +94,522 @@ def mutations_from_options(options):
         except:
             raise ValueError(f"Cannot parse --complex option: '{options.complex}'")
 
+    if options.random is not None:
+        try:
+            mutations["random"] = _parse_random_option_string(options.random)
+        except:
+            raise ValueError(f"Cannot parse --random option: '{options.random}'")
+
+    if options.inversions is not None:
+        try:
+            mutations["inversion"] = _parse_indels_option_string(options.inversions)
+        except:
+            raise ValueError(
+                f"Cannot parse --inversions option: '{options.inversions}'"
+            )
+
+    if options.tandem_dups is not None:
+        try:
+            mutations["tandem_dup"] = _parse_tandem_dups_option_string(
+                options.tandem_dups
+            )
+        except:
+            raise ValueError(
+                f"Cannot parse --tandem_dups option: '{options.tandem_dups}'"
+            )
+
+    if options.translocations is not None:
+        try:
+            mutations["translocation"] = [
+                {"count": int(x)} for x in options.translocations.split(",")
+            ]
+        except:
+            raise ValueError(
+                f"Cannot parse --translocations option: '{options.translocations}'"
+            )
+
     if len(mutations) == 0:
         raise RuntimeError(
-            "Must use at least one of the options --snps, --dels, --ins, --complex"
+            "Must use at least one of the options --snps, --dels, --ins, --complex, --random, --inversions, --tandem_dups, --translocations"
         )
 
     return mutations
 
 
-def run_all_mutations(fasta_in, outprefix, mutations, seed=None):
-    for mutation_type, mutations_list in mutations.items():
-        for mutation in mutations_list:
-            logging.info(
-                f"Simulating mutations of type '{mutation_type}' with parameters {mutation}"
-            )
-            if mutation_type == "snp":
-                mutator = genome_mutator.SnpMutator(mutation["dist"], seed=seed)
-            elif mutation_type == "insertion":
-                mutator = genome_mutator.InsertionMutator(
-                    mutation["dist"], mutation["len"], seed=seed
-                )
-            elif mutation_type == "deletion":
-                mutator = genome_mutator.DeletionMutator(
-                    mutation["dist"], mutation["len"], seed=seed
-                )
-            elif mutation_type == "complex":
-                mutator = genome_mutator.ComplexMutator(
-                    mutation["dist"],
-                    mutation["len"],
-                    mutation["snp"],
-                    mutation["del"],
-                    mutation["ins"],
-                    mutation["max_indel_len"],
-                    seed=seed,
-                )
-
-            this_prefix = f"{outprefix}.{mutation_type}." + ".".join(
-                [k + "-" + str(v) for k, v in sorted(mutation.items())]
+def substitution_model_from_options(options):
+    if options.ts_tv is not None and options.substitution_matrix is not None:
+        raise RuntimeError(
+            "Cannot use both of the options --ts_tv and --substitution_matrix"
+        )
+    elif options.ts_tv is not None:
+        return substitution_model.SubstitutionModel.from_ts_tv(options.ts_tv)
+    elif options.substitution_matrix is not None:
+        return substitution_model.SubstitutionModel.from_matrix_file(
+            options.substitution_matrix
+        )
+    else:
+        return None
+
+
+def regions_from_options(options):
+    """Returns list of the regions in the --regions option, or None if it
+    was not used. Regions are separated by semicolons or whitespace, not
+    commas, because coordinates can have commas (eg chr1:1,000-2,000)"""
+    if options.regions is None:
+        return None
+    regions = [x for x in re.split(r"[;\s]+", options.regions) if x != ""]
+    if len(regions) == 0:
+        raise ValueError(f"No regions found in --regions option: '{options.regions}'")
+    return regions
+
+
+def _mutation_name(mutation_type, mutation):
+    return f"{mutation_type}." + ".".join(
+        [k + "-" + str(v) for k, v in sorted(mutation.items())]
+    )
+
+
+# For estimating peak memory of making one mutated genome. The sequence
+# being mutated, the pieces of the mutated sequence, the joined mutated
+# sequence and the FASTA string that is written are all in memory at the
+# same time. The mutations of all sequences are kept until the end, when
+# the VCF files are written. Each mutation is a namedtuple of two ints and
+# two strings
+BYTES_PER_BASE = 4
+BYTES_PER_MUTATION = 300
+
+
+def expected_mutations(mutation_type, mutation, genome_length):
+    """Returns tuple (expected number of mutations, expected total length of
+    the sequences of each mutation)"""
+    if mutation_type == "random":
+        rate = mutation["snp"] + mutation["ins"] + mutation["del"]
+        return int(genome_length * rate), 2 + mutation["max_indel_len"]
+    elif mutation_type == "translocation":
+        return mutation["count"], 0
+    elif mutation_type in structural_variants.MUTATION_TYPES:
+        # Structural variants are stored as positions, not sequences
+        return genome_length // (mutation["dist"] + mutation["len"]), 0
+    count = genome_length // mutation["dist"]
+    if mutation_type == "complex":
+        return count, 2 * mutation["len"] + mutation["ins"] * mutation["max_indel_len"]
+    elif mutation_type in {"insertion", "ins", "deletion", "del"}:
+        return count, 2 + mutation["len"]
+    return count, 2
+
+
+def estimate_memory(mutation_type, mutation, lengths):
+    """Returns estimated peak memory in bytes of making a mutated genome,
+    where lengths is a list of the lengths of the sequences in the genome"""
+    count, seq_length = expected_mutations(mutation_type, mutation, sum(lengths))
+    if mutation_type in structural_variants.MUTATION_TYPES:
+        # The mutated genome is written in chunks, and never held in memory
+        return (
+            scheduler.PROCESS_MEMORY
+            + BYTES_PER_BASE * structural_variants.CHUNK_SIZE
+            + count * BYTES_PER_MUTATION
+        )
+    return (
+        scheduler.PROCESS_MEMORY
+        + BYTES_PER_BASE * max(lengths, default=0)
+        + count * (BYTES_PER_MUTATION + seq_length)
+    )
+
+
+def _sequence_lengths(fasta_in, reference_cache=None):
+    """Returns list of the lengths of the sequences in fasta_in, from the
+    reference cache or .fai index. Returns None if neither is available,
+    instead of reading the whole FASTA file"""
+    if fasta_in == "-":
+        return None
+    if reference_cache is True:
+        reference_cache = packed_sequence.default_cache_filename(fasta_in)
+    if reference_cache is not None and packed_sequence.cache_is_valid(
+        fasta_in, reference_cache
+    ):
+        return packed_sequence.sequence_lengths(reference_cache)
+    return fasta_index.sequence_lengths(fasta_in)
+
+
+def _run_one_mutation(
+    mutation_type,
+    mutation,
+    fasta_in,
+    outprefix,
+    seed=None,
+    delta_only=False,
+    liftover=False,
+    table_format=None,
+    write_vcf=True,
+    pipelined=False,
+    reference_cache=None,
+    mask=None,
+    regions=None,
+    regions_full_genome=False,
+    substitution=None,
+    fasta_out=None,
+    vcf_original_out=None,
+    vcf_mutated_out=None,
+    checkpoint=False,
+    resume=False,
+    genome_length=None,
+    progress_interval=60,
+    metrics_dir=None,
+):
+    logging.info(
+        f"Simulating mutations of type '{mutation_type}' with parameters {mutation}"
+    )
+    if mutation_type == "snp":
+        mutator = genome_mutator.SnpMutator(
+            mutation["dist"], seed=seed, substitution=substitution
+        )
+    elif mutation_type in {"insertion", "ins"}:
+        mutator = genome_mutator.InsertionMutator(
+            mutation["dist"], mutation["len"], seed=seed
+        )
+    elif mutation_type in {"deletion", "del"}:
+        mutator = genome_mutator.DeletionMutator(
+            mutation["dist"], mutation["len"], seed=seed
+        )
+    elif mutation_type == "complex":
+        mutator = genome_mutator.ComplexMutator(
+            mutation["dist"],
+            mutation["len"],
+            mutation["snp"],
+            mutation["del"],
+            mutation["ins"],
+            mutation["max_indel_len"],
+            seed=seed,
+            substitution=substitution,
+        )
+    elif mutation_type == "random":
+        mutator = genome_mutator.RandomMutator(
+            mutation["snp"],
+            mutation["ins"],
+            mutation["del"],
+            mutation["max_indel_len"],
+            seed=seed,
+            substitution=substitution,
+        )
+    elif mutation_type == "inversion":
+        mutator = structural_variants.InversionMutator(
+            mutation["dist"], mutation["len"]
+        )
+    elif mutation_type == "tandem_dup":
+        mutator = structural_variants.TandemDuplicationMutator(
+            mutation["dist"], mutation["len"], copies=mutation["copies"]
+        )
+    elif mutation_type == "translocation":
+        mutator = structural_variants.TranslocationMutator(mutation["count"], seed=seed)
+    else:
+        raise ValueError(f"Unknown mutation type '{mutation_type}'. Cannot continue")
+
+    this_prefix = f"{outprefix}.{_mutation_name(mutation_type, mutation)}"
+    if delta_only:
+        delta_out = f"{this_prefix}.delta"
+    else:
+        if fasta_out is None:
+            fasta_out = f"{this_prefix}.fa"
+        delta_out = None
+
+    if table_format is None:
+        table_out = None
+    else:
+        table_out = mutation_table.table_filename(this_prefix, table_format)
+
+    if write_vcf:
+        if vcf_original_out is None:
+            vcf_original_out = f"{this_prefix}.original.vcf"
+        if vcf_mutated_out is None:
+            vcf_mutated_out = f"{this_prefix}.mutated.vcf"
+    else:
+        vcf_original_out = vcf_mutated_out = None
+    liftover_out = f"{this_prefix}.liftover" if liftover else None
+
+    # Contig checkpoints are only for whole genomes. Regions are quick to
+    # redo, because only the regions are read
+    checkpoint_file = None
+    is_sv = mutation_type in structural_variants.MUTATION_TYPES
+    if checkpoint and regions is None and not is_sv:
+        checkpoint_file = f"{this_prefix}.checkpoint"
+        if not resume and os.path.exists(checkpoint_file):
+            os.unlink(checkpoint_file)
+
+    # Progress is not reported for regions: their total length is not known
+    # until they are read, and they are quick to make anyway
+    reporter = None
+    if regions is None:
+        name = _mutation_name(mutation_type, mutation)
+        reporter = progress.ProgressReporter(
+            name,
+            total_bases=genome_length,
+            interval=progress_interval,
+            metrics_file=(
+                None
+                if metrics_dir is None
+                else progress.metrics_filename(metrics_dir, outprefix, name)
+            ),
+            labels={
+                "command": "mutate_fasta",
+                "outprefix": outprefix,
+                "configuration": name,
+            },
+        )
+
+    outputs = [
+        fasta_out,
+        vcf_original_out,
+        vcf_mutated_out,
+        delta_out,
+        liftover_out,
+        table_out,
+    ]
+    with utils.atomic_outputs(outputs) as tmp_outputs:
+        tmp_fasta, tmp_vcf_original, tmp_vcf_mutated, *tmp_others = tmp_outputs
+        tmp_delta, tmp_liftover, tmp_table = tmp_others
+        if is_sv:
+            # The mutated genome is written in one pass at the end, so
+            # there is nothing to checkpoint
+            mutator.mutate_fasta_file(
+                fasta_in,
+                tmp_fasta,
+                tmp_vcf_original,
+                tmp_vcf_mutated,
+                mask=mask,
+                progress=reporter,
             )
+        elif regions is None:
             mutator.mutate_fasta_file(
                 fasta_in,
-                f"{this_prefix}.fa",
-                f"{this_prefix}.original.vcf",
-                f"{this_prefix}.mutated.vcf",
+                tmp_fasta,
+                tmp_vcf_original,
+                tmp_vcf_mutated,
+                delta_out=tmp_delta,
+                liftover_out=tmp_liftover,
+                table_out=tmp_table,
+                table_format=table_format,
+                pipelined=pipelined,
+                reference_cache=reference_cache,
+                mask=mask,
+                checkpoint=checkpoint_file,
+                progress=reporter,
+            )
+        else:
+            mutator.mutate_fasta_regions(
+                fasta_in,
+                regions,
+                tmp_fasta,
+                tmp_vcf_original,
+                tmp_vcf_mutated,
+                full_genome=regions_full_genome,
+                delta_out=tmp_delta,
+                liftover_out=tmp_liftover,
+                table_out=tmp_table,
+                table_format=table_format,
+                mask=mask,
+            )
+        # Remove the checkpoint before renaming the files. If this is
+        # stopped after removing it, resuming starts this mutation again
+        if checkpoint_file is not None:
+            os.unlink(checkpoint_file)
+
+    if delta_out is not None:
+        os.replace(delta.index_filename(tmp_delta), delta.index_filename(delta_out))
+    if reporter is not None:
+        reporter.finish()
+
+
+def _run_job(run_one, job):
+    run_one(*job)
+    return job
+
+
+def run_all_mutations(
+    fasta_in,
+    outprefix,
+    mutations,
+    seed=None,
+    delta_only=False,
+    liftover=False,
+    table_format=None,
+    write_vcf=True,
+    pipelined=False,
+    reference_cache=None,
+    include_bed=None,
+    exclude_bed=None,
+    regions=None,
+    regions_full_genome=False,
+    processes=1,
+    substitution=None,
+    fasta_out=None,
+    vcf_original_out=None,
+    vcf_mutated_out=None,
+    resume=False,
+    max_memory=None,
+    progress_interval=60,
+    metrics_dir=None,
+):
+    """Makes a mutated genome for each of the mutations. If processes is more
+    than 1, then that many mutated genomes are made at the same time, in
+    separate processes. The genome is loaded from a reference cache (see
+    the packed_sequence module), which every process memory-maps, so that
+    there is only one copy of the genome in memory however many processes
+    are used. If reference_cache is None, a temporary cache is made and
+    then deleted at the end. If max_memory is not None, the peak memory of
+    each mutated genome is estimated, and genomes are only made at the same
+    time if their total estimated memory is at most max_memory bytes (see
+    the scheduler module).
+    fasta_in can be "-" to read from stdin. fasta_out, vcf_original_out and
+    vcf_mutated_out are filenames to use instead of the names made from
+    outprefix, where "-" means stdout. These can only be used when there is
+    one mutation to make, because each file is only written once.
+    Output files are written with temporary names, and renamed when they
+    are finished. Progress is recorded in the journal file
+    <outprefix>.journal, which is deleted at the end. For each mutation
+    that is being made, there is also a file of checkpoints after every
+    few sequences. If resume is True, then the mutations that already
+    finished are skipped, and the others continue from their last
+    checkpoint. If seed is not None, the output is the same as running
+    from the start without stopping. Cannot resume when reading from stdin
+    or writing to stdout. Structural variants (see the structural_variants
+    module) need an uncompressed FASTA file, and cannot be used with delta
+    files, liftover, tables or regions.
+    While each mutated genome is made, progress is logged every
+    progress_interval seconds (see the progress module). The estimated time
+    left is only known if the sequence lengths are in a reference cache or
+    .fai index. If metrics_dir is not None, a Prometheus textfile of the
+    progress of each mutated genome is written in that directory"""
+    if regions is not None and (pipelined or reference_cache is not None):
+        raise ValueError(
+            "Cannot use regions with pipelining or reference cache. Cannot continue"
+        )
+    outputs = [fasta_out, vcf_original_out, vcf_mutated_out]
+    if outputs.count("-") > 1:
+        raise ValueError("Only one output can be written to stdout. Cannot continue")
+    if delta_only and fasta_out is not None:
+        raise ValueError(
+            "Cannot give FASTA output filename when only writing delta files. Cannot continue"
+        )
+    if fasta_in == "-" and (regions is not None or reference_cache is not None):
+        raise ValueError(
+            "Cannot use regions or reference cache when reading from stdin. Cannot continue"
+        )
+    if structural_variants.MUTATION_TYPES.intersection(mutations) and (
+        fasta_in == "-"
+        or delta_only
+        or liftover
+        or table_format is not None
+        or regions is not None
+    ):
+        raise ValueError(
+            "Cannot use structural variants with stdin, delta files, liftover, tables or regions. Cannot continue"
+        )
+    mask = interval_index.Mask.from_bed_files(
+        include_bed=include_bed, exclude_bed=exclude_bed
+    )
+
+    jobs = [(k, x) for k, v in mutations.items() for x in v]
+    if len(jobs) > 1 and (fasta_in == "-" or outputs != [None, None, None]):
+        raise ValueError(
+            "Can only read from stdin, or give output filenames, when making one mutated genome. Cannot continue"
+        )
+    use_journal = fasta_in != "-" and "-" not in outputs
+    if resume and not use_journal:
+        raise ValueError(
+            "Cannot resume when reading from stdin or writing to stdout. Cannot continue"
+        )
+    if use_journal:
+        sweep_journal = journal.Journal(
+            journal.journal_filename(outprefix), resume=resume
+        )
+        # Options that change the output of every mutation. The mutations
+        # themselves are in the names of the finished units
+        sweep_journal.check_options(
+            {
+                "fasta_in": fasta_in,
+                "seed": seed,
+                "delta_only": delta_only,
+                "liftover": liftover,
+                "table_format": table_format,
+                "write_vcf": write_vcf,
+                "include_bed": include_bed,
+                "exclude_bed": exclude_bed,
+                "regions": regions,
+                "regions_full_genome": regions_full_genome,
+                "substitution": (
+                    None if substitution is None else substitution.cumulative_weights
+                ),
+            }
+        )
+        finished = sweep_journal.finished()
+        jobs = [x for x in jobs if _mutation_name(*x) not in finished]
+        if resume:
+            logging.info(
+                f"Resuming. Mutations already finished: {len(finished)}. Mutations to make: {len(jobs)}"
+            )
+
+    processes = min(processes, len(jobs))
+    tmp_cache = None
+    if processes > 1 and regions is None:
+        # Regions are read using random access, so do not need the cache
+        if reference_cache is None:
+            reference_cache = tmp_cache = f"{outprefix}.tmp.simutator_cache"
+        elif reference_cache is True:
+            reference_cache = packed_sequence.default_cache_filename(fasta_in)
+        if not packed_sequence.cache_is_valid(fasta_in, reference_cache):
+            logging.info(f"Making reference cache file {reference_cache}")
+            packed_sequence.build_cache(fasta_in, reference_cache)
+
+    if metrics_dir is not None:
+        os.makedirs(metrics_dir, exist_ok=True)
+    lengths = _sequence_lengths(fasta_in, reference_cache)
+    run_one = functools.partial(
+        _run_one_mutation,
+        fasta_in=fasta_in,
+        outprefix=outprefix,
+        seed=seed,
+        delta_only=delta_only,
+        liftover=liftover,
+        table_format=table_format,
+        write_vcf=write_vcf,
+        pipelined=pipelined,
+        reference_cache=reference_cache,
+        mask=mask,
+        regions=regions,
+        regions_full_genome=regions_full_genome,
+        substitution=substitution,
+        fasta_out=fasta_out,
+        vcf_original_out=vcf_original_out,
+        vcf_mutated_out=vcf_mutated_out,
+        checkpoint=use_journal,
+        resume=resume,
+        genome_length=None if lengths is None else sum(lengths),
+        progress_interval=progress_interval,
+        metrics_dir=metrics_dir,
+    )
+
+    try:
+        if processes > 1:
+            if lengths is None:
+                with fasta_index.FastaIndex(fasta_in) as fasta_idx:
+                    lengths = [fasta_idx.length(x) for x in fasta_idx.names()]
+            memory = [estimate_memory(*job, lengths) for job in jobs]
+            finished_jobs = scheduler.run_jobs(
+                functools.partial(_run_job, run_one),
+                [(x,) for x in jobs],
+                memory,
+                processes=processes,
+                max_memory=max_memory,
             )
+            for _, job in finished_jobs:
+                sweep_journal.finish(_mutation_name(*job))
+        else:
+            for job in jobs:
+                _run_job(run_one, job)
+                if use_journal:
+                    sweep_journal.finish(_mutation_name(*job))
+        if use_journal:
+            sweep_journal.remove()
+    finally:
+        if tmp_cache is not None and os.path.exists(tmp_cache):
+            os.unlink(tmp_cache)
@@ -0,0 +1,193 @@
+import collections
+import re
+
+import pyfastaq
+
+from simutator import fasta_index, genome_mutator
+
+# A delta file stores the mutations made to each sequence of a genome, so
+# that the mutated genome can be reconstructed from the original FASTA file
+# plus the delta file. It is a tab-delimited file of mutations, grouped by
+# sequence. Positions are zero-based. The index file (delta file name plus
+# ".idx") has one line per sequence, giving the original and mutated names
+# and lengths, and where its mutations are in the delta file.
+
+DeltaIndexRecord = collections.namedtuple(
+    "DeltaIndexRecord",
+    [
+        "name",
+        "mutated_name",
+        "original_length",
+        "mutated_length",
+        "offset",
+        "mutation_count",
+    ],
+)
+
+
+def index_filename(delta_file):
+    return delta_file + ".idx"
+
+
+def write_delta_file(filename, sequences, description):
+    """Writes delta file and its index. sequences = list of tuples
+    (name, mutated name, original length, mutated length, list of mutations)"""
+    index = []
+    with open(filename, "w") as f:
+        header = "\n".join(
+            [
+                "##simutator_delta=1",
+                f"##description={description}",
+                "\t".join(["#CHROM", "ORIGINAL_POS", "NEW_POS", "ORIGINAL", "NEW"]),
+            ]
+        )
+        print(header, file=f)
+        offset = len(header.encode()) + 1
+        for name, mutated_name, original_length, mutated_length, mutations in sequences:
+            index.append(
+                DeltaIndexRecord(
+                    name,
+                    mutated_name,
+                    original_length,
+                    mutated_length,
+                    offset,
+                    len(mutations),
+                )
+            )
+            for mutation in mutations:
+                line = "\t".join([name, *[str(x) for x in mutation]]) + "\n"
+                f.write(line)
+                offset += len(line.encode())
+
+    with open(index_filename(filename), "w") as f:
+        for record in index:
+            print(*record, sep="\t", file=f)
+
+
+def load_delta_index(delta_file):
+    index = collections.OrderedDict()
+    with open(index_filename(delta_file)) as f:
+        for line in f:
+            name, mutated_name, *numbers = line.rstrip("\n").split("\t")
+            index[name] = DeltaIndexRecord(
+                name, mutated_name, *[int(x) for x in numbers]
+            )
+    return index
+
+
+def load_mutations(delta_file, index_record):
+    mutations = []
+    with open(delta_file, "rb") as f:
+        f.seek(index_record.offset)
+        for _ in range(index_record.mutation_count):
+            fields = f.readline().decode().rstrip("\n").split("\t")
+            mutations.append(
+                genome_mutator.Mutation(
+                    int(fields[1]), int(fields[2]), fields[3], fields[4]
+                )
+            )
+    return mutations
+
+
+def mutated_segments(mutations, original_length):
+    """Yields the pieces that make the mutated sequence, in order. Each piece
+    is a tuple (mutated start, mutated end, original start, new sequence),
+    where exactly one of original start and new sequence is None. Pieces
+    with a new sequence are the mutations, the other pieces are unchanged
+    stretches of the original sequence"""
+    original_pos = 0
+    for mutation in mutations:
+        if mutation.original_position > original_pos:
+            length = mutation.original_position - original_pos
+            mutated_start = mutation.new_position - length
+            yield mutated_start, mutation.new_position, original_pos, None
+        if len(mutation.new_seq):
+            yield (
+                mutation.new_position,
+                mutation.new_position + len(mutation.new_seq),
+                None,
+                mutation.new_seq,
+            )
+        original_pos = mutation.original_position + len(mutation.original_seq)
+
+    if original_pos < original_length:
+        if len(mutations):
+            last = mutations[-1]
+            mutated_start = last.new_position + len(last.new_seq)
+        else:
+            mutated_start = 0
+        mutated_end = mutated_start + original_length - original_pos
+        yield mutated_start, mutated_end, original_pos, None
+
+
+def materialize_sequence(fasta_idx, index_record, mutations, start=0, end=None):
+    """Returns the mutated sequence from start to end (zero-based, end not
+    included, both in the coordinates of the mutated sequence)"""
+    if end is None or end > index_record.mutated_length:
+        end = index_record.mutated_length
+    pieces = []
+    for seg_start, seg_end, original_start, new_seq in mutated_segments(
+        mutations, index_record.original_length
+    ):
+        if seg_end <= start:
+            continue
+        if seg_start >= end:
+            break
+        trim_start = max(start, seg_start) - seg_start
+        trim_end = min(end, seg_end) - seg_start
+        if new_seq is None:
+            pieces.append(
+                fasta_idx.fetch(
+                    index_record.name,
+                    original_start + trim_start,
+                    original_start + trim_end,
+                )
+            )
+        else:
+            pieces.append(new_seq[trim_start:trim_end])
+    return "".join(pieces)
+
+
+def parse_region_string(region):
+    """Parses region of the form name, or name:start-end (1-based inclusive).
+    Returns tuple (name, start, end), zero-based with end not included.
+    start and end are None if not given"""
+    match = re.match(r"^(?P<name>.+):(?P<start>[0-9,]+)-(?P<end>[0-9,]+)$", region)
+    if match is None:
+        return region, None, None
+    start = int(match.group("start").replace(",", "")) - 1
+    end = int(match.group("end").replace(",", ""))
+    if start < 0 or end <= start:
+        raise ValueError(f"Cannot parse region '{region}'")
+    return match.group("name"), start, end
+
+
+def materialize_fasta(fasta_in, delta_file, fasta_out, regions=None):
+    """Writes the mutated genome (or regions of it) to a FASTA file, made
+    from the original genome in fasta_in plus the delta file. regions is a
+    list of strings, each one the name (original or mutated) of a sequence,
+    optionally with :start-end on the end, where start and end are 1-based
+    coordinates in the mutated sequence"""
+    delta_index = load_delta_index(delta_file)
+    mutated_names = {x.mutated_name: x.name for x in delta_index.values()}
+    if regions is None:
+        regions = list(delta_index)
+
+    with fasta_index.FastaIndex(fasta_in) as fasta_idx, open(fasta_out, "w") as f:
+        loaded_name = None
+        for region in regions:
+            name, start, end = parse_region_string(region)
+            name = mutated_names.get(name, name)
+            if name not in delta_index:
+                raise ValueError(f"Sequence '{name}' not found in {delta_file}")
+            index_record = delta_index[name]
+            if name != loaded_name:
+                mutations = load_mutations(delta_file, index_record)
+                loaded_name = name
+            seq = materialize_sequence(
+                fasta_idx, index_record, mutations, start=start or 0, end=end
+            )
+            seq_name = index_record.mutated_name
+            if start is not None:
+                seq_name += f":{start + 1}-{start + len(seq)}"
+            print(pyfastaq.sequences.Fasta(seq_name, seq), file=f)
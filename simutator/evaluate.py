@@ -0,0 +1,340 @@
+import bisect
+import collections
+import gzip
+import json
+import logging
+
+from simutator import fasta_index
+
+VARIANT_TYPES = ["SNP", "INS", "DEL", "COMPLEX"]
+
+# Calls are streamed in sorted order. Truth variants are only scored once
+# the calls have moved this far past them, to allow for calls that get moved
+# to the left by normalization
+FINALIZE_MARGIN = 1000
+
+
+class ReferenceBases:
+    """Gets bases from a FASTA file, caching a chunk of sequence around the
+    last requested position, for left-aligning indels"""
+
+    def __init__(self, fasta_file, chunk_size=10000):
+        self.fasta_idx = fasta_index.FastaIndex(fasta_file)
+        self.chunk_size = chunk_size
+        self.chunk_name = None
+        self.chunk_start = None
+        self.chunk = ""
+
+    def close(self):
+        self.fasta_idx.close()
+
+    def __call__(self, name, position):
+        if (
+            name != self.chunk_name
+            or not self.chunk_start <= position < self.chunk_start + len(self.chunk)
+        ):
+            self.chunk_name = name
+            self.chunk_start = max(0, position - self.chunk_size + 1)
+            self.chunk = self.fasta_idx.fetch(name, self.chunk_start, position + 1)
+        return self.chunk[position - self.chunk_start].upper()
+
+
+def normalize(name, position, ref, alt, ref_bases=None):
+    """Returns normalized (position, ref, alt). Trims bases common to the
+    end and then the start of the alleles, keeping one anchor base for
+    indels. If ref_bases is given (see ReferenceBases), indels are also
+    left-aligned. Positions are zero-based"""
+    ref, alt = ref.upper(), alt.upper()
+    if ref_bases is not None:
+        changed = True
+        while changed:
+            changed = False
+            if len(ref) and len(alt) and ref[-1] == alt[-1]:
+                ref, alt = ref[:-1], alt[:-1]
+                changed = True
+            if (len(ref) == 0 or len(alt) == 0) and position > 0:
+                position -= 1
+                base = ref_bases(name, position)
+                ref, alt = base + ref, base + alt
+                changed = True
+    else:
+        while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+            ref, alt = ref[:-1], alt[:-1]
+
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        position += 1
+    return position, ref, alt
+
+
+def variant_type(ref, alt):
+    if len(ref) == len(alt) == 1:
+        return "SNP"
+    elif len(ref) <= 1 and len(alt) > len(ref) and alt.startswith(ref):
+        return "INS"
+    elif len(alt) <= 1 and len(ref) > len(alt) and ref.startswith(alt):
+        return "DEL"
+    else:
+        return "COMPLEX"
+
+
+def _open_vcf(filename):
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt")
+    else:
+        return open(filename)
+
+
+def _called_alts(fields, include_filtered=False):
+    """Returns list of the ALT alleles in the genotype of a VCF record (split
+    into fields), or all the ALTs if there is no genotype. Skips symbolic
+    alleles"""
+    if not include_filtered and fields[6] not in {"PASS", "."}:
+        return []
+    alts = fields[4].split(",")
+    if len(fields) > 9 and "GT" in fields[8].split(":"):
+        gt_index = fields[8].split(":").index("GT")
+        gt = fields[9].split(":")[gt_index].replace("|", "/").split("/")
+        indexes = sorted({int(x) for x in gt if x not in {".", "0"}})
+        alts = [alts[i - 1] for i in indexes]
+    return [
+        x
+        for x in alts
+        if x not in {".", "*"}
+        and not x.startswith("<")
+        and not set("[]").intersection(x)
+    ]
+
+
+class TruthVariant:
+    __slots__ = [
+        "window_start",
+        "window_end",
+        "ref",
+        "alt",
+        "vartype",
+        "matched",
+        "finalized",
+        "pending_calls",
+    ]
+
+    def __init__(self, position, ref, alt, vartype):
+        self.window_start = position
+        self.window_end = position + len(ref)
+        self.ref = ref.upper()
+        self.alt = alt.upper()
+        self.vartype = vartype
+        self.matched = False
+        self.finalized = False
+        self.pending_calls = []
+
+    def haplotype_matches(self):
+        """Returns True if applying the pending calls to the REF of this
+        variant makes its ALT"""
+        if len(self.pending_calls) == 0:
+            return False
+        haplotype = []
+        cursor = self.window_start
+        for position, ref, alt, vartype in sorted(self.pending_calls):
+            end = position + len(ref)
+            if position < cursor or end > self.window_end:
+                return False
+            start = position - self.window_start
+            if self.ref[start : start + len(ref)] != ref:
+                return False
+            haplotype.append(self.ref[cursor - self.window_start : start])
+            haplotype.append(alt)
+            cursor = end
+        haplotype.append(self.ref[cursor - self.window_start :])
+        return "".join(haplotype) == self.alt
+
+
+class TruthSet:
+    """Truth variants, indexed by sequence name and sorted by position"""
+
+    def __init__(self, vcf_file, ref_bases=None):
+        self.variants = {}
+        self.starts = {}
+        self.exact = {}
+
+        with _open_vcf(vcf_file) as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                position = int(fields[1]) - 1
+                for alt in _called_alts(fields, include_filtered=True):
+                    norm = normalize(
+                        fields[0], position, fields[3], alt, ref_bases=ref_bases
+                    )
+                    vartype = variant_type(norm[1], norm[2])
+                    variant = TruthVariant(position, fields[3], alt, vartype)
+                    self.variants.setdefault(fields[0], []).append(variant)
+                    self.exact.setdefault((fields[0], *norm), []).append(variant)
+
+        for name, variants in self.variants.items():
+            variants.sort(key=lambda x: x.window_start)
+            self.starts[name] = [x.window_start for x in variants]
+
+    def exact_match(self, name, position, ref, alt):
+        """Returns a truth variant that normalizes to the given variant and
+        is not yet matched or finalized, or None if there is not one. Several
+        truth variants can normalize to the same thing, eg deletions in the
+        same repeat, so each is only matched once"""
+        for variant in self.exact.get((name, position, ref, alt), []):
+            if not (variant.matched or variant.finalized):
+                return variant
+        return None
+
+    def overlapping(self, name, start, end):
+        """Returns the first truth variant whose window overlaps start to end
+        (zero-based, end not included). If start == end (ie an insertion
+        between two bases), then windows touching that point count as
+        overlapping. Returns None if there is no overlap"""
+        if name not in self.starts:
+            return None
+        variants = self.variants[name]
+        i = bisect.bisect_right(self.starts[name], max(start, end - 1)) - 1
+        found = None
+        while i >= 0:
+            variant = variants[i]
+            if start < end:
+                overlaps = start < variant.window_end and end > variant.window_start
+            else:
+                overlaps = variant.window_start <= start <= variant.window_end
+            if overlaps:
+                found = variant
+            elif variant.window_end < start:
+                break
+            i -= 1
+        return found
+
+
+def _empty_counts():
+    return {t: {"TP_truth": 0, "FN": 0, "TP_call": 0, "FP": 0} for t in VARIANT_TYPES}
+
+
+def _finalize(variant, counts):
+    if variant.matched:
+        for call in variant.pending_calls:
+            counts[call[3]]["FP"] += 1
+    elif variant.haplotype_matches():
+        variant.matched = True
+        counts[variant.vartype]["TP_truth"] += 1
+        for call in variant.pending_calls:
+            counts[call[3]]["TP_call"] += 1
+    else:
+        counts[variant.vartype]["FN"] += 1
+        for call in variant.pending_calls:
+            counts[call[3]]["FP"] += 1
+    variant.pending_calls = []
+    variant.finalized = True
+
+
+def _add_summary_stats(counts):
+    counts["ALL"] = {
+        k: sum(counts[t][k] for t in VARIANT_TYPES)
+        for k in ("TP_truth", "FN", "TP_call", "FP")
+    }
+    for stats in counts.values():
+        truth_total = stats["TP_truth"] + stats["FN"]
+        calls_total = stats["TP_call"] + stats["FP"]
+        stats["recall"] = stats["TP_truth"] / truth_total if truth_total else None
+        stats["precision"] = stats["TP_call"] / calls_total if calls_total else None
+
+
+def evaluate_vcf(truth_vcf, calls_vcf, ref_fasta=None, include_filtered=False):
+    """Compares the variants in calls_vcf with the truth set in truth_vcf.
+    The calls VCF must be sorted, and is streamed so that only calls near
+    the current position are kept in memory. A truth variant is a true
+    positive if it is called exactly (after normalization), or if applying
+    the calls that overlap it to its REF allele makes its ALT allele. Giving
+    ref_fasta, the genome both VCF files are with respect to, means that
+    indels are left-aligned. Returns a dictionary of counts and
+    precision/recall per variant type"""
+    ref_bases = None if ref_fasta is None else ReferenceBases(ref_fasta)
+    truth = TruthSet(truth_vcf, ref_bases=ref_bases)
+    counts = _empty_counts()
+    seen_names = set()
+    current_name = None
+    previous_position = -1
+    to_finalize = collections.deque()  # truth variants of current sequence
+
+    with _open_vcf(calls_vcf) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            name = fields[0]
+            raw_position = int(fields[1]) - 1
+
+            if name != current_name:
+                for variant in to_finalize:
+                    _finalize(variant, counts)
+                if name in seen_names:
+                    raise ValueError(
+                        f"Calls VCF file must be sorted. Sequence {name} found more than once: {calls_vcf}"
+                    )
+                seen_names.add(name)
+                current_name = name
+                to_finalize = collections.deque(truth.variants.get(name, []))
+                previous_position = -1
+            elif raw_position < previous_position:
+                raise ValueError(
+                    f"Calls VCF file must be sorted. Position {raw_position + 1} after {previous_position + 1} on {name}: {calls_vcf}"
+                )
+            previous_position = raw_position
+
+            while (
+                len(to_finalize)
+                and to_finalize[0].window_end + FINALIZE_MARGIN < raw_position
+            ):
+                _finalize(to_finalize.popleft(), counts)
+
+            for alt in _called_alts(fields, include_filtered=include_filtered):
+                if alt.upper() == fields[3].upper():
+                    continue
+                position, ref, alt = normalize(
+                    name, raw_position, fields[3], alt, ref_bases=ref_bases
+                )
+                vartype = variant_type(ref, alt)
+                exact = truth.exact_match(name, position, ref, alt)
+                if exact is not None:
+                    exact.matched = True
+                    counts[exact.vartype]["TP_truth"] += 1
+                    counts[vartype]["TP_call"] += 1
+                    continue
+
+                start = position + 1 if vartype == "INS" else position
+                variant = truth.overlapping(name, start, position + len(ref))
+                if variant is None or variant.finalized:
+                    counts[vartype]["FP"] += 1
+                else:
+                    variant.pending_calls.append((position, ref, alt, vartype))
+
+    for variant in to_finalize:
+        _finalize(variant, counts)
+
+    for name, variants in truth.variants.items():
+        if name not in seen_names:
+            for variant in variants:
+                _finalize(variant, counts)
+
+    if ref_bases is not None:
+        ref_bases.close()
+
+    _add_summary_stats(counts)
+    return counts
+
+
+def evaluate_vcf_to_json(
+    truth_vcf, calls_vcf, json_out, ref_fasta=None, include_filtered=False
+):
+    counts = evaluate_vcf(
+        truth_vcf, calls_vcf, ref_fasta=ref_fasta, include_filtered=include_filtered
+    )
+    with open(json_out, "w") as f:
+        json.dump(counts, f, indent=2, sort_keys=True)
+    for vartype in VARIANT_TYPES + ["ALL"]:
+        logging.info(f"{vartype}: {counts[vartype]}")
+    return counts
@@ -0,0 +1,149 @@
+import collections
+import os
+
+FaiRecord = collections.namedtuple(
+    "FaiRecord", ["name", "length", "offset", "line_bases", "line_width"]
+)
+
+
+def build_fai(fasta_file, fai_file):
+    """Writes a samtools-compatible .fai index of an uncompressed FASTA file"""
+    records = []
+    name = None
+
+    def finish_record():
+        if name is not None:
+            records.append(
+                FaiRecord(name, length, offset, line_bases or 0, line_width or 0)
+            )
+
+    with open(fasta_file, "rb") as f:
+        file_position = 0
+        for line in f:
+            if line.startswith(b">"):
+                finish_record()
+                name = line[1:].decode().split()[0]
+                length = 0
+                offset = file_position + len(line)
+                line_bases = line_width = None
+                last_line_short = False
+            elif name is not None and line.strip():
+                if last_line_short:
+                    raise ValueError(
+                        f"Inconsistent line lengths in FASTA file {fasta_file}, sequence {name}. Cannot index"
+                    )
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases is None:
+                    line_bases, line_width = bases, len(line)
+                elif bases > line_bases:
+                    raise ValueError(
+                        f"Inconsistent line lengths in FASTA file {fasta_file}, sequence {name}. Cannot index"
+                    )
+                last_line_short = bases < line_bases
+                length += bases
+            file_position += len(line)
+
+    finish_record()
+
+    with open(fai_file, "w") as f:
+        for record in records:
+            print(*record, sep="\t", file=f)
+
+
+def load_fai(fai_file):
+    records = collections.OrderedDict()
+    with open(fai_file) as f:
+        for line in f:
+            fields = line.rstrip().split("\t")
+            records[fields[0]] = FaiRecord(fields[0], *[int(x) for x in fields[1:5]])
+    return records
+
+
+def sequence_lengths(fasta_file, fai_file=None):
+    """Returns list of the lengths of the sequences in fasta_file, from its
+    .fai index. Returns None if there is no index, or if it is older than
+    fasta_file, so that the lengths can be found without reading the whole
+    FASTA file"""
+    if fai_file is None:
+        fai_file = fasta_file + ".fai"
+    if not os.path.exists(fai_file) or os.path.getmtime(fai_file) < os.path.getmtime(
+        fasta_file
+    ):
+        return None
+    return [x.length for x in load_fai(fai_file).values()]
+
+
+class FastaIndex:
+    """Random access to sequences in an uncompressed FASTA file, using a
+    samtools-style .fai index. The index is made if it does not already
+    exist, or if it is older than the FASTA file"""
+
+    def __init__(self, fasta_file, fai_file=None):
+        self.fasta_file = fasta_file
+        self.fai_file = fasta_file + ".fai" if fai_file is None else fai_file
+        if not os.path.exists(self.fai_file) or os.path.getmtime(
+            self.fai_file
+        ) < os.path.getmtime(self.fasta_file):
+            build_fai(self.fasta_file, self.fai_file)
+        self.records = load_fai(self.fai_file)
+        self.filehandle = open(self.fasta_file, "rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.filehandle.close()
+
+    def __contains__(self, name):
+        return name in self.records
+
+    def names(self):
+        return list(self.records)
+
+    def length(self, name):
+        return self.records[name].length
+
+    def _file_offset(self, record, position):
+        return (
+            record.offset
+            + (position // record.line_bases) * record.line_width
+            + position % record.line_bases
+        )
+
+    def fetch(self, name, start=0, end=None):
+        """Returns the sequence from start to end (zero-based, end not
+        included) of the named sequence"""
+        record = self.records[name]
+        if end is None or end > record.length:
+            end = record.length
+        start = max(0, start)
+        if start >= end:
+            return ""
+        file_start = self._file_offset(record, start)
+        file_end = self._file_offset(record, end - 1) + 1
+        self.filehandle.seek(file_start)
+        data = self.filehandle.read(file_end - file_start)
+        return data.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    def copy_sequence(self, name, filehandle, chunk_size=1048576):
+        """Writes the named sequence to filehandle (which must be opened in
+        binary mode), copying the bytes of the sequence lines straight from
+        the FASTA file, so the line lengths are the same as in the FASTA file"""
+        record = self.records[name]
+        if record.length == 0:
+            return
+        file_end = self._file_offset(record, record.length - 1) + 1
+        self.filehandle.seek(record.offset)
+        to_copy = file_end - record.offset
+        while to_copy > 0:
+            data = self.filehandle.read(min(chunk_size, to_copy))
+            if len(data) == 0:
+                raise ValueError(
+                    f"Unexpected end of FASTA file {self.fasta_file}. Is the index {self.fai_file} out of date?"
+                )
+            filehandle.write(data)
+            to_copy -= len(data)
+        filehandle.write(b"\n")
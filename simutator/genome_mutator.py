@@ -1,9 +1,24 @@
 import abc
 import collections
+import contextlib
+import itertools
+import logging
+import os
 from random import Random
 
 import pyfastaq
 
+from simutator import (
+    delta,
+    fasta_index,
+    journal,
+    liftover,
+    mutation_table,
+    packed_sequence,
+    substitution_model,
+    utils,
+)
+
 global random  # to keep seeding consistent
 random = Random()
 
@@ -12,10 +27,241 @@ Mutation = collections.namedtuple(
 )
 acgt = {"A", "C", "G", "T"}
 
+# One mutated sequence, as made by GenomeMutator.mutated_sequences().
+# mutated_seq is a pyfastaq Fasta object, and original_length is the length
+# of the sequence before it was mutated
+MutatedContig = collections.namedtuple(
+    "MutatedContig", ["contig_id", "mutated_seq", "mutations", "original_length"]
+)
+
+
+def _resume_file_ok(filename, resume_bytes):
+    """Returns True if filename can be continued from a checkpoint made
+    when it had resume_bytes bytes, ie it exists and is not shorter"""
+    return os.path.exists(filename) and os.path.getsize(filename) >= resume_bytes
+
+
+class FastaWriter:
+    """Writer for GenomeMutator.mutated_sequences(), which writes each
+    mutated sequence to a FASTA file, or stdout if filename is "-". If
+    background is True, writing is done in a background thread. If
+    resume_bytes is not None, the file is cut to that many bytes and then
+    added to, instead of being started again"""
+
+    def __init__(self, filename, background=False, resume_bytes=None):
+        self.filename = filename
+        self.background = background
+        self.resume_bytes = resume_bytes
+        self.filehandle = None
+        self.file = None
+        self.stack = None
+        self.bytes_written = 0 if resume_bytes is None else resume_bytes
+
+    def __enter__(self):
+        self.stack = contextlib.ExitStack()
+        if self.resume_bytes is None:
+            self.file = self.stack.enter_context(utils.open_output(self.filename))
+        else:
+            if not _resume_file_ok(self.filename, self.resume_bytes):
+                raise ValueError(
+                    f"Cannot resume writing {self.filename}: it must exist and have at least {self.resume_bytes} bytes. Cannot continue"
+                )
+            os.truncate(self.filename, self.resume_bytes)
+            self.file = self.stack.enter_context(open(self.filename, "a"))
+        self.filehandle = self.file
+        if self.background:
+            self.filehandle = self.stack.enter_context(
+                utils.BackgroundWriter(self.filehandle)
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stack.close()
+
+    def write(self, contig):
+        data = str(contig.mutated_seq) + "\n"
+        self.filehandle.write(data)
+        self.bytes_written += len(data)
+
+    def size(self):
+        """Returns the number of bytes written to the file so far, after
+        making sure that they are on disk, so that a checkpoint never
+        points past the end of the file if the machine crashes"""
+        self.filehandle.flush()
+        os.fsync(self.file.fileno())
+        return os.path.getsize(self.filename)
+
+
+class CheckpointWriter:
+    """Writer for GenomeMutator.mutated_sequences(), which adds checkpoints
+    to a journal.Journal, so that mutating a genome can be continued from
+    the last checkpoint if it is stopped. A checkpoint is added at the end
+    of a sequence, when at least checkpoint_bases bases have been mutated
+    since the previous checkpoint. It has the mutations of the sequences
+    since the previous checkpoint, the size of the FASTA file written by
+    fasta_writer (which must be called before this writer), and the state of
+    the random number generator. See GenomeMutator.mutate_fasta_file"""
+
+    def __init__(self, journal, fasta_writer=None, checkpoint_bases=10000000):
+        self.journal = journal
+        self.fasta_writer = fasta_writer
+        self.checkpoint_bases = checkpoint_bases
+        self.sequences = []
+        self.bases = 0
+
+    def write(self, contig):
+        self.sequences.append(
+            (
+                contig.contig_id,
+                contig.mutated_seq.id,
+                contig.original_length,
+                len(contig.mutated_seq),
+                contig.mutations,
+            )
+        )
+        self.bases += contig.original_length
+        if self.bases >= self.checkpoint_bases:
+            self.checkpoint()
+
+    def checkpoint(self):
+        global random
+        self.journal.add(
+            {
+                "sequences": self.sequences,
+                "fasta_bytes": (
+                    None if self.fasta_writer is None else self.fasta_writer.size()
+                ),
+                "random_state": random.getstate(),
+            }
+        )
+        self.sequences = []
+        self.bases = 0
+
+    @classmethod
+    def load(cls, journal):
+        """Returns tuple (sequences, FASTA file size, random state) of the
+        last checkpoint in journal, where sequences is a list of all the
+        sequences in all the checkpoints. Returns None if there are no
+        checkpoints"""
+        if len(journal.entries) == 0:
+            return None
+        sequences = []
+        for entry in journal.entries:
+            for name, mutated_name, length, mutated_length, mutations in entry[
+                "sequences"
+            ]:
+                sequences.append(
+                    (
+                        name,
+                        mutated_name,
+                        length,
+                        mutated_length,
+                        [Mutation(*x) for x in mutations],
+                    )
+                )
+        version, state, gauss_next = journal.entries[-1]["random_state"]
+        return (
+            sequences,
+            journal.entries[-1]["fasta_bytes"],
+            (version, tuple(state), gauss_next),
+        )
+
+
+class ProgressWriter:
+    """Writer for GenomeMutator.mutated_sequences(), which updates a
+    progress.ProgressReporter after each sequence, with the number of bases
+    and mutations, and the bytes written by fasta_writer (which must be
+    called before this writer)"""
+
+    def __init__(self, reporter, fasta_writer=None):
+        self.reporter = reporter
+        self.fasta_writer = fasta_writer
+        self.bytes_written = (
+            None if fasta_writer is None else fasta_writer.bytes_written
+        )
+
+    def write(self, contig):
+        bytes_written = 0
+        if self.fasta_writer is not None:
+            bytes_written = self.fasta_writer.bytes_written - self.bytes_written
+            self.bytes_written = self.fasta_writer.bytes_written
+        self.reporter.update(
+            bases=contig.original_length,
+            variants=len(contig.mutations),
+            bytes_written=bytes_written,
+            contig=contig.contig_id,
+        )
+
+
+class MutationFilesWriter:
+    """Writer for GenomeMutator.mutated_sequences(), which writes the
+    VCF, delta, liftover and table files (any of which can be None) of the
+    mutations made by mutator. The mutations of every sequence are needed,
+    so the files are written when the writer is closed. They are not written
+    if there was an error"""
+
+    def __init__(
+        self,
+        mutator,
+        vcf_out_wrt_original_seq,
+        vcf_out_wrt_mutated_seq,
+        delta_out=None,
+        liftover_out=None,
+        table_out=None,
+        table_format="tsv",
+    ):
+        self.mutator = mutator
+        self.vcf_out_wrt_original_seq = vcf_out_wrt_original_seq
+        self.vcf_out_wrt_mutated_seq = vcf_out_wrt_mutated_seq
+        self.delta_out = delta_out
+        self.liftover_out = liftover_out
+        self.table_out = table_out
+        self.table_format = table_format
+        # Each element of this list is a tuple:
+        # (name, mutated name, length, mutated length, list of mutations)
+        self.sequences = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def write(self, contig):
+        self.sequences.append(
+            (
+                contig.contig_id,
+                contig.mutated_seq.id,
+                contig.original_length,
+                len(contig.mutated_seq),
+                contig.mutations,
+            )
+        )
+
+    def close(self):
+        self.mutator._write_mutation_files(
+            self.sequences,
+            self.vcf_out_wrt_original_seq,
+            self.vcf_out_wrt_mutated_seq,
+            delta_out=self.delta_out,
+            liftover_out=self.liftover_out,
+            table_out=self.table_out,
+            table_format=self.table_format,
+        )
+
 
 class GenomeMutator(metaclass=abc.ABCMeta):
-    def __init__(self, distance_between_mutations, seed=None):
+    # Name of the type of mutation, as used by batch_genome_mutator
+    mutation_type = None
+
+    def __init__(self, distance_between_mutations, seed=None, substitution=None):
         self.distance_between_mutations = distance_between_mutations
+        # Model used to choose the new base of SNPs
+        if substitution is None:
+            self.substitution = substitution_model.SubstitutionModel()
+        else:
+            self.substitution = substitution
         if seed is not None:
             global random
             random = Random(seed)
@@ -58,99 +304,461 @@ class GenomeMutator(metaclass=abc.ABCMeta):
         )
 
     @abc.abstractmethod
-    def mutate_sequence(self, sequence):
+    def mutate_sequence(self, sequence, mask=None):
         pass
 
+    def _write_vcf_files(
+        self, sequences, vcf_out_wrt_original_seq, vcf_out_wrt_mutated_seq
+    ):
+        original_seq_lengths = {x[0]: x[2] for x in sequences}
+        mutated_seq_lengths = {x[1]: x[3] for x in sequences}
+
+        with contextlib.ExitStack() as stack:
+            if vcf_out_wrt_original_seq is not None:
+                f_vcf_original = stack.enter_context(
+                    utils.open_output(vcf_out_wrt_original_seq)
+                )
+                self._write_vcf_header(
+                    f_vcf_original, original_seq_lengths, mutated_genome=False
+                )
+            if vcf_out_wrt_mutated_seq is not None:
+                f_vcf_mutated = stack.enter_context(
+                    utils.open_output(vcf_out_wrt_mutated_seq)
+                )
+                self._write_vcf_header(
+                    f_vcf_mutated, mutated_seq_lengths, mutated_genome=True
+                )
+
+            # Sort by original name only, so that regions of the same sequence
+            # stay in the order they were added
+            for seq_id, mutated_seq_id, _, _, mutations in sorted(
+                sequences, key=lambda x: x[0]
+            ):
+                for mutation in mutations:
+                    if vcf_out_wrt_mutated_seq is not None:
+                        print(
+                            mutated_seq_id,
+                            mutation.new_position + 1,
+                            ".",
+                            mutation.new_seq,
+                            mutation.original_seq,
+                            ".",
+                            "PASS",
+                            ".",
+                            "GT",
+                            "1/1",
+                            sep="\t",
+                            file=f_vcf_mutated,
+                        )
+                    if vcf_out_wrt_original_seq is not None:
+                        print(
+                            seq_id,
+                            mutation.original_position + 1,
+                            ".",
+                            mutation.original_seq,
+                            mutation.new_seq,
+                            ".",
+                            "PASS",
+                            ".",
+                            "GT",
+                            "1/1",
+                            sep="\t",
+                            file=f_vcf_original,
+                        )
+
     def mutate_fasta_file(
-        self, fasta_in, fasta_out, vcf_out_wrt_original_seq, vcf_out_wrt_mutated_seq
+        self,
+        fasta_in,
+        fasta_out,
+        vcf_out_wrt_original_seq,
+        vcf_out_wrt_mutated_seq,
+        delta_out=None,
+        liftover_out=None,
+        table_out=None,
+        table_format="tsv",
+        pipelined=False,
+        reference_cache=None,
+        mask=None,
+        checkpoint=None,
+        checkpoint_bases=10000000,
+        progress=None,
     ):
-        file_reader = pyfastaq.sequences.file_reader(fasta_in)
-        original_seq_lengths = {}
-        mutated_seq_lengths = {}
-        all_mutations = {}
-
-        with open(fasta_out, "w") as f_fasta:
-            for sequence in file_reader:
-                mutations, mutated_seq = self.mutate_sequence(sequence)
-                mutated_seq = pyfastaq.sequences.Fasta(
-                    sequence.id + "__simutator__" + self._mutation_description_string(),
-                    mutated_seq,
+        """Mutates every sequence in fasta_in. Writes the mutated genome to
+        fasta_out, and VCF files of the mutations. Any of these can be None,
+        in which case that file is not written. If delta_out is not None,
+        then a delta file is written, from which the mutated genome can be
+        made later (see the delta module). If liftover_out is not None, then
+        a file is written for mapping coordinates between the original and
+        mutated genomes (see the liftover module). If table_out is not None,
+        then a table of the mutations is written, in the format table_format
+        (see the mutation_table module). If pipelined is True, then reading
+        the next sequence and writing the mutated FASTA are done in
+        background threads, at the same time as mutating the current
+        sequence. Output is the same whether or not pipelined is used.
+        If reference_cache is not None, then the sequences are loaded from
+        that cache file in 2-bit format, which is made first if it does not
+        exist or is out of date (see the packed_sequence module). Use
+        reference_cache=True for the default cache filename. If mask is not
+        None, it should be an interval_index.Mask, and mutations are only
+        put where the mask allows them. If checkpoint is not None, it is the
+        name of a journal file, where checkpoints are added after every
+        checkpoint_bases bases (see CheckpointWriter). If that file already
+        has checkpoints, then mutating is continued from the last one,
+        adding to the FASTA file that was being written, and the output is
+        the same as if it had not been stopped. If the FASTA file is missing
+        or shorter than at the last checkpoint, it is started again. If progress is not None, it
+        is a progress.ProgressReporter, which is updated after each
+        sequence. To get the mutated sequences without writing any files,
+        use mutated_sequences() instead"""
+        global random
+        if checkpoint is not None and fasta_out == "-":
+            raise ValueError("Cannot use checkpoints when writing to stdout")
+        if reference_cache is None:
+            file_reader = pyfastaq.sequences.file_reader(fasta_in)
+        else:
+            file_reader = packed_sequence.file_reader(
+                fasta_in, None if reference_cache is True else reference_cache
+            )
+        if pipelined:
+            # file_reader reuses the same Fasta object for each sequence, so
+            # need to make a new one for each sequence in the queue
+            file_reader = utils.prefetch_iterator(
+                pyfastaq.sequences.Fasta(x.id, x.seq) for x in file_reader
+            )
+
+        done_sequences = []
+        resume_bytes = None
+        if checkpoint is not None:
+            checkpoint_journal = journal.Journal(checkpoint, resume=True)
+            resume_from = CheckpointWriter.load(checkpoint_journal)
+            if (
+                resume_from is not None
+                and fasta_out is not None
+                and not _resume_file_ok(fasta_out, resume_from[1])
+            ):
+                # Eg the machine crashed before the FASTA file was written
+                # to disk. Start this genome again instead of padding the
+                # file, so that the output is still correct
+                logging.warning(
+                    f"FASTA file {fasta_out} is missing or shorter than at the last checkpoint. Starting again instead of resuming"
+                )
+                checkpoint_journal = journal.Journal(checkpoint)
+                resume_from = None
+            if resume_from is not None:
+                done_sequences, resume_bytes, random_state = resume_from
+                random.setstate(random_state)
+                file_reader = itertools.islice(file_reader, len(done_sequences), None)
+
+        with contextlib.ExitStack() as stack:
+            writers = []
+            fasta_writer = None
+            if fasta_out is not None:
+                fasta_writer = stack.enter_context(
+                    FastaWriter(
+                        fasta_out, background=pipelined, resume_bytes=resume_bytes
+                    )
+                )
+                writers.append(fasta_writer)
+            files_writer = stack.enter_context(
+                MutationFilesWriter(
+                    self,
+                    vcf_out_wrt_original_seq,
+                    vcf_out_wrt_mutated_seq,
+                    delta_out=delta_out,
+                    liftover_out=liftover_out,
+                    table_out=table_out,
+                    table_format=table_format,
+                )
+            )
+            files_writer.sequences.extend(done_sequences)
+            writers.append(files_writer)
+            if checkpoint is not None:
+                writers.append(
+                    CheckpointWriter(
+                        checkpoint_journal,
+                        fasta_writer=fasta_writer,
+                        checkpoint_bases=checkpoint_bases,
+                    )
                 )
-                print(mutated_seq, file=f_fasta)
-                original_seq_lengths[sequence.id] = len(sequence)
-                mutated_seq_lengths[mutated_seq.id] = len(mutated_seq)
-                all_mutations[(sequence.id, mutated_seq.id)] = mutations
-
-        with open(vcf_out_wrt_original_seq, "w") as f_vcf_original, open(
-            vcf_out_wrt_mutated_seq, "w"
-        ) as f_vcf_mutated:
-            self._write_vcf_header(
-                f_vcf_original, original_seq_lengths, mutated_genome=False
+            if progress is not None:
+                if len(done_sequences):
+                    progress.resume(
+                        bases=sum(x[2] for x in done_sequences),
+                        variants=sum(len(x[4]) for x in done_sequences),
+                        bytes_written=resume_bytes or 0,
+                        contigs=len(done_sequences),
+                    )
+                writers.append(ProgressWriter(progress, fasta_writer=fasta_writer))
+            for _ in self.mutated_sequences(file_reader, mask=mask, writers=writers):
+                pass
+
+    def mutated_sequences(self, sequences, mask=None, writers=None):
+        """Generator that mutates sequences one at a time, without writing
+        any files. sequences can be a FASTA/FASTQ filename, or an iterable
+        of pyfastaq Fasta objects or (name, sequence) tuples. Each sequence
+        is only read when the next mutated sequence is asked for. Yields a
+        MutatedContig for each sequence. The mutated sequence is a pyfastaq
+        Fasta object named like the sequences in the FASTA file written by
+        mutate_fasta_file. writers is a list of objects that each have a
+        method write(mutated_contig), which is called for each sequence
+        before it is yielded (see FastaWriter and MutationFilesWriter).
+        mask is the same as for mutate_fasta_file"""
+        if isinstance(sequences, (str, os.PathLike)):
+            sequences = pyfastaq.sequences.file_reader(os.fspath(sequences))
+        writers = [] if writers is None else writers
+        description = self._mutation_description_string()
+
+        for sequence in sequences:
+            if isinstance(sequence, tuple):
+                sequence = pyfastaq.sequences.Fasta(*sequence)
+            contig_mask = None if mask is None else mask.get_contig(sequence.id)
+            mutations, mutated_seq = self.mutate_sequence(sequence, mask=contig_mask)
+            contig = MutatedContig(
+                sequence.id,
+                pyfastaq.sequences.Fasta(
+                    sequence.id + "__simutator__" + description, mutated_seq
+                ),
+                mutations,
+                len(sequence),
             )
-            self._write_vcf_header(
-                f_vcf_mutated, mutated_seq_lengths, mutated_genome=True
+            for writer in writers:
+                writer.write(contig)
+            yield contig
+
+    def _write_mutation_files(
+        self,
+        sequences,
+        vcf_out_wrt_original_seq,
+        vcf_out_wrt_mutated_seq,
+        delta_out=None,
+        liftover_out=None,
+        table_out=None,
+        table_format="tsv",
+    ):
+        self._write_vcf_files(
+            sequences, vcf_out_wrt_original_seq, vcf_out_wrt_mutated_seq
+        )
+
+        if delta_out is not None:
+            delta.write_delta_file(
+                delta_out, sequences, self._mutation_description_string()
             )
 
-            for seq_id, mutated_seq_id in sorted(all_mutations):
-                for mutation in all_mutations[(seq_id, mutated_seq_id)]:
-                    print(
-                        mutated_seq_id,
-                        mutation.new_position + 1,
-                        ".",
-                        mutation.new_seq,
-                        mutation.original_seq,
-                        ".",
-                        "PASS",
-                        ".",
-                        "GT",
-                        "1/1",
-                        sep="\t",
-                        file=f_vcf_mutated,
+        if liftover_out is not None:
+            lift = liftover.Liftover()
+            for sequence_info in sequences:
+                lift.add_sequence(*sequence_info)
+            lift.write(liftover_out)
+
+        if table_out is not None:
+            mutation_table.write_mutation_table(
+                table_out,
+                sequences,
+                self.mutation_type,
+                self._mutation_description_string(),
+                file_format=table_format,
+            )
+
+    def _mutate_region(self, name, seq, start, mask=None):
+        contig_mask = None if mask is None else mask.get_contig(name, offset=start)
+        return self.mutate_sequence(
+            pyfastaq.sequences.Fasta(name, seq), mask=contig_mask
+        )
+
+    def mutate_fasta_regions(
+        self,
+        fasta_in,
+        regions,
+        fasta_out,
+        vcf_out_wrt_original_seq,
+        vcf_out_wrt_mutated_seq,
+        full_genome=False,
+        delta_out=None,
+        liftover_out=None,
+        table_out=None,
+        table_format="tsv",
+        mask=None,
+    ):
+        """Same as mutate_fasta_file, but only adds mutations inside the
+        given regions. fasta_in must be uncompressed, because it is read
+        using a .fai index (which is made if needed), so that only the
+        regions are read instead of the whole genome. Sequence names are
+        the first word of each header line. regions is a list of strings of
+        the form name or name:start-end (1-based inclusive). If full_genome
+        is False, then only the mutated regions are written, each one as a
+        sequence called name:start-end plus the usual suffix. The VCF file
+        with respect to the original genome uses coordinates of the whole
+        original sequence. delta_out and liftover_out can only be used
+        when full_genome is True. If full_genome is True, then the whole
+        mutated genome is written. Sequences without any regions are
+        copied straight from fasta_in to fasta_out, without parsing them"""
+        if not full_genome and (delta_out is not None or liftover_out is not None):
+            raise ValueError(
+                "Delta and liftover files can only be written for regions when the full genome is output. Cannot continue"
+            )
+
+        description = self._mutation_description_string()
+        # Each element of this list is a tuple:
+        # (name, mutated name, length, mutated length, list of mutations)
+        sequences = []
+
+        with contextlib.ExitStack() as stack:
+            fasta_idx = stack.enter_context(fasta_index.FastaIndex(fasta_in))
+            regions_by_name = {}
+            for region in regions:
+                name, start, end = delta.parse_region_string(region)
+                if name not in fasta_idx:
+                    raise ValueError(
+                        f"Sequence '{name}' from region '{region}' not found in {fasta_in}. Cannot continue"
                     )
-                    print(
-                        seq_id,
-                        mutation.original_position + 1,
-                        ".",
-                        mutation.original_seq,
-                        mutation.new_seq,
-                        ".",
-                        "PASS",
-                        ".",
-                        "GT",
-                        "1/1",
-                        sep="\t",
-                        file=f_vcf_original,
+                length = fasta_idx.length(name)
+                if start is None:
+                    start, end = 0, length
+                elif end > length:
+                    raise ValueError(
+                        f"Region '{region}' goes past the end of the sequence, which has length {length}. Cannot continue"
                     )
+                regions_by_name.setdefault(name, []).append((start, end))
+
+            for name, name_regions in regions_by_name.items():
+                name_regions.sort()
+                for (_, end1), (start2, _) in zip(name_regions, name_regions[1:]):
+                    if start2 < end1:
+                        raise ValueError(
+                            f"Overlapping regions given for sequence '{name}'. Cannot continue"
+                        )
+
+            if fasta_out is not None:
+                f_fasta = stack.enter_context(open(fasta_out, "wb"))
+
+            for name in fasta_idx.names():
+                length = fasta_idx.length(name)
+                mutated_name = name + "__simutator__" + description
+
+                if name not in regions_by_name:
+                    if full_genome:
+                        if fasta_out is not None:
+                            f_fasta.write(f">{mutated_name}\n".encode())
+                            fasta_idx.copy_sequence(name, f_fasta)
+                        sequences.append((name, mutated_name, length, length, []))
+                    continue
+
+                if not full_genome:
+                    for start, end in regions_by_name[name]:
+                        mutations, mutated_seq = self._mutate_region(
+                            name, fasta_idx.fetch(name, start, end), start, mask=mask
+                        )
+                        mutated_seq = pyfastaq.sequences.Fasta(
+                            f"{name}:{start + 1}-{end}__simutator__{description}",
+                            mutated_seq,
+                        )
+                        if fasta_out is not None:
+                            f_fasta.write(f"{mutated_seq}\n".encode())
+                        # Original positions are in the whole sequence, but
+                        # new positions are in the mutated region
+                        mutations = [
+                            x._replace(original_position=x.original_position + start)
+                            for x in mutations
+                        ]
+                        sequences.append(
+                            (name, mutated_seq.id, length, len(mutated_seq), mutations)
+                        )
+                    continue
+
+                pieces = []
+                all_mutations = []
+                previous_end = 0
+                length_change = 0
+                for start, end in regions_by_name[name]:
+                    pieces.append(fasta_idx.fetch(name, previous_end, start))
+                    mutations, mutated_seq = self._mutate_region(
+                        name, fasta_idx.fetch(name, start, end), start, mask=mask
+                    )
+                    pieces.append(mutated_seq)
+                    all_mutations.extend(
+                        Mutation(
+                            x.original_position + start,
+                            x.new_position + start + length_change,
+                            x.original_seq,
+                            x.new_seq,
+                        )
+                        for x in mutations
+                    )
+                    length_change += len(mutated_seq) - (end - start)
+                    previous_end = end
+                pieces.append(fasta_idx.fetch(name, previous_end))
+                mutated_seq = pyfastaq.sequences.Fasta(mutated_name, "".join(pieces))
+                if fasta_out is not None:
+                    f_fasta.write(f"{mutated_seq}\n".encode())
+                sequences.append(
+                    (name, mutated_name, length, len(mutated_seq), all_mutations)
+                )
+
+        self._write_mutation_files(
+            sequences,
+            vcf_out_wrt_original_seq,
+            vcf_out_wrt_mutated_seq,
+            delta_out=delta_out,
+            liftover_out=liftover_out,
+            table_out=table_out,
+            table_format=table_format,
+        )
 
     def _get_snp_variant(self, ref_nucleotide):
         global random
-        return random.choice(sorted(list(acgt.difference({ref_nucleotide}))))
+        return self.substitution.mutate_base(ref_nucleotide, random)
+
+    def _get_snp_variants(self, ref_nucleotides):
+        global random
+        return self.substitution.mutate_bases(ref_nucleotides, random)
 
 
 class SnpMutator(GenomeMutator):
-    def __init__(self, distance_between_snps, seed=None):
-        super().__init__(distance_between_snps, seed=seed)
+    mutation_type = "snp"
+
+    def __init__(self, distance_between_snps, seed=None, substitution=None):
+        super().__init__(distance_between_snps, seed=seed, substitution=substitution)
 
     def _mutation_description_string(self):
         return f"SNP_every_{self.distance_between_mutations}"
 
-    def mutate_sequence(self, sequence):
-        mutations = []
-        new_sequence = list(sequence)
+    def mutate_sequence(self, sequence, mask=None):
+        # Find all the sites first, so that the new bases can be chosen
+        # all at once. Sites that are not A, C, G or T (eg N) are skipped
+        positions = []
+        old_nucleotides = []
         for i in range(
             self.distance_between_mutations - 1,
             len(sequence) - self.distance_between_mutations,
             self.distance_between_mutations,
         ):
-            old_nucleotide = new_sequence[i].upper()
-            new_sequence[i] = self._get_snp_variant(old_nucleotide)
-            mutations.append(Mutation(i, i, old_nucleotide, new_sequence[i]))
+            if mask is not None and not mask.allowed(i, i + 1):
+                continue
+            old_nucleotide = sequence.seq[i].upper()
+            if old_nucleotide in acgt:
+                positions.append(i)
+                old_nucleotides.append(old_nucleotide)
+
+        mutations = []
+        new_sequence = []
+        previous_end = 0
+        new_nucleotides = self._get_snp_variants(old_nucleotides)
+        for i, old_nucleotide, new_nucleotide in zip(
+            positions, old_nucleotides, new_nucleotides
+        ):
+            new_sequence.append(sequence.seq[previous_end:i])
+            new_sequence.append(new_nucleotide)
+            previous_end = i + 1
+            mutations.append(Mutation(i, i, old_nucleotide, new_nucleotide))
 
+        new_sequence.append(sequence.seq[previous_end:])
         mutated_seq = "".join(new_sequence)
         return mutations, mutated_seq
 
 
 class DeletionMutator(GenomeMutator):
+    mutation_type = "deletion"
+
     def __init__(self, distance_between_deletions, deletion_length, seed=None):
         super().__init__(distance_between_deletions, seed=seed)
         self.deletion_length = deletion_length
@@ -160,7 +768,7 @@ class DeletionMutator(GenomeMutator):
             f"DEL_length_{self.deletion_length}_every_{self.distance_between_mutations}"
         )
 
-    def mutate_sequence(self, sequence):
+    def mutate_sequence(self, sequence, mask=None):
         mutations = []
         current_position = self.distance_between_mutations - 1
         deleted_nucleotides = 0
@@ -171,6 +779,13 @@ class DeletionMutator(GenomeMutator):
             next_start_position = (
                 deletion_end_position + self.distance_between_mutations
             )
+            if mask is not None and not mask.allowed(
+                current_position - 1, deletion_end_position + 1
+            ):
+                new_sequence.append(sequence.seq[current_position:next_start_position])
+                current_position = next_start_position
+                continue
+
             new_sequence.append(
                 sequence.seq[deletion_end_position + 1 : next_start_position]
             )
@@ -191,6 +806,8 @@ class DeletionMutator(GenomeMutator):
 
 
 class InsertionMutator(GenomeMutator):
+    mutation_type = "insertion"
+
     def __init__(self, distance_between_insertions, insertion_length, seed=None):
         super().__init__(distance_between_insertions, seed=seed)
         self.insertion_length = insertion_length
@@ -198,13 +815,25 @@ class InsertionMutator(GenomeMutator):
     def _mutation_description_string(self):
         return f"INS_length_{self.insertion_length}_every_{self.distance_between_mutations}"
 
-    def mutate_sequence(self, sequence):
+    def mutate_sequence(self, sequence, mask=None):
         mutations = []
         current_position = self.distance_between_mutations
         inserted_nucleotides = 0
         new_sequence = [sequence.seq[:current_position]]
 
         while current_position < len(sequence) - self.distance_between_mutations:
+            if mask is not None and not mask.allowed(
+                current_position - 1, current_position
+            ):
+                new_sequence.append(
+                    sequence.seq[
+                        current_position : current_position
+                        + self.distance_between_mutations
+                    ]
+                )
+                current_position += self.distance_between_mutations
+                continue
+
             insertion_seq = "".join(
                 [
                     random.choice(["A", "C", "G", "T"])
@@ -235,6 +864,8 @@ class InsertionMutator(GenomeMutator):
 
 
 class ComplexMutator(GenomeMutator):
+    mutation_type = "complex"
+
     def __init__(
         self,
         distance_between_clusters,
@@ -244,8 +875,11 @@ class ComplexMutator(GenomeMutator):
         ins_per_cluster,
         max_indel_length,
         seed=None,
+        substitution=None,
     ):
-        super().__init__(distance_between_clusters, seed=seed)
+        super().__init__(
+            distance_between_clusters, seed=seed, substitution=substitution
+        )
         self.cluster_length = cluster_length
         self.snps_per_cluster = snps_per_cluster
         self.dels_per_cluster = dels_per_cluster
@@ -290,10 +924,14 @@ class ComplexMutator(GenomeMutator):
         )
         nucleotides_list = list(sequence)
 
-        for snp_position in snp_positions:
-            nucleotides_list[snp_position] = self._get_snp_variant(
-                nucleotides_list[snp_position]
-            )
+        snp_positions = [
+            x for x in snp_positions if nucleotides_list[x].upper() in acgt
+        ]
+        new_nucleotides = self._get_snp_variants(
+            [nucleotides_list[x].upper() for x in snp_positions]
+        )
+        for snp_position, new_nucleotide in zip(snp_positions, new_nucleotides):
+            nucleotides_list[snp_position] = new_nucleotide
 
         position_offset = 0
 
@@ -315,7 +953,7 @@ class ComplexMutator(GenomeMutator):
 
         return "".join(nucleotides_list)
 
-    def mutate_sequence(self, sequence):
+    def mutate_sequence(self, sequence, mask=None):
         new_sequence = [sequence.seq[: self.distance_between_mutations - 1]]
         mutations = []
         cluster_start = None
@@ -326,6 +964,16 @@ class ComplexMutator(GenomeMutator):
             len(sequence) - self.distance_between_mutations,
             self.distance_between_mutations,
         ):
+            if mask is not None and not mask.allowed(
+                cluster_start, cluster_start + self.cluster_length
+            ):
+                new_sequence.append(
+                    sequence.seq[
+                        cluster_start : cluster_start + self.distance_between_mutations
+                    ]
+                )
+                continue
+
             deletion_lengths = [
                 random.randint(1, self.max_indel_length)
                 for _ in range(self.dels_per_cluster)
@@ -364,3 +1012,129 @@ class ComplexMutator(GenomeMutator):
 
         mutated_seq = "".join(new_sequence)
         return mutations, mutated_seq
+
+
+class RandomMutator(GenomeMutator):
+    """Adds SNPs, insertions and deletions at random positions, instead of
+    at regular intervals. Rates are the expected number of each type of
+    variant per base. The gaps between variants are drawn from an
+    exponential distribution, so that the positions are a Poisson process,
+    and random numbers are drawn in batches. This means the time taken
+    depends on the number of variants, not on the length of the genome.
+    Variants do not overlap each other"""
+
+    mutation_type = "random"
+    batch_size = 10000
+
+    def __init__(
+        self,
+        snp_rate,
+        insertion_rate,
+        deletion_rate,
+        max_indel_length,
+        seed=None,
+        substitution=None,
+    ):
+        super().__init__(None, seed=seed, substitution=substitution)
+        self.snp_rate = snp_rate
+        self.insertion_rate = insertion_rate
+        self.deletion_rate = deletion_rate
+        self.max_indel_length = max_indel_length
+        rates = [snp_rate, insertion_rate, deletion_rate]
+        self.total_rate = sum(rates)
+        if min(rates) < 0 or self.total_rate >= 1:
+            raise ValueError(
+                f"Rates of variants must be non-negative, and add up to less than 1. Got: {rates}"
+            )
+        if max_indel_length < 1 and insertion_rate + deletion_rate > 0:
+            raise ValueError(
+                f"Maximum indel length must be at least 1. Got: {max_indel_length}"
+            )
+        self.cumulative_rates = list(itertools.accumulate(rates))
+
+    def _mutation_description_string(self):
+        return "_".join(
+            [
+                f"RANDOM_snp_{self.snp_rate}",
+                f"ins_{self.insertion_rate}",
+                f"del_{self.deletion_rate}",
+                f"maxindel_{self.max_indel_length}",
+            ]
+        )
+
+    def _types_and_gaps(self):
+        """Yields tuples (variant type, gap to next variant) forever"""
+        global random
+        while True:
+            types = random.choices(
+                ["snp", "insertion", "deletion"],
+                cum_weights=self.cumulative_rates,
+                k=self.batch_size,
+            )
+            gaps = [
+                int(random.expovariate(self.total_rate)) for _ in range(self.batch_size)
+            ]
+            yield from zip(types, gaps)
+
+    def mutate_sequence(self, sequence, mask=None):
+        global random
+        if self.total_rate == 0:
+            return [], sequence.seq[0 : len(sequence)]
+
+        # Each element is a list [position, ref, alt]. alt is None for SNPs,
+        # which are filled in afterwards so that their new bases can be
+        # chosen all at once
+        variants = []
+        position = 0
+        for variant_type, gap in self._types_and_gaps():
+            position += gap
+            if position >= len(sequence):
+                break
+            if variant_type == "deletion":
+                end = position + random.randint(1, self.max_indel_length) + 1
+                if end > len(sequence):
+                    continue
+            else:
+                end = position + 1
+
+            ref = sequence.seq[position:end].upper()
+            if not acgt.issuperset(ref) or (
+                mask is not None and not mask.allowed(position, end)
+            ):
+                continue
+
+            if variant_type == "snp":
+                alt = None
+            elif variant_type == "insertion":
+                length = random.randint(1, self.max_indel_length)
+                alt = ref + "".join(random.choices(["A", "C", "G", "T"], k=length))
+            else:
+                alt = ref[0]
+            variants.append([position, ref, alt])
+            position = end
+
+        snps = [x for x in variants if x[2] is None]
+        for snp, new_nucleotide in zip(
+            snps, self._get_snp_variants([x[1] for x in snps])
+        ):
+            snp[2] = new_nucleotide
+
+        mutations = []
+        new_sequence = []
+        previous_end = 0
+        length_change = 0
+        for position, ref, alt in variants:
+            new_sequence.append(sequence.seq[previous_end:position])
+            if len(ref) == len(alt):
+                new_sequence.append(alt)
+            else:
+                # Indels keep the case of the base before them, so that soft
+                # masking is not lost. ref and alt are upper case for the VCF
+                new_sequence.append(sequence.seq[position] + alt[1:])
+            mutations.append(Mutation(position, position + length_change, ref, alt))
+            length_change += len(alt) - len(ref)
+            previous_end = position + len(ref)
+
+        new_sequence.append(sequence.seq[previous_end:])
+        mutated_seq = "".join(new_sequence)
+        return mutations, mutated_seq
@@ -0,0 +1,135 @@
+import array
+import bisect
+
+# Intervals are zero-based, with the end not included (ie the same as BED
+# files). For each sequence the intervals are merged and stored in sorted
+# arrays of starts and ends, so that looking up a position is a binary
+# search, instead of a scan through all the intervals.
+
+
+class ContigIntervals:
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    @classmethod
+    def from_intervals(cls, intervals):
+        """Returns a ContigIntervals made from an iterable of (start, end)
+        tuples, which are sorted and merged (overlapping or touching
+        intervals are combined into one interval)"""
+        starts = array.array("q")
+        ends = array.array("q")
+        for start, end in sorted(intervals):
+            if start >= end:
+                continue
+            if len(ends) and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return cls(starts, ends)
+
+    def overlaps(self, start, end):
+        """Returns True if start to end overlaps any interval"""
+        i = bisect.bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def contains(self, start, end):
+        """Returns True if start to end is inside one interval"""
+        i = bisect.bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] <= start and end <= self.ends[i]
+
+
+class IntervalIndex:
+    """Merged, sorted intervals for each sequence name"""
+
+    def __init__(self):
+        self.contigs = {}
+
+    @classmethod
+    def from_bed(cls, bed_file):
+        intervals = {}
+        with open(bed_file) as f:
+            for line in f:
+                if line.startswith(("#", "track", "browser")) or not line.strip():
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                try:
+                    start, end = int(fields[1]), int(fields[2])
+                except (IndexError, ValueError):
+                    raise ValueError(
+                        f"Error parsing this line of BED file {bed_file}: {line}"
+                    )
+                intervals.setdefault(fields[0], []).append((start, end))
+
+        index = cls()
+        for name, contig_intervals in intervals.items():
+            index.contigs[name] = ContigIntervals.from_intervals(contig_intervals)
+        return index
+
+    def get_contig(self, name):
+        """Returns the ContigIntervals of a sequence, or None if there are no
+        intervals for that sequence. name can be the whole header line from
+        a FASTA file, in which case only the first word is used"""
+        if name in self.contigs:
+            return self.contigs[name]
+        return self.contigs.get(name.split(maxsplit=1)[0] if name else name)
+
+
+class ContigMask:
+    """Says where mutations are allowed on one sequence. A site is allowed
+    if it is inside one of the included intervals (when there are any), and
+    does not overlap any of the excluded intervals"""
+
+    def __init__(self, include=None, exclude=None, use_include=False, offset=0):
+        self.include = include
+        self.exclude = exclude
+        self.use_include = use_include
+        self.offset = offset
+
+    def allowed(self, start, end):
+        """Returns True if mutating start to end (zero-based, end not
+        included) is allowed. offset is added to start and end first, which
+        is for when the sequence being mutated is part of a longer sequence"""
+        start += self.offset
+        end += self.offset
+        if self.use_include and (
+            self.include is None or not self.include.contains(start, end)
+        ):
+            return False
+        return self.exclude is None or not self.exclude.overlaps(start, end)
+
+
+class Mask:
+    """Included and excluded intervals for a whole genome. If include is
+    None, then everywhere is included, apart from the excluded intervals.
+    If include is not None, then sequences not in it are not mutated"""
+
+    def __init__(self, include=None, exclude=None):
+        self.include = include
+        self.exclude = exclude
+
+    @classmethod
+    def from_bed_files(cls, include_bed=None, exclude_bed=None):
+        """Returns a Mask, or None if both BED files are None"""
+        if include_bed is None and exclude_bed is None:
+            return None
+        return cls(
+            include=(
+                None if include_bed is None else IntervalIndex.from_bed(include_bed)
+            ),
+            exclude=(
+                None if exclude_bed is None else IntervalIndex.from_bed(exclude_bed)
+            ),
+        )
+
+    def get_contig(self, name, offset=0):
+        return ContigMask(
+            include=None if self.include is None else self.include.get_contig(name),
+            exclude=None if self.exclude is None else self.exclude.get_contig(name),
+            use_include=self.include is not None,
+            offset=offset,
+        )
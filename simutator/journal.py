@@ -0,0 +1,79 @@
+import json
+import os
+
+# Journals record which parts of a long run have finished, so that the run
+# can be continued from where it stopped if it is killed. A journal is a
+# file with one JSON object per line. Each line is flushed to disk as soon
+# as it is added. If the run was killed while a line was being written,
+# that last line is incomplete, and is ignored when the journal is loaded.
+
+
+def journal_filename(outprefix):
+    return outprefix + ".journal"
+
+
+class Journal:
+    def __init__(self, filename, resume=False):
+        """If resume is True and filename exists, the entries already in
+        it are loaded, and new entries are added to the end. Otherwise the
+        journal starts empty, replacing any existing file"""
+        self.filename = filename
+        self.entries = []
+        if resume and os.path.exists(filename):
+            self._load()
+        else:
+            open(filename, "w").close()
+
+    def _load(self):
+        with open(self.filename) as f:
+            lines = f.readlines()
+        for i, line in enumerate(lines):
+            try:
+                self.entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                if i == len(lines) - 1:
+                    break
+                raise ValueError(
+                    f"Error parsing line {i + 1} of journal file {self.filename}. Cannot continue"
+                )
+        # Remove any incomplete last line, so new entries start on a new line
+        with open(self.filename, "w") as f:
+            for entry in self.entries:
+                print(json.dumps(entry), file=f)
+
+    def add(self, entry):
+        """Adds entry, which must be a dictionary that can be converted to
+        JSON, to the end of the journal"""
+        with open(self.filename, "a") as f:
+            print(json.dumps(entry), file=f)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.append(entry)
+
+    def check_options(self, options):
+        """options is a dictionary, which can be converted to JSON, of the
+        options of the run that affect its output. If the journal does not
+        have any options yet, they are added to it. Otherwise they must be
+        the same as the ones already there, so that resuming with different
+        options does not mix outputs made with each of them"""
+        options = json.loads(json.dumps(options))
+        recorded = [x["options"] for x in self.entries if "options" in x]
+        if len(recorded) == 0:
+            self.add({"options": options})
+        elif recorded[0] != options:
+            raise ValueError(
+                f"Cannot resume with different options. Options in journal {self.filename}: {recorded[0]}. Options now: {options}. Cannot continue"
+            )
+
+    def finished(self):
+        """Returns dictionary of unit name -> entry, for each entry that has
+        a "unit" key. These are the units of work that have finished"""
+        return {x["unit"]: x for x in self.entries if "unit" in x}
+
+    def finish(self, unit, **data):
+        """Records that unit of work has finished. data is stored in the
+        entry, and is returned by finished() when resuming"""
+        self.add({"unit": unit, **data})
+
+    def remove(self):
+        os.unlink(self.filename)
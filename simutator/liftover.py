@@ -0,0 +1,228 @@
+import array
+import bisect
+import collections
+import logging
+
+# The liftover file maps coordinates between original and mutated genomes.
+# For each sequence there is a line starting with ">", with the original
+# and mutated names and lengths. That is followed by one line per mutation
+# that changed the length of the sequence, giving its zero-based start and
+# length in the original and mutated sequences. Mutations that do not change
+# the length (eg SNPs) do not need to be stored, because positions inside
+# them map to the same offset from the start of the mutation.
+
+
+class ContigLiftover:
+    def __init__(self, name, mutated_name, original_length, mutated_length):
+        self.name = name
+        self.mutated_name = mutated_name
+        self.original_length = original_length
+        self.mutated_length = mutated_length
+        self.original_starts = array.array("q")
+        self.original_lengths = array.array("q")
+        self.mutated_starts = array.array("q")
+        self.mutated_lengths = array.array("q")
+
+    def add_block(self, original_start, original_length, mutated_start, mutated_length):
+        self.original_starts.append(original_start)
+        self.original_lengths.append(original_length)
+        self.mutated_starts.append(mutated_start)
+        self.mutated_lengths.append(mutated_length)
+
+    def _arrays(self, to_original):
+        if to_original:
+            return (
+                self.mutated_starts,
+                self.mutated_lengths,
+                self.original_starts,
+                self.original_lengths,
+                self.mutated_length,
+            )
+        else:
+            return (
+                self.original_starts,
+                self.original_lengths,
+                self.mutated_starts,
+                self.mutated_lengths,
+                self.original_length,
+            )
+
+    @staticmethod
+    def _lift(position, i, src_starts, src_lengths, dst_starts, dst_lengths):
+        # i = index of the last block starting at or before position, or -1
+        if i < 0:
+            return position
+        offset = position - src_starts[i]
+        if offset < src_lengths[i]:
+            return dst_starts[i] + offset if offset < dst_lengths[i] else None
+        return dst_starts[i] + dst_lengths[i] + offset - src_lengths[i]
+
+    def lift_position(self, position, to_original=False):
+        """Returns the lifted position (zero-based), or None if the position
+        was deleted (or inserted, when lifting from mutated to original)"""
+        src_starts, src_lengths, dst_starts, dst_lengths, length = self._arrays(
+            to_original
+        )
+        if not 0 <= position < length:
+            raise ValueError(f"Position {position} out of range for {self.name}")
+        i = bisect.bisect_right(src_starts, position) - 1
+        return self._lift(position, i, src_starts, src_lengths, dst_starts, dst_lengths)
+
+    def lift_positions(self, positions, to_original=False):
+        """Same as lift_position, but for a list of positions. Sorts the
+        positions and sweeps through them and the mutations together,
+        instead of doing a search for each position. Returns a list of
+        lifted positions, in the same order as the input positions"""
+        src_starts, src_lengths, dst_starts, dst_lengths, length = self._arrays(
+            to_original
+        )
+        lifted = [None] * len(positions)
+        i = -1
+        for j in sorted(range(len(positions)), key=positions.__getitem__):
+            position = positions[j]
+            if not 0 <= position < length:
+                raise ValueError(f"Position {position} out of range for {self.name}")
+            while i + 1 < len(src_starts) and src_starts[i + 1] <= position:
+                i += 1
+            lifted[j] = self._lift(
+                position, i, src_starts, src_lengths, dst_starts, dst_lengths
+            )
+        return lifted
+
+    def lift_interval(self, start, end, to_original=False):
+        """Lifts interval start to end (zero-based, end not included). If the
+        start or end of the interval was deleted, then the lifted interval is
+        shrunk to the nearest positions that are not deleted. Returns tuple
+        (start, end), or None if the whole interval was deleted"""
+        src_starts, src_lengths, dst_starts, dst_lengths, length = self._arrays(
+            to_original
+        )
+        if not 0 <= start < end <= length:
+            raise ValueError(f"Bad interval {start}-{end} for {self.name}")
+
+        i = bisect.bisect_right(src_starts, start) - 1
+        new_start = self._lift(
+            start, i, src_starts, src_lengths, dst_starts, dst_lengths
+        )
+        if new_start is None:
+            new_start = dst_starts[i] + dst_lengths[i]
+
+        i = bisect.bisect_right(src_starts, end - 1) - 1
+        new_end = self._lift(
+            end - 1, i, src_starts, src_lengths, dst_starts, dst_lengths
+        )
+        if new_end is None:
+            new_end = dst_starts[i] + dst_lengths[i]
+        else:
+            new_end += 1
+
+        return (new_start, new_end) if new_start < new_end else None
+
+
+class Liftover:
+    def __init__(self):
+        self.contigs = collections.OrderedDict()
+        self.mutated_names = {}
+
+    def add_sequence(
+        self, name, mutated_name, original_length, mutated_length, mutations
+    ):
+        contig = ContigLiftover(name, mutated_name, original_length, mutated_length)
+        for mutation in mutations:
+            if len(mutation.original_seq) != len(mutation.new_seq):
+                contig.add_block(
+                    mutation.original_position,
+                    len(mutation.original_seq),
+                    mutation.new_position,
+                    len(mutation.new_seq),
+                )
+        self.contigs[name] = contig
+        self.mutated_names[mutated_name] = name
+
+    def write(self, filename):
+        with open(filename, "w") as f:
+            print("##simutator_liftover=1", file=f)
+            for contig in self.contigs.values():
+                print(
+                    ">" + contig.name,
+                    contig.mutated_name,
+                    contig.original_length,
+                    contig.mutated_length,
+                    sep="\t",
+                    file=f,
+                )
+                for block in zip(
+                    contig.original_starts,
+                    contig.original_lengths,
+                    contig.mutated_starts,
+                    contig.mutated_lengths,
+                ):
+                    print(*block, sep="\t", file=f)
+
+    @classmethod
+    def from_file(cls, filename):
+        liftover = cls()
+        contig = None
+        with open(filename) as f:
+            for line in f:
+                if line.startswith("##"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                if line.startswith(">"):
+                    contig = ContigLiftover(
+                        fields[0][1:], fields[1], int(fields[2]), int(fields[3])
+                    )
+                    liftover.contigs[contig.name] = contig
+                    liftover.mutated_names[contig.mutated_name] = contig.name
+                else:
+                    contig.add_block(*[int(x) for x in fields])
+        return liftover
+
+    def get_contig(self, name):
+        """Returns the ContigLiftover of a sequence. name can be the original
+        or mutated name of the sequence"""
+        name = self.mutated_names.get(name, name)
+        if name not in self.contigs:
+            raise KeyError(f"Sequence '{name}' not found in liftover")
+        return self.contigs[name]
+
+    def lift_position(self, name, position, to_original=False):
+        return self.get_contig(name).lift_position(position, to_original=to_original)
+
+    def lift_positions(self, name, positions, to_original=False):
+        return self.get_contig(name).lift_positions(positions, to_original=to_original)
+
+    def lift_interval(self, name, start, end, to_original=False):
+        return self.get_contig(name).lift_interval(start, end, to_original=to_original)
+
+    def lift_bed_file(self, bed_in, bed_out, to_original=False):
+        """Lifts the intervals in a BED file. Lines that cannot be lifted (the
+        whole interval was deleted, or unknown sequence name) are not
+        written. Returns the number of lines not written"""
+        failed = 0
+        unknown_names = set()
+
+        with open(bed_in) as f_in, open(bed_out, "w") as f_out:
+            for line in f_in:
+                if line.startswith(("#", "track", "browser")) or not line.strip():
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                try:
+                    contig = self.get_contig(fields[0])
+                except KeyError:
+                    unknown_names.add(fields[0])
+                    failed += 1
+                    continue
+
+                interval = contig.lift_interval(
+                    int(fields[1]), int(fields[2]), to_original=to_original
+                )
+                if interval is None:
+                    failed += 1
+                    continue
+                new_name = contig.name if to_original else contig.mutated_name
+                print(new_name, *interval, *fields[3:], sep="\t", file=f_out)
+
+        for name in sorted(unknown_names):
+            logging.warning(f"Sequence '{name}' not found in liftover")
+        return failed
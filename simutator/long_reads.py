@@ -0,0 +1,198 @@
+import bisect
+import contextlib
+import gzip
+import itertools
+import math
+import random
+
+import pyfastaq
+
+from simutator import utils
+
+# Simulates long reads (eg Oxford Nanopore or PacBio), without needing any
+# other programs. Read lengths are drawn from a lognormal distribution.
+# Errors are put into each read using the gaps between errors, instead of
+# deciding for each base whether or not it is an error, so the time taken
+# per read depends on the number of errors, not on the read length.
+# Random numbers are drawn in batches.
+
+_COMPLEMENT = str.maketrans("ACGTNacgtn", "TGCANtgcan")
+_ALTERNATIVES = {b: [x for x in "ACGT" if x != b] for b in "ACGT"}
+BATCH_SIZE = 1000
+
+
+def lognormal_parameters(mean, sd):
+    """Returns (mu, sigma) of the lognormal distribution with the given
+    mean and standard deviation"""
+    sigma_squared = math.log(1 + (sd / mean) ** 2)
+    return math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared)
+
+
+class LongReadSimulator:
+    def __init__(
+        self,
+        mean_read_length=10000,
+        read_length_sd=5000,
+        substitution_rate=0.005,
+        insertion_rate=0.0025,
+        deletion_rate=0.0025,
+        min_read_length=100,
+        seed=None,
+    ):
+        error_rates = [substitution_rate, insertion_rate, deletion_rate]
+        if min(error_rates) < 0 or sum(error_rates) >= 1:
+            raise ValueError(
+                f"Error rates must be non-negative, and add up to less than 1. Got: {error_rates}"
+            )
+        if mean_read_length <= 0 or read_length_sd <= 0:
+            raise ValueError(
+                f"Mean and standard deviation of read length must be positive. Got: {mean_read_length}, {read_length_sd}"
+            )
+        self.mu, self.sigma = lognormal_parameters(mean_read_length, read_length_sd)
+        self.min_read_length = min_read_length
+        self.error_rate = sum(error_rates)
+        self.cumulative_error_rates = list(itertools.accumulate(error_rates))
+        self.rng = random.Random(seed)
+        # All bases get the same quality score, from the error rate
+        if self.error_rate > 0:
+            phred = min(93, int(-10 * math.log10(self.error_rate)))
+        else:
+            phred = 93
+        self.quality_char = chr(33 + phred)
+
+    def _errors(self):
+        """Yields tuples (error type, gap to next error) forever"""
+        while True:
+            types = self.rng.choices(
+                "SID", cum_weights=self.cumulative_error_rates, k=BATCH_SIZE
+            )
+            gaps = [
+                int(self.rng.expovariate(self.error_rate)) for _ in range(BATCH_SIZE)
+            ]
+            yield from zip(types, gaps)
+
+    def add_errors(self, seq, errors):
+        """Returns seq with errors added. errors is the iterator from
+        _errors(), which is shared between reads so that the random numbers
+        are drawn in batches"""
+        if self.error_rate == 0:
+            return seq
+        pieces = []
+        position = 0
+        for error_type, gap in errors:
+            position_before = position
+            position += gap
+            if position >= len(seq):
+                pieces.append(seq[position_before:])
+                # The next error would be past the end of this read. Throw
+                # it away, because the gaps have no memory
+                break
+            pieces.append(seq[position_before:position])
+            if error_type == "S":
+                base = seq[position].upper()
+                pieces.append(self.rng.choice(_ALTERNATIVES.get(base, "ACGT")))
+                position += 1
+            elif error_type == "I":
+                pieces.append(self.rng.choice("ACGT"))
+            else:
+                position += 1
+        return "".join(pieces)
+
+    def simulate_reads(self, sequences, total_bases):
+        """Yields reads (pyfastaq Fastq objects) from sequences, which is a
+        list of tuples (name, sequence), until the total length of the reads
+        before adding errors is at least total_bases. Read names have the
+        sequence name, the 1-based start and end positions, and strand"""
+        cumulative_lengths = list(itertools.accumulate(len(x[1]) for x in sequences))
+        errors = self._errors()
+        bases_made = 0
+        read_number = 0
+
+        while bases_made < total_bases:
+            lengths = [
+                max(
+                    self.min_read_length,
+                    int(self.rng.lognormvariate(self.mu, self.sigma)),
+                )
+                for _ in range(BATCH_SIZE)
+            ]
+            # Choose which sequence reads come from in proportion to
+            # sequence lengths
+            locations = [
+                self.rng.randrange(cumulative_lengths[-1]) for _ in range(BATCH_SIZE)
+            ]
+            strands = self.rng.choices("+-", k=BATCH_SIZE)
+            for length, location, strand in zip(lengths, locations, strands):
+                if bases_made >= total_bases:
+                    break
+                i = bisect.bisect_right(cumulative_lengths, location)
+                name, seq = sequences[i]
+                length = min(length, len(seq))
+                # Every start position where the whole read fits is equally
+                # likely, so that reads do not pile up at sequence ends
+                start = self.rng.randrange(len(seq) - length + 1)
+                read_seq = seq[start : start + length]
+                if strand == "-":
+                    read_seq = read_seq.translate(_COMPLEMENT)[::-1]
+                read_seq = self.add_errors(read_seq, errors)
+                read_number += 1
+                bases_made += length
+                yield pyfastaq.sequences.Fastq(
+                    f"{read_number}_{name}_{start + 1}_{start + length}_{strand}",
+                    read_seq,
+                    self.quality_char * len(read_seq),
+                )
+
+
+def simulate_long_reads_from_fasta(
+    ref_fasta,
+    reads_out,
+    read_depth=30,
+    mean_read_length=10000,
+    read_length_sd=5000,
+    substitution_rate=0.005,
+    insertion_rate=0.0025,
+    deletion_rate=0.0025,
+    random_seed=None,
+    progress=None,
+):
+    """Simulates long reads from ref_fasta, writing them to the gzipped FASTQ
+    file reads_out. If reads_out is "-", then the reads are written to stdout
+    uncompressed instead. ref_fasta can be "-" to read from stdin. If
+    progress is not None, it is a progress.ProgressReporter, which is
+    updated after each read with the length of the read and the bytes of
+    FASTQ written (before compressing). Returns
+    the number of reads written"""
+    sequences = [
+        (x.id.split()[0], x.seq.upper())
+        for x in pyfastaq.sequences.file_reader(ref_fasta)
+        if len(x)
+    ]
+    if len(sequences) == 0:
+        raise ValueError(f"No sequences found in file {ref_fasta}. Cannot continue")
+    simulator = LongReadSimulator(
+        mean_read_length=mean_read_length,
+        read_length_sd=read_length_sd,
+        substitution_rate=substitution_rate,
+        insertion_rate=insertion_rate,
+        deletion_rate=deletion_rate,
+        seed=random_seed,
+    )
+    total_bases = read_depth * sum(len(x[1]) for x in sequences)
+    if progress is not None:
+        progress.total_bases = total_bases
+    read_count = 0
+    with contextlib.ExitStack() as stack:
+        if reads_out == "-":
+            f = stack.enter_context(utils.open_output(reads_out))
+        else:
+            # Compression takes most of the time. Level 1 is several times
+            # faster than the default (9), and the files are not much bigger
+            f = stack.enter_context(gzip.open(reads_out, "wt", compresslevel=1))
+        for read in simulator.simulate_reads(sequences, total_bases):
+            data = str(read)
+            print(data, file=f)
+            read_count += 1
+            if progress is not None:
+                progress.update(bases=len(read), bytes_written=len(data) + 1)
+    return read_count
@@ -0,0 +1,105 @@
+import gzip
+
+# Tables of mutations, one row per mutation, for loading into dataframes
+# instead of parsing VCF files. Positions are 1-based, as in the VCF files.
+# The "tsv" format is a gzipped tab-delimited file. The "parquet" format
+# needs pyarrow to be installed.
+
+COLUMNS = [
+    "contig",
+    "mutated_contig",
+    "original_pos",
+    "new_pos",
+    "ref",
+    "alt",
+    "mutation_type",
+    "configuration",
+]
+
+FILE_FORMATS = {"tsv": "tsv.gz", "parquet": "parquet"}
+
+
+def table_filename(prefix, file_format):
+    return f"{prefix}.mutations.{FILE_FORMATS[file_format]}"
+
+
+def _rows(sequences, mutation_type, configuration):
+    for name, mutated_name, _, _, mutations in sequences:
+        for mutation in mutations:
+            yield (
+                name,
+                mutated_name,
+                mutation.original_position + 1,
+                mutation.new_position + 1,
+                mutation.original_seq,
+                mutation.new_seq,
+                mutation_type,
+                configuration,
+            )
+
+
+def _write_tsv(filename, rows):
+    with gzip.open(filename, "wt") as f:
+        print(*COLUMNS, sep="\t", file=f)
+        for row in rows:
+            print(*row, sep="\t", file=f)
+
+
+def _write_parquet(filename, rows, row_group_size):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError(
+            "pyarrow must be installed to write parquet files. Cannot continue"
+        )
+
+    schema = pyarrow.schema(
+        [
+            ("contig", pyarrow.string()),
+            ("mutated_contig", pyarrow.string()),
+            ("original_pos", pyarrow.int64()),
+            ("new_pos", pyarrow.int64()),
+            ("ref", pyarrow.string()),
+            ("alt", pyarrow.string()),
+            ("mutation_type", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+            ("configuration", pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+        ]
+    )
+
+    def write_batch(writer, columns):
+        writer.write_table(
+            pyarrow.table(dict(zip(COLUMNS, columns)), schema=schema),
+            row_group_size=row_group_size,
+        )
+
+    with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+        columns = [[] for _ in COLUMNS]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(columns[0]) >= row_group_size:
+                write_batch(writer, columns)
+                columns = [[] for _ in COLUMNS]
+        if len(columns[0]):
+            write_batch(writer, columns)
+
+
+def write_mutation_table(
+    filename,
+    sequences,
+    mutation_type,
+    configuration,
+    file_format="tsv",
+    row_group_size=1000000,
+):
+    """Writes table of mutations. sequences = list of tuples
+    (name, mutated name, original length, mutated length, list of mutations).
+    Every row has the same mutation_type and configuration"""
+    rows = _rows(sequences, mutation_type, configuration)
+    if file_format == "tsv":
+        _write_tsv(filename, rows)
+    elif file_format == "parquet":
+        _write_parquet(filename, rows, row_group_size)
+    else:
+        raise ValueError(f"Unknown mutation table format '{file_format}'")
@@ -0,0 +1,269 @@
+import array
+import bisect
+import json
+import mmap
+import os
+import re
+import sys
+
+import pyfastaq
+
+# Sequences are stored using 2 bits per base (4 bases per byte). Anything
+# that is not A, C, G or T (eg runs of N) is stored separately as a list of
+# runs, as are runs of lowercase characters. This means a PackedSequence
+# can always be converted back to exactly the original string.
+
+_ENCODE = bytes.maketrans(b"ACGTacgt", bytes([0, 1, 2, 3, 0, 1, 2, 3]))
+_ENCODE = bytes(x if x < 4 else 0 for x in bytes(range(256)).translate(_ENCODE))
+_DECODE = [
+    bytes(b"ACGT"[(i >> shift) & 3] for shift in (6, 4, 2, 0)) for i in range(256)
+]
+_NON_ACGT_REGEX = re.compile(r"[^ACGTacgt]+")
+_LOWERCASE_REGEX = re.compile(r"[a-z]+")
+
+CACHE_VERSION = 1
+
+
+def pack(seq):
+    """Returns bytes of the 2-bit encoding of the string seq. Characters
+    that are not ACGT (upper or lower case) are encoded as A"""
+    codes = seq.encode("ascii").translate(_ENCODE)
+    codes += bytes((-len(codes)) % 4)
+    packed_int = 0
+    # Do the packing using big integer arithmetic instead of a python loop
+    # over each byte. Every byte of codes is 0-3, so shifting by at most 6
+    # bits cannot overflow into the next byte
+    for i in range(4):
+        packed_int |= int.from_bytes(codes[i::4], "big") << (2 * (3 - i))
+    return packed_int.to_bytes(len(codes) // 4, "big")
+
+
+def _runs(regex, seq):
+    starts = array.array("q")
+    ends = array.array("q")
+    for match in regex.finditer(seq):
+        starts.append(match.start())
+        ends.append(match.end())
+    return starts, ends
+
+
+class PackedSequence:
+    """Read-only sequence stored in 2-bit format. Supports len() and
+    indexing/slicing (with step 1), which return strings"""
+
+    def __init__(
+        self,
+        packed,
+        length,
+        lower_starts,
+        lower_ends,
+        other_starts,
+        other_ends,
+        other_chars,
+    ):
+        self.packed = packed
+        self.length = length
+        self.lower_starts = lower_starts
+        self.lower_ends = lower_ends
+        self.other_starts = other_starts
+        self.other_ends = other_ends
+        # The non-ACGT characters, all concatenated. Run i starts at the sum
+        # of the lengths of the runs before it
+        self.other_chars = other_chars
+        self.other_char_offsets = array.array("q", [0])
+        for start, end in zip(other_starts, other_ends):
+            self.other_char_offsets.append(self.other_char_offsets[-1] + end - start)
+
+    @classmethod
+    def from_string(cls, seq):
+        other_starts, other_ends = _runs(_NON_ACGT_REGEX, seq)
+        other_chars = "".join(
+            seq[start:end] for start, end in zip(other_starts, other_ends)
+        ).encode("ascii")
+        return cls(
+            pack(seq),
+            len(seq),
+            *_runs(_LOWERCASE_REGEX, seq),
+            other_starts,
+            other_ends,
+            other_chars,
+        )
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self[0 : self.length]
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(self.length)
+            if step != 1:
+                raise ValueError("PackedSequence slicing only supports step 1")
+        else:
+            if index < 0:
+                index += self.length
+            if not 0 <= index < self.length:
+                raise IndexError("PackedSequence index out of range")
+            start, end = index, index + 1
+
+        if start >= end:
+            return ""
+
+        decoded = bytearray(
+            b"".join(map(_DECODE.__getitem__, self.packed[start // 4 : (end + 3) // 4]))
+        )
+        del decoded[: start % 4]
+        del decoded[end - start :]
+
+        i = bisect.bisect_right(self.lower_ends, start)
+        while i < len(self.lower_starts) and self.lower_starts[i] < end:
+            run_start = max(self.lower_starts[i], start) - start
+            run_end = min(self.lower_ends[i], end) - start
+            decoded[run_start:run_end] = decoded[run_start:run_end].lower()
+            i += 1
+
+        i = bisect.bisect_right(self.other_ends, start)
+        while i < len(self.other_starts) and self.other_starts[i] < end:
+            run_start = max(self.other_starts[i], start)
+            run_end = min(self.other_ends[i], end)
+            chars_start = self.other_char_offsets[i] + run_start - self.other_starts[i]
+            decoded[run_start - start : run_end - start] = self.other_chars[
+                chars_start : chars_start + run_end - run_start
+            ]
+            i += 1
+
+        return decoded.decode("ascii")
+
+
+def default_cache_filename(fasta_file):
+    return fasta_file + ".simutator_cache"
+
+
+def _source_info(fasta_file):
+    stat = os.stat(fasta_file)
+    return {
+        "version": CACHE_VERSION,
+        "byteorder": sys.byteorder,
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def build_cache(fasta_file, cache_file):
+    """Writes a cache file of the sequences in fasta_file in 2-bit format.
+    The data for each sequence is written in blocks aligned to 8 bytes, so
+    that arrays can be used straight from a memory-mapped file. At the end
+    of the file is a JSON header describing where the blocks are, followed by
+    the length of the header as an 8 byte integer"""
+    header = _source_info(fasta_file)
+    header["sequences"] = []
+    blocks = []
+    data_length = 0
+
+    def add_block(data):
+        nonlocal data_length
+        offset = data_length
+        blocks.append(data)
+        blocks.append(bytes((-len(data)) % 8))
+        data_length += len(data) + len(blocks[-1])
+        return [offset, len(data)]
+
+    tmp_file = cache_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        for sequence in pyfastaq.sequences.file_reader(fasta_file):
+            packed_seq = PackedSequence.from_string(sequence.seq)
+            header["sequences"].append(
+                {
+                    "name": sequence.id,
+                    "length": len(packed_seq),
+                    "packed": add_block(packed_seq.packed),
+                    "lower_starts": add_block(packed_seq.lower_starts.tobytes()),
+                    "lower_ends": add_block(packed_seq.lower_ends.tobytes()),
+                    "other_starts": add_block(packed_seq.other_starts.tobytes()),
+                    "other_ends": add_block(packed_seq.other_ends.tobytes()),
+                    "other_chars": add_block(packed_seq.other_chars),
+                }
+            )
+            # Write as we go, so that only one sequence is in memory
+            for block in blocks:
+                f.write(block)
+            blocks.clear()
+
+        header_bytes = json.dumps(header).encode()
+        f.write(header_bytes)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+
+    os.replace(tmp_file, cache_file)
+
+
+def _load_cache_header(cache_file):
+    with open(cache_file, "rb") as f:
+        f.seek(-8, os.SEEK_END)
+        header_length = int.from_bytes(f.read(8), "little")
+        f.seek(-8 - header_length, os.SEEK_END)
+        return json.loads(f.read(header_length))
+
+
+def cache_is_valid(fasta_file, cache_file):
+    if not os.path.exists(cache_file):
+        return False
+    try:
+        header = _load_cache_header(cache_file)
+    except (OSError, ValueError):
+        return False
+    return all(header.get(k) == v for k, v in _source_info(fasta_file).items())
+
+
+def sequence_lengths(cache_file):
+    """Returns list of the lengths of the sequences in the cache file,
+    without loading the sequences"""
+    return [x["length"] for x in _load_cache_header(cache_file)["sequences"]]
+
+
+def load_cache(cache_file):
+    """Returns list of tuples (name, PackedSequence), where the sequences are
+    backed by a read-only memory map of the cache file"""
+    header = _load_cache_header(cache_file)
+    with open(cache_file, "rb") as f:
+        mapped = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def block(offset_and_length, fmt=None):
+        offset, length = offset_and_length
+        view = mapped[offset : offset + length]
+        return view if fmt is None else view.cast(fmt)
+
+    sequences = []
+    for seq in header["sequences"]:
+        packed_seq = PackedSequence(
+            block(seq["packed"]),
+            seq["length"],
+            block(seq["lower_starts"], "q"),
+            block(seq["lower_ends"], "q"),
+            block(seq["other_starts"], "q"),
+            block(seq["other_ends"], "q"),
+            block(seq["other_chars"]),
+        )
+        sequences.append((seq["name"], packed_seq))
+    return sequences
+
+
+def load_reference(fasta_file, cache_file=None):
+    """Returns list of tuples (name, PackedSequence) of the sequences in
+    fasta_file. Uses the cache file if it is up to date, otherwise makes it
+    first. Default cache filename is fasta_file plus .simutator_cache"""
+    if cache_file is None:
+        cache_file = default_cache_filename(fasta_file)
+    if not cache_is_valid(fasta_file, cache_file):
+        build_cache(fasta_file, cache_file)
+    return load_cache(cache_file)
+
+
+def file_reader(fasta_file, cache_file=None):
+    """Same as pyfastaq.sequences.file_reader, but yields Fasta objects
+    where the sequence is a PackedSequence, loaded from the cache file"""
+    for name, packed_seq in load_reference(fasta_file, cache_file=cache_file):
+        yield pyfastaq.sequences.Fasta(name, packed_seq)
@@ -0,0 +1,201 @@
+import datetime
+import logging
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from simutator import utils
+
+# Reports progress of long jobs, such as making one mutated genome or one
+# set of simulated reads. The code doing the work calls update() as it goes
+# (eg after each sequence), and every interval seconds a line is logged
+# with the number of bases processed, variants made, bytes written, the
+# rate and the estimated time left. The same numbers can also be written
+# to a Prometheus textfile, for the textfile collector of a node exporter
+# running on the same machine, so that slow or stalled jobs can be found.
+# The node exporter reads every *.prom file in a directory, so each job
+# writes its own file, which is replaced atomically each time.
+
+METRICS = [
+    ("bases_processed", "Bases processed so far"),
+    ("bases_total", "Total bases to process"),
+    ("variants", "Variants made so far"),
+    ("bytes_written", "Bytes of output written so far"),
+    ("contigs_processed", "Sequences processed so far"),
+    ("bases_per_second", "Mean bases processed per second since the start"),
+    ("eta_seconds", "Estimated seconds until finished"),
+    ("peak_memory_bytes", "Peak resident memory of the process"),
+    ("start_time_seconds", "Unix time when the job started"),
+    ("last_update_time_seconds", "Unix time of the last update"),
+    ("finished", "1 if the job has finished, otherwise 0"),
+]
+
+
+def metrics_filename(metrics_dir, outprefix, name):
+    """Returns name of the Prometheus textfile of one job"""
+    return os.path.join(metrics_dir, f"{os.path.basename(outprefix)}.{name}.prom")
+
+
+def peak_memory():
+    """Returns peak resident memory in bytes of this process, or None if it
+    is not known"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS gives bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_duration(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ProgressReporter:
+    """Progress of one job called name. total_bases is used to estimate the
+    time left, and can be None if it is not known. A line is logged at most
+    every interval seconds (never, if interval is None), when update() is
+    called. If metrics_file is not None, the Prometheus textfile is
+    written at the same times, with labels (a dictionary of label name ->
+    value) on every metric. finish() must be called at the end"""
+
+    def __init__(
+        self,
+        name,
+        total_bases=None,
+        interval=60,
+        metrics_file=None,
+        labels=None,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.total_bases = total_bases
+        self.interval = interval
+        self.metrics_file = metrics_file
+        self.labels = {"name": name} if labels is None else labels
+        self.clock = clock
+        self.bases = 0
+        self.variants = 0
+        self.bytes_written = 0
+        self.contigs = 0
+        self.contig = None
+        self.resumed_bases = 0
+        self.finished = False
+        self.start_time = self.last_update_time = time.time()
+        self.start = self.last_report = clock()
+        if self.metrics_file is not None:
+            self.write_metrics()
+
+    def update(self, bases=0, variants=0, bytes_written=0, contig=None):
+        """Adds to the number of bases processed, variants made and bytes
+        written. If contig is not None, it is the name of the sequence that
+        was just finished. Reports progress if it is time to"""
+        self.bases += bases
+        self.variants += variants
+        self.bytes_written += bytes_written
+        self.last_update_time = time.time()
+        if contig is not None:
+            self.contig = contig
+            self.contigs += 1
+        if self.interval is not None and (
+            self.clock() - self.last_report >= self.interval
+        ):
+            self.report()
+
+    def resume(self, bases=0, variants=0, bytes_written=0, contigs=0):
+        """Sets the counts to those of work that was done by an earlier run
+        that is being continued. Those bases are not used when calculating
+        the rate, so that the time left is still estimated correctly"""
+        self.bases = self.resumed_bases = bases
+        self.variants = variants
+        self.bytes_written = bytes_written
+        self.contigs = contigs
+        if self.metrics_file is not None:
+            self.write_metrics()
+
+    def rate(self):
+        """Returns mean bases per second since the start, not counting bases
+        from an earlier run (see resume())"""
+        seconds = self.clock() - self.start
+        return (self.bases - self.resumed_bases) / seconds if seconds > 0 else 0
+
+    def eta(self):
+        """Returns estimated seconds left, or None if it is not known"""
+        if self.finished:
+            return 0
+        rate = self.rate()
+        if self.total_bases is None or rate == 0:
+            return None
+        return max(0, self.total_bases - self.bases) / rate
+
+    def report(self):
+        """Logs the progress so far, and writes the metrics file"""
+        self.last_report = self.clock()
+        if self.total_bases:
+            done = f"{self.bases}/{self.total_bases} bases ({100 * self.bases / self.total_bases:.1f}%)"
+        else:
+            done = f"{self.bases} bases"
+        eta = self.eta()
+        message = [
+            "Finished" if self.finished else "Progress",
+            f"{self.name}:",
+            done + ",",
+            f"{self.variants} variants,",
+            f"{utils.format_memory(self.bytes_written)} written,",
+            f"{self.rate():.0f} bases/s,",
+        ]
+        if self.finished:
+            message.append("took " + format_duration(self.clock() - self.start))
+        else:
+            message.append(
+                "ETA " + ("unknown" if eta is None else format_duration(eta))
+            )
+        if self.contig is not None and not self.finished:
+            message.append(f"(last sequence: {self.contig})")
+        logging.info(" ".join(message))
+        if self.metrics_file is not None:
+            self.write_metrics()
+
+    def finish(self):
+        self.finished = True
+        self.report()
+
+    def metrics(self):
+        """Returns dictionary of metric name -> value. Metrics that are not
+        known are not included"""
+        values = {
+            "bases_processed": self.bases,
+            "bases_total": self.total_bases,
+            "variants": self.variants,
+            "bytes_written": self.bytes_written,
+            "contigs_processed": self.contigs,
+            "bases_per_second": self.rate(),
+            "eta_seconds": self.eta(),
+            "peak_memory_bytes": peak_memory(),
+            "start_time_seconds": self.start_time,
+            "last_update_time_seconds": self.last_update_time,
+            "finished": int(self.finished),
+        }
+        return {k: v for k, v in values.items() if v is not None}
+
+    def write_metrics(self):
+        labels = ",".join(
+            f'{k}="{_escape_label(v)}"' for k, v in sorted(self.labels.items())
+        )
+        values = self.metrics()
+        with utils.atomic_outputs([self.metrics_file]) as tmp_files:
+            with open(tmp_files[0], "w") as f:
+                for metric, description in METRICS:
+                    if metric not in values:
+                        continue
+                    print(f"# HELP simutator_{metric} {description}", file=f)
+                    print(f"# TYPE simutator_{metric} gauge", file=f)
+                    print(f"simutator_{metric}{{{labels}}} {values[metric]}", file=f)
@@ -0,0 +1,162 @@
+import array
+import bisect
+import gzip
+import re
+
+from simutator import genome_mutator, liftover
+
+# Makes a table of where each simulated read came from. Reads are simulated
+# from a mutated genome, and ART's alignment files say where each read is in
+# that genome. The VCF file made by mutate_fasta with respect to the mutated
+# genome has the mutations, from which positions can be lifted back to the
+# original genome.
+
+COLUMNS = [
+    "read_name",
+    "mutated_contig",
+    "mutated_start",
+    "mutated_end",
+    "strand",
+    "original_contig",
+    "original_start",
+    "original_end",
+    "variant_ids",
+]
+
+
+def table_filename(outprefix):
+    return outprefix + ".truth.tsv.gz"
+
+
+class MutatedGenomeVariants:
+    """Variants loaded from a VCF file made by mutate_fasta, where the ref is
+    the mutated genome. For each mutated sequence, stores the start and end
+    of each variant in the mutated sequence, in sorted arrays"""
+
+    def __init__(self):
+        self.liftover = liftover.Liftover()
+        self.starts = {}
+        self.ends = {}
+        self.original_positions = {}
+
+    @classmethod
+    def from_vcf(cls, vcf_file):
+        variants = cls()
+        lengths = {}
+        mutations = {}
+        with open(vcf_file) as f:
+            for line in f:
+                if line.startswith("##contig="):
+                    match = re.match(r"^##contig=<ID=(.*),length=([0-9]+)>$", line)
+                    if match is not None:
+                        lengths[match.group(1)] = int(match.group(2))
+                elif not line.startswith("#"):
+                    fields = line.rstrip("\n").split("\t")
+                    mutations.setdefault(fields[0], []).append(
+                        (int(fields[1]) - 1, fields[3], fields[4])
+                    )
+
+        missing = sorted(set(mutations).difference(lengths))
+        if len(missing):
+            raise ValueError(
+                f"No ##contig line for sequences {missing} in VCF file {vcf_file}. Cannot continue"
+            )
+
+        for mutated_name, mutated_length in lengths.items():
+            contig_mutations = []
+            length_change = 0
+            for position, mutated_seq, original_seq in sorted(
+                mutations.get(mutated_name, [])
+            ):
+                contig_mutations.append(
+                    genome_mutator.Mutation(
+                        position - length_change, position, original_seq, mutated_seq
+                    )
+                )
+                length_change += len(mutated_seq) - len(original_seq)
+
+            variants.liftover.add_sequence(
+                mutated_name.split("__simutator__")[0],
+                mutated_name,
+                mutated_length - length_change,
+                mutated_length,
+                contig_mutations,
+            )
+            variants.starts[mutated_name] = array.array(
+                "q", [x.new_position for x in contig_mutations]
+            )
+            variants.ends[mutated_name] = array.array(
+                "q", [x.new_position + len(x.new_seq) for x in contig_mutations]
+            )
+            variants.original_positions[mutated_name] = [
+                x.original_position for x in contig_mutations
+            ]
+        return variants
+
+    def overlapping_variants(self, mutated_name, start, end):
+        """Returns list of the original positions (zero-based) of the variants
+        that overlap start to end (zero-based, end not included) in the
+        mutated sequence. Uses binary search, since the variants do not
+        overlap each other and so their ends are sorted as well as starts"""
+        starts = self.starts[mutated_name]
+        i = bisect.bisect_right(self.ends[mutated_name], start)
+        j = bisect.bisect_left(starts, end, lo=i)
+        return self.original_positions[mutated_name][i:j]
+
+
+def art_aln_reads(aln_file):
+    """Yields tuples (read name, sequence name, start, end, strand) for each
+    read in an alignment file made by ART. Start and end are zero-based, end
+    not included, on the forward strand of the sequence"""
+    lengths = {}
+    with open(aln_file) as f:
+        for line in f:
+            if line.startswith("@SQ"):
+                fields = line.rstrip("\n").split("\t")
+                lengths[fields[1]] = int(fields[2])
+            elif line.startswith(">"):
+                name, read_name, position, strand = line[1:].rstrip("\n").split("\t")
+                ref_aln = next(f).rstrip("\n")
+                next(f)
+                span = len(ref_aln) - ref_aln.count("-")
+                start = int(position)
+                # ART gives positions on the reverse strand for reads on
+                # the reverse strand
+                if strand == "-":
+                    start = lengths[name] - start - span
+                yield read_name, name, start, start + span, strand
+
+
+def write_truth_table(aln_files, mutated_vcf, outfile):
+    """Writes gzipped tab-delimited file of where each read in the ART
+    alignment files came from, in the mutated and original genomes, and
+    the variants it overlaps. Positions are 1-based. Variant IDs are the
+    positions of the variants in the original genome (ie the POS column of
+    the VCF file made by mutate_fasta with respect to the original genome)"""
+    variants = MutatedGenomeVariants.from_vcf(mutated_vcf)
+    with gzip.open(outfile, "wt") as f:
+        print(*COLUMNS, sep="\t", file=f)
+        for aln_file in aln_files:
+            for read_name, name, start, end, strand in art_aln_reads(aln_file):
+                contig = variants.liftover.get_contig(name)
+                interval = contig.lift_interval(start, end, to_original=True)
+                if interval is None:
+                    original_start = original_end = "."
+                else:
+                    original_start, original_end = interval[0] + 1, interval[1]
+                variant_ids = variants.overlapping_variants(
+                    contig.mutated_name, start, end
+                )
+                print(
+                    read_name,
+                    contig.mutated_name,
+                    start + 1,
+                    end,
+                    strand,
+                    contig.name,
+                    original_start,
+                    original_end,
+                    ",".join(str(x + 1) for x in variant_ids) if variant_ids else ".",
+                    sep="\t",
+                    file=f,
+                )
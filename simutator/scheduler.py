@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import re
+
+from simutator import utils
+
+# Runs jobs in parallel, using at most a given number of processes, so that
+# the total estimated peak memory of the jobs that are running at the same
+# time is not more than a budget. The estimates are rough, and are made by
+# the code that makes the jobs (eg batch_genome_mutator), from the lengths
+# of the sequences and the expected number of mutations. Jobs are started
+# biggest first: whenever a process is free, the biggest job that fits in
+# the memory that is left is started. A job that is bigger than the whole
+# budget is run on its own.
+
+# Memory used by a Python process before it does anything
+PROCESS_MEMORY = 100 * 1024**2
+
+_MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_memory(s):
+    """Returns number of bytes from a string such as 16G, 500M, 1.5T, or
+    a number of bytes. Units are powers of 1024"""
+    match = re.match(r"^\s*([0-9.]+)\s*([KMGT]?)B?\s*$", s.upper())
+    if match is None:
+        raise ValueError(f"Cannot parse memory amount '{s}'. Cannot continue")
+    try:
+        number = float(match.group(1))
+    except ValueError:
+        raise ValueError(f"Cannot parse memory amount '{s}'. Cannot continue")
+    return int(number * _MEMORY_UNITS[match.group(2)])
+
+
+def _run_job(connection, function, job):
+    """Runs function(*job) in a child process, and sends tuple (return
+    value, exception) back through connection"""
+    try:
+        result = (function(*job), None)
+    except BaseException as error:
+        result = (None, error)
+    try:
+        connection.send(result)
+    except Exception as error:  # eg the exception cannot be pickled
+        connection.send((None, RuntimeError(f"{result[1]!r} ({error!r})")))
+    connection.close()
+
+
+def run_jobs(function, jobs, memory, processes=1, max_memory=None):
+    """Runs function(*job) for each job in jobs, in up to processes separate
+    processes at the same time. memory is a list of the estimated peak
+    memory of each job, in bytes. If max_memory is not None, jobs are only
+    started when the total estimated memory of the running jobs stays at
+    most max_memory. Yields tuples (index of job, return value of function)
+    as each job finishes. If a job raises an exception, or its process dies
+    (eg killed for using too much memory, which raises RuntimeError), the
+    processes of the other running jobs are killed, no more jobs are
+    started, and the exception is raised"""
+    pending = sorted(range(len(jobs)), key=lambda i: memory[i], reverse=True)
+    running = {}  # connection to process -> (index of job, process)
+
+    # Each job gets its own process, so that memory used by one job is given
+    # back to the system before the next one starts
+    try:
+        while len(pending) or len(running):
+            memory_used = sum(memory[i] for i, _ in running.values())
+            for i in list(pending):
+                if len(running) >= processes:
+                    break
+                if (
+                    max_memory is not None
+                    and len(running)
+                    and memory_used + memory[i] > max_memory
+                ):
+                    continue
+                if max_memory is not None and memory[i] > max_memory:
+                    logging.warning(
+                        f"Estimated memory of job {i + 1} ({utils.format_memory(memory[i])}) is more than the maximum memory ({utils.format_memory(max_memory)}). Running it on its own"
+                    )
+                logging.info(
+                    f"Starting job {i + 1} of {len(jobs)}, estimated memory {utils.format_memory(memory[i])}"
+                )
+                pending.remove(i)
+                reader, writer = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_run_job, args=(writer, function, jobs[i])
+                )
+                process.start()
+                # The child has its own copy of writer. Closing this one
+                # means reader gets EOF if the child dies without sending
+                writer.close()
+                running[reader] = (i, process)
+                memory_used += memory[i]
+
+            for reader in multiprocessing.connection.wait(list(running)):
+                i, process = running.pop(reader)
+                try:
+                    result, error = reader.recv()
+                except EOFError:
+                    process.join()
+                    raise RuntimeError(
+                        f"Process running job {i + 1} died, with exit code {process.exitcode}. Cannot continue"
+                    )
+                finally:
+                    reader.close()
+                process.join()
+                if error is not None:
+                    raise error
+                yield i, result
+    finally:
+        for reader, (_, process) in running.items():
+            process.terminate()
+            process.join()
+            reader.close()
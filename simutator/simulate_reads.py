@@ -1,16 +1,109 @@
+import contextlib
+import gzip
 import itertools
 import logging
 import os
 import shutil
 import tempfile
 
-from simutator import utils
+from simutator import (
+    fasta_index,
+    journal,
+    long_reads,
+    progress,
+    read_truth,
+    scheduler,
+    utils,
+)
+
+
+def shard_filenames(outprefix, shards):
+    """Returns list of tuples (forward reads filename, reverse reads filename)
+    of the sharded reads files made by shard_paired_fastq"""
+    return [
+        tuple(f"{outprefix}.shard{i + 1}of{shards}.{j}.fq.gz" for j in (1, 2))
+        for i in range(shards)
+    ]
+
+
+def _read_pairs(fastq1, fastq2):
+    """Yields tuples (read1, read2) of the bytes of each read pair in a pair
+    of uncompressed FASTQ files, which must have 4 lines per read"""
+    with open(fastq1, "rb") as f_in1, open(fastq2, "rb") as f_in2:
+        while True:
+            read1 = b"".join(itertools.islice(f_in1, 4))
+            read2 = b"".join(itertools.islice(f_in2, 4))
+            if len(read1) == 0 and len(read2) == 0:
+                break
+            elif len(read1) == 0 or len(read2) == 0:
+                raise ValueError(
+                    f"Different number of reads in {fastq1} and {fastq2}. Cannot continue"
+                )
+            yield read1, read2
+
+
+def shard_paired_fastq(fastq1, fastq2, outprefix, shards):
+    """Splits a pair of uncompressed FASTQ files into shards, which are each
+    gzipped. Read pairs are dealt out to the shards in turn, so that the
+    shards have the same number of pairs (to within one), and each pair is in
+    the same shard. Returns list of tuples of filenames, from shard_filenames"""
+    filenames = shard_filenames(outprefix, shards)
+    with contextlib.ExitStack() as stack:
+        tmp_filenames = stack.enter_context(
+            utils.atomic_outputs([x for y in filenames for x in y])
+        )
+        outs = [
+            tuple(stack.enter_context(gzip.open(x, "wb", compresslevel=9)) for x in y)
+            for y in zip(tmp_filenames[::2], tmp_filenames[1::2])
+        ]
+        shard = 0
+        for read1, read2 in _read_pairs(fastq1, fastq2):
+            outs[shard][0].write(read1)
+            outs[shard][1].write(read2)
+            shard = (shard + 1) % shards
+    return filenames
+
+
+def interleave_paired_fastq(fastq1, fastq2, outfile):
+    """Writes uncompressed interleaved FASTQ file from a pair of uncompressed
+    FASTQ files, ie each forward read is followed by its reverse read.
+    outfile can be "-" for stdout"""
+    with contextlib.ExitStack() as stack:
+        tmp_outfile = stack.enter_context(utils.atomic_outputs([outfile]))[0]
+        f_out = stack.enter_context(utils.open_output(tmp_outfile, "wb"))
+        for read1, read2 in _read_pairs(fastq1, fastq2):
+            f_out.write(read1)
+            f_out.write(read2)
+
 
 # This uses ART to simulated reads. Get it like this:
 #   wget https://www.niehs.nih.gov/research/resources/assets/docs/artbinmountrainier20160605linux64tgz.tgz
 #   tar xf artbinmountrainier20160605linux64tgz.tgz
 # The executable is:
 #   $PWD/art_bin_MountRainier/art_illumina
+def _check_output_shards(output_shards):
+    if output_shards < 1:
+        raise ValueError(
+            f"Number of output shards must be at least 1. Got: {output_shards}. Cannot continue"
+        )
+
+
+def reads_files_to_json(reads_files, output_shards=1, interleaved_out=None):
+    """Returns dictionary of the reads files, for the JSON file, from the
+    return value of simulate_illumina_paired_reads_from_fasta() called with
+    the same output_shards and interleaved_out. The return value has one
+    of three shapes: the string interleaved_out, if it is not None;
+    otherwise a list of (forward, reverse) filename tuples, one per shard,
+    if output_shards is more than 1; otherwise one tuple (forward reads
+    filename, reverse reads filename)"""
+    if interleaved_out is not None:
+        return {"interleaved_fastq": reads_files}
+    elif output_shards > 1:
+        return {"shards": [{"fastq1": x, "fastq2": y} for x, y in reads_files]}
+    else:
+        return {"fastq1": reads_files[0], "fastq2": reads_files[1]}
+
+
 def simulate_illumina_paired_reads_from_fasta(
     ref_fasta,
     outprefix,
@@ -20,51 +113,305 @@ def simulate_illumina_paired_reads_from_fasta(
     mean_fragment_length=500,
     fragment_length_sd=25,
     random_seed=42,
+    output_shards=1,
+    truth_vcf=None,
+    interleaved_out=None,
 ):
     """Simulates Illumina paired end reads using ART.
-    Returns tuple (forward reads filename, reverse reads filename)"""
+    Returns tuple (forward reads filename, reverse reads filename).
+    If output_shards is more than 1, then the reads are split into that many
+    pairs of files (see shard_paired_fastq). If interleaved_out is not None,
+    then the reads are written to that uncompressed interleaved FASTQ file
+    instead ("-" means stdout). The return value is different in those
+    cases - see reads_files_to_json(), which callers should use to get the
+    filenames. If truth_vcf is
+    given, it should be the VCF file made by mutate_fasta with respect to
+    the mutated genome, where ref_fasta is the mutated genome. Then a table
+    of where each read came from is also written (see the read_truth
+    module)"""
+    _check_output_shards(output_shards)
     if shutil.which("art_illumina") is None:
         raise RuntimeError("art_illumina not found in PATH. Cannot continue")
+    if output_shards > 1 and interleaved_out is not None:
+        raise ValueError(
+            "Cannot use interleaved output with more than one shard. Cannot continue"
+        )
 
-    seed_string = "" if random_seed is None else "--rndSeed " + str(random_seed)
     tmpdir = tempfile.mkdtemp(prefix=outprefix + ".", dir=os.getcwd())
     tmp_prefix = os.path.join(tmpdir, "out")
 
-    command = " ".join(
-        [
-            "art_illumina",
-            "--in",
-            ref_fasta,
-            "--out",
-            tmp_prefix,
-            "--noALN",  # do not output alignment file
-            "--seqSys",
-            sequencing_machine,
-            "--len",
-            str(read_length),
-            "--fcov",
-            str(read_depth),
-            "--mflen",
-            str(mean_fragment_length),
-            "--sdev",
-            str(fragment_length_sd),
-            seed_string,
-        ]
-    ).rstrip()
+    command = [
+        "art_illumina",
+        "--in",
+        ref_fasta,
+        "--out",
+        tmp_prefix,
+        "--seqSys",
+        sequencing_machine,
+        "--len",
+        read_length,
+        "--fcov",
+        read_depth,
+        "--mflen",
+        mean_fragment_length,
+        "--sdev",
+        fragment_length_sd,
+    ]
+    if random_seed is not None:
+        command.extend(["--rndSeed", random_seed])
+    if truth_vcf is None:
+        command.append("--noALN")  # do not output alignment file
+
+    utils.streaming_syscall(command)
+
+    if truth_vcf is not None:
+        aln_files = [tmp_prefix + "1.aln", tmp_prefix + "2.aln"]
+        truth_file = read_truth.table_filename(outprefix)
+        with utils.atomic_outputs([truth_file]) as tmp_files:
+            read_truth.write_truth_table(aln_files, truth_vcf, tmp_files[0])
+        for filename in aln_files:
+            os.unlink(filename)
+
+    if output_shards > 1 or interleaved_out is not None:
+        if interleaved_out is None:
+            reads_files = shard_paired_fastq(
+                tmp_prefix + "1.fq", tmp_prefix + "2.fq", outprefix, output_shards
+            )
+        else:
+            interleave_paired_fastq(
+                tmp_prefix + "1.fq", tmp_prefix + "2.fq", interleaved_out
+            )
+            reads_files = interleaved_out
+        for i in ("1", "2"):
+            os.unlink(tmp_prefix + i + ".fq")
+        os.rmdir(tmpdir)
+        return reads_files
 
-    utils.syscall(command)
     reads_files = []
 
     for i in ("1", "2"):
-        final_reads_file = outprefix + "." + i + ".fq"
-        os.rename(tmp_prefix + i + ".fq", final_reads_file)
-        utils.syscall("gzip -9 " + final_reads_file)
-        reads_files.append(f"{final_reads_file}.gz")
+        # Compress in the temporary directory, so the final file only
+        # appears when it is finished
+        utils.streaming_syscall(["gzip", "-9", tmp_prefix + i + ".fq"])
+        final_reads_file = f"{outprefix}.{i}.fq.gz"
+        os.replace(tmp_prefix + i + ".fq.gz", final_reads_file)
+        reads_files.append(final_reads_file)
 
     os.rmdir(tmpdir)
     return tuple(reads_files)
 
 
+def _sweep_journal(outprefix, reads_out, resume, options):
+    """Returns the journal.Journal of finished sets of reads, or None if
+    the reads are written to stdout, in which case resuming is not
+    possible. options is a dictionary of the options that are the same for
+    every set of reads (the others are in the names of the sets), which
+    must not change when resuming. The journal is deleted when all the
+    reads are finished"""
+    if reads_out == "-":
+        if resume:
+            raise ValueError("Cannot resume when writing to stdout. Cannot continue")
+        return None
+    sweep_journal = journal.Journal(journal.journal_filename(outprefix), resume=resume)
+    sweep_journal.check_options(options)
+    return sweep_journal
+
+
+def _check_one_combination(out, *option_lists):
+    if out is not None and any(len(x) != 1 for x in option_lists):
+        raise ValueError(
+            f"Only one set of reads can be simulated when writing reads to {out}. Cannot continue"
+        )
+
+
+# For estimating peak memory of simulating one set of reads. ART keeps
+# the genome and its reverse complement in memory. The long read simulator
+# keeps the genome in memory as Python strings, and briefly has two copies
+# of each sequence while it is loaded
+ART_MEMORY = 200 * 1024**2
+ART_BYTES_PER_BASE = 2
+LONG_READS_BYTES_PER_BASE = 2
+
+
+def _output_bytes(files):
+    """Returns total size of the reads files in the dictionary of one set of
+    reads for the JSON file. Files written to stdout are not counted"""
+    filenames = []
+    for key, value in files.items():
+        if key == "shards":
+            filenames.extend(f for x in value for f in x.values())
+        elif key in {"fastq", "fastq1", "fastq2", "interleaved_fastq", "truth"}:
+            filenames.append(value)
+    return sum(os.path.getsize(x) for x in filenames if x != "-")
+
+
+def _progress_reporter(name, total_bases, progress_interval, metrics_file):
+    return progress.ProgressReporter(
+        name,
+        total_bases=total_bases,
+        interval=progress_interval,
+        metrics_file=metrics_file,
+        labels={"command": "simulate_reads", "configuration": name},
+    )
+
+
+def _run_sweep(
+    units,
+    run_one,
+    sweep_journal,
+    ref_fasta,
+    outprefix,
+    memory_per_base,
+    processes=1,
+    max_memory=None,
+    progress_interval=60,
+    metrics_dir=None,
+):
+    """Runs run_one(*arguments, progress name, genome_length,
+    progress_interval, metrics_file) for each tuple (unit name, configuration name, read
+    depth, arguments) in units, skipping units that are already finished
+    in the journal. run_one returns the dictionary of one set of reads for
+    the JSON file. If processes is more than 1, units are run in parallel
+    by the scheduler module. The estimated peak memory of each unit is
+    memory_per_base(genome length), where the genome is ref_fasta.
+    Progress of the whole sweep is logged after each unit, and at most
+    every progress_interval seconds inside each unit. If metrics_dir is not
+    None, Prometheus textfiles of the progress of the sweep and of each
+    unit are written in that directory (see the progress module), named
+    using outprefix and the configuration names. Returns list of the
+    dictionaries, in the same order as units"""
+    finished = {} if sweep_journal is None else sweep_journal.finished()
+    files = [None] * len(units)
+    todo = []
+    for i, (name, _, _, arguments) in enumerate(units):
+        if name in finished:
+            logging.info(f"Already finished, skipping: {name}")
+            files[i] = finished[name]["files"]
+        else:
+            todo.append(i)
+
+    # The genome length is used for estimating the time left, but only if
+    # it is known without reading the whole genome
+    lengths = fasta_index.sequence_lengths(ref_fasta)
+    if lengths is None and processes > 1 and len(todo) > 1:
+        with fasta_index.FastaIndex(ref_fasta) as fasta_idx:
+            lengths = [fasta_idx.length(x) for x in fasta_idx.names()]
+    genome_length = None if lengths is None else sum(lengths)
+    if metrics_dir is not None:
+        os.makedirs(metrics_dir, exist_ok=True)
+
+    def metrics_file(name):
+        if metrics_dir is None:
+            return None
+        return progress.metrics_filename(metrics_dir, outprefix, name)
+
+    jobs = [
+        units[i][3]
+        + (
+            f"{os.path.basename(outprefix)}.{units[i][1]}",
+            genome_length,
+            progress_interval,
+            metrics_file(units[i][1]),
+        )
+        for i in todo
+    ]
+    total_depth = sum(units[i][2] for i in todo)
+    sweep_progress = _progress_reporter(
+        os.path.basename(outprefix) + ".all",
+        None if genome_length is None else genome_length * total_depth,
+        None,
+        metrics_file("all"),
+    )
+
+    if processes > 1 and len(todo) > 1:
+        memory = [memory_per_base(genome_length)] * len(todo)
+        results = scheduler.run_jobs(
+            run_one,
+            jobs,
+            memory,
+            processes=processes,
+            max_memory=max_memory,
+        )
+        results = ((todo[j], result) for j, result in results)
+    else:
+        results = ((i, run_one(*job)) for i, job in zip(todo, jobs))
+
+    for i, result in results:
+        files[i] = result
+        if sweep_journal is not None:
+            sweep_journal.finish(units[i][0], files=result)
+        sweep_progress.update(
+            bases=0 if genome_length is None else units[i][2] * genome_length,
+            bytes_written=_output_bytes(result),
+        )
+        sweep_progress.report()
+    sweep_progress.finish()
+
+    if sweep_journal is not None:
+        sweep_journal.remove()
+    return files
+
+
+def _simulate_one_illumina(
+    ref_fasta,
+    this_prefix,
+    machine,
+    read_len,
+    depth,
+    frag_len,
+    fragment_length_sd,
+    random_seed,
+    output_shards,
+    truth_vcf,
+    interleaved_out,
+    progress_name=None,
+    genome_length=None,
+    progress_interval=60,
+    metrics_file=None,
+):
+    reporter = _progress_reporter(
+        progress_name or os.path.basename(this_prefix),
+        None if genome_length is None else depth * genome_length,
+        progress_interval,
+        metrics_file,
+    )
+    logging.info(
+        f"Simulate reads. ref={ref_fasta}, machine={machine}, read length={read_len}, read depth={depth}, fragment length={frag_len}, fragment length sd={fragment_length_sd}"
+    )
+    reads_files = simulate_illumina_paired_reads_from_fasta(
+        ref_fasta,
+        this_prefix,
+        sequencing_machine=machine,
+        read_length=read_len,
+        read_depth=depth,
+        mean_fragment_length=frag_len,
+        fragment_length_sd=fragment_length_sd,
+        random_seed=random_seed,
+        output_shards=output_shards,
+        truth_vcf=truth_vcf,
+        interleaved_out=interleaved_out,
+    )
+
+    files = {
+        "machine": machine,
+        "read_length": read_len,
+        "read_depth": depth,
+        "fragment_length": frag_len,
+        "fragment_length_sd": fragment_length_sd,
+    }
+    files.update(reads_files_to_json(reads_files, output_shards, interleaved_out))
+    if truth_vcf is not None:
+        files["truth"] = read_truth.table_filename(this_prefix)
+    # ART does not say how far it has got, so progress is only known at
+    # the end
+    reporter.update(
+        bases=0 if genome_length is None else depth * genome_length,
+        bytes_written=_output_bytes(files),
+    )
+    reporter.finish()
+    return files
+
+
 def iterative_simulate_reads(
     ref_fasta,
     outprefix,
@@ -74,40 +421,193 @@ def iterative_simulate_reads(
     fragment_lengths,
     fragment_length_sd,
     random_seed=42,
+    output_shards=1,
+    truth_vcf=None,
+    interleaved_out=None,
+    resume=False,
+    processes=1,
+    max_memory=None,
+    progress_interval=60,
+    metrics_dir=None,
 ):
-    files = []
-
+    """Simulates reads for every combination of the options. If
+    interleaved_out is not None, there must be only one combination, and its
+    reads are written to that uncompressed interleaved FASTQ file ("-" means
+    stdout). Finished combinations are recorded in a journal (see
+    _sweep_journal), and if resume is True, the ones that finished in an
+    earlier run are skipped. If processes is more than 1, that many
+    combinations are run at the same time, limited by max_memory (see the
+    scheduler module). Progress is logged after each combination, and if
+    metrics_dir is not None, it is also written to Prometheus textfiles in
+    that directory (see _run_sweep). Returns list of dictionaries, one for
+    each combination, of the options and output files"""
+    _check_output_shards(output_shards)
+    _check_one_combination(
+        interleaved_out,
+        sequencing_machines,
+        read_lengths,
+        read_depths,
+        fragment_lengths,
+    )
+    sweep_journal = _sweep_journal(
+        outprefix,
+        interleaved_out,
+        resume,
+        {
+            "ref_fasta": ref_fasta,
+            "random_seed": random_seed,
+            "output_shards": output_shards,
+            "truth_vcf": truth_vcf,
+        },
+    )
+    units = []
     for machine, read_len, depth, frag_len in itertools.product(
         sequencing_machines, read_lengths, read_depths, fragment_lengths
     ):
-        this_prefix = (
-            f"{outprefix}.{machine}.{read_len}.{depth}.{frag_len}.{fragment_length_sd}"
-        )
-        logging.info(
-            "Simulate reads. ref={ref_fasta}, machine={machine}, read length={read_len}, read depth={depth}, fragment length={frag_len}, fragment length sd={fragment_length_sd}"
+        configuration = f"{machine}.{read_len}.{depth}.{frag_len}.{fragment_length_sd}"
+        this_prefix = f"{outprefix}.{configuration}"
+        arguments = (
+            ref_fasta,
+            this_prefix,
+            machine,
+            read_len,
+            depth,
+            frag_len,
+            fragment_length_sd,
+            random_seed,
+            output_shards,
+            truth_vcf,
+            interleaved_out,
         )
+        units.append((this_prefix, configuration, depth, arguments))
 
-        reads_files = simulate_illumina_paired_reads_from_fasta(
+    return _run_sweep(
+        units,
+        _simulate_one_illumina,
+        sweep_journal,
+        ref_fasta,
+        outprefix,
+        lambda x: scheduler.PROCESS_MEMORY + ART_MEMORY + ART_BYTES_PER_BASE * x,
+        processes=processes,
+        max_memory=max_memory,
+        progress_interval=progress_interval,
+        metrics_dir=metrics_dir,
+    )
+
+
+def _simulate_one_long(
+    ref_fasta,
+    reads_file,
+    read_len,
+    depth,
+    read_length_sd,
+    substitution_rate,
+    insertion_rate,
+    deletion_rate,
+    random_seed,
+    progress_name=None,
+    genome_length=None,
+    progress_interval=60,
+    metrics_file=None,
+):
+    reporter = _progress_reporter(
+        progress_name or os.path.basename(reads_file),
+        None if genome_length is None else depth * genome_length,
+        progress_interval,
+        metrics_file,
+    )
+    logging.info(
+        f"Simulate long reads. ref={ref_fasta}, mean read length={read_len}, read length sd={read_length_sd}, read depth={depth}"
+    )
+    with utils.atomic_outputs([reads_file]) as tmp_files:
+        long_reads.simulate_long_reads_from_fasta(
             ref_fasta,
-            this_prefix,
-            sequencing_machine=machine,
-            read_length=read_len,
+            tmp_files[0],
             read_depth=depth,
-            mean_fragment_length=frag_len,
-            fragment_length_sd=fragment_length_sd,
+            mean_read_length=read_len,
+            read_length_sd=read_length_sd,
+            substitution_rate=substitution_rate,
+            insertion_rate=insertion_rate,
+            deletion_rate=deletion_rate,
             random_seed=random_seed,
+            progress=reporter,
         )
+    reporter.finish()
+    return {
+        "fastq": reads_file,
+        "mean_read_length": read_len,
+        "read_length_sd": read_length_sd,
+        "read_depth": depth,
+        "substitution_rate": substitution_rate,
+        "insertion_rate": insertion_rate,
+        "deletion_rate": deletion_rate,
+    }
+
 
-        files.append(
-            {
-                "fastq1": reads_files[0],
-                "fastq2": reads_files[1],
-                "machine": machine,
-                "read_length": read_len,
-                "read_depth": depth,
-                "fragment_length": frag_len,
-                "fragment_length_sd": fragment_length_sd,
-            }
+def iterative_simulate_long_reads(
+    ref_fasta,
+    outprefix,
+    read_depths,
+    mean_read_lengths,
+    read_length_sd,
+    substitution_rate=0.005,
+    insertion_rate=0.0025,
+    deletion_rate=0.0025,
+    random_seed=42,
+    reads_out=None,
+    resume=False,
+    processes=1,
+    max_memory=None,
+    progress_interval=60,
+    metrics_dir=None,
+):
+    """Simulates long reads for every combination of mean read length and
+    read depth. If reads_out is not None, there must be only one
+    combination, and its reads are written to that uncompressed FASTQ file
+    ("-" means stdout). resume, processes, max_memory, progress_interval
+    and metrics_dir are the same as for iterative_simulate_reads"""
+    _check_one_combination(reads_out, mean_read_lengths, read_depths)
+    sweep_journal = _sweep_journal(
+        outprefix,
+        reads_out,
+        resume,
+        {
+            "ref_fasta": ref_fasta,
+            "random_seed": random_seed,
+            "substitution_rate": substitution_rate,
+            "insertion_rate": insertion_rate,
+            "deletion_rate": deletion_rate,
+        },
+    )
+    units = []
+    for read_len, depth in itertools.product(mean_read_lengths, read_depths):
+        configuration = f"long.{read_len}.{read_length_sd}.{depth}"
+        if reads_out is None:
+            reads_file = f"{outprefix}.{configuration}.fq.gz"
+        else:
+            reads_file = reads_out
+        arguments = (
+            ref_fasta,
+            reads_file,
+            read_len,
+            depth,
+            read_length_sd,
+            substitution_rate,
+            insertion_rate,
+            deletion_rate,
+            random_seed,
         )
+        units.append((reads_file, configuration, depth, arguments))
 
-    return files
+    return _run_sweep(
+        units,
+        _simulate_one_long,
+        sweep_journal,
+        ref_fasta,
+        outprefix,
+        lambda x: scheduler.PROCESS_MEMORY + LONG_READS_BYTES_PER_BASE * x,
+        processes=processes,
+        max_memory=max_memory,
+        progress_interval=progress_interval,
+        metrics_dir=metrics_dir,
+    )
@@ -0,0 +1,528 @@
+import abc
+import bisect
+import collections
+import itertools
+import logging
+import random
+
+from simutator import fasta_index, utils
+
+# Structural variants (inversions, tandem duplications and translocations)
+# can be megabases long, so the mutated sequences are not made as strings.
+# Instead, each mutated sequence is a list of segments, where a segment is
+# part of one of the original sequences, on the forward or reverse strand.
+# The mutated genome is written in one pass through the segments, reading
+# the original genome in chunks using random access (see the fasta_index
+# module), so memory use does not depend on the lengths of the variants.
+# The VCF files use symbolic alleles (<INV>, <DUP:TANDEM>, <DEL>) and
+# breakends (BND) for translocations.
+
+# Part of an original sequence. start and end are zero-based, end not
+# included. If reverse is True, the segment is reverse complemented
+Segment = collections.namedtuple("Segment", ["name", "start", "end", "reverse"])
+
+# One line of a VCF file, without the QUAL, FILTER, FORMAT and sample
+# columns. pos is 1-based, as in the VCF file
+VcfRecord = collections.namedtuple(
+    "VcfRecord", ["chrom", "pos", "id", "ref", "alt", "info"]
+)
+
+MUTATION_TYPES = {"inversion", "tandem_dup", "translocation"}
+CHUNK_SIZE = 1048576
+LINE_LENGTH = 60
+_COMPLEMENT = str.maketrans("ACGTRYKMBVDHNacgtrykmbvdhn", "TGCAYRMKVBHDNtgcayrmkvbhdn")
+
+VCF_HEADER_LINES = [
+    '##ALT=<ID=INV,Description="Inversion">',
+    '##ALT=<ID=DUP:TANDEM,Description="Tandem duplication">',
+    '##ALT=<ID=DEL,Description="Deletion">',
+    '##INFO=<ID=SVTYPE,Number=1,Type=String,Description="Type of structural variant">',
+    '##INFO=<ID=END,Number=1,Type=Integer,Description="End position of the variant">',
+    '##INFO=<ID=SVLEN,Number=1,Type=Integer,Description="Difference in length between REF and ALT alleles, or length of inversion">',
+    '##INFO=<ID=COPIES,Number=1,Type=Integer,Description="Number of copies of the sequence after a tandem duplication">',
+    '##INFO=<ID=MATEID,Number=1,Type=String,Description="ID of mate breakend">',
+]
+
+
+def reverse_complement(seq):
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def segments_length(segments):
+    return sum(x.end - x.start for x in segments)
+
+
+def segment_chunks(fasta_idx, segment, chunk_size=CHUNK_SIZE):
+    """Yields the sequence of a segment in chunks of at most chunk_size
+    bases, fetched from fasta_idx (a fasta_index.FastaIndex)"""
+    if segment.reverse:
+        for end in range(segment.end, segment.start, -chunk_size):
+            start = max(segment.start, end - chunk_size)
+            yield reverse_complement(fasta_idx.fetch(segment.name, start, end))
+    else:
+        for start in range(segment.start, segment.end, chunk_size):
+            end = min(segment.end, start + chunk_size)
+            yield fasta_idx.fetch(segment.name, start, end)
+
+
+def segment_starts(segments):
+    """Returns list of the start positions (zero-based) of each segment in
+    the sequence made from segments, for use with segments_base()"""
+    return list(
+        itertools.accumulate((x.end - x.start for x in segments[:-1]), initial=0)
+    )
+
+
+def segments_base(fasta_idx, segments, position, starts=None):
+    """Returns the base at position (zero-based) of the sequence made from
+    segments. starts is the output of segment_starts(segments), which is
+    made if it is None, so pass it when calling this lots of times with the
+    same segments"""
+    if starts is None:
+        starts = segment_starts(segments)
+    i = bisect.bisect_right(starts, position) - 1
+    if (
+        position < 0
+        or i < 0
+        or position >= starts[i] + segments[i].end - segments[i].start
+    ):
+        raise IndexError(f"Position {position} is past the end of segments")
+    segment = segments[i]
+    position -= starts[i]
+    if segment.reverse:
+        i = segment.end - 1 - position
+        return reverse_complement(fasta_idx.fetch(segment.name, i, i + 1))
+    i = segment.start + position
+    return fasta_idx.fetch(segment.name, i, i + 1)
+
+
+def write_segments(
+    fasta_idx,
+    name,
+    segments,
+    filehandle,
+    line_length=LINE_LENGTH,
+    chunk_size=CHUNK_SIZE,
+):
+    """Writes one FASTA record called name to filehandle, with the sequence
+    made from segments. Lines are line_length long across segment
+    boundaries, the same as pyfastaq writes them. At most one chunk of
+    sequence is in memory at a time. Returns the number of bytes written"""
+    print(">" + name, file=filehandle)
+    bytes_written = len(name) + 2
+    leftover = ""
+    for segment in segments:
+        for chunk in segment_chunks(fasta_idx, segment, chunk_size=chunk_size):
+            chunk = leftover + chunk
+            whole_lines = len(chunk) - len(chunk) % line_length
+            if whole_lines > 0:
+                print(
+                    *(
+                        chunk[i : i + line_length]
+                        for i in range(0, whole_lines, line_length)
+                    ),
+                    sep="\n",
+                    file=filehandle,
+                )
+                bytes_written += whole_lines + whole_lines // line_length
+            leftover = chunk[whole_lines:]
+    if len(leftover):
+        print(leftover, file=filehandle)
+        bytes_written += len(leftover) + 1
+    return bytes_written
+
+
+def _split_at(segments, position):
+    """Returns tuple (segments before position, segments from position)"""
+    before = []
+    after = []
+    for segment in segments:
+        length = segment.end - segment.start
+        if position <= 0:
+            after.append(segment)
+        elif position >= length:
+            before.append(segment)
+        elif segment.reverse:
+            before.append(segment._replace(start=segment.end - position))
+            after.append(segment._replace(end=segment.end - position))
+        else:
+            before.append(segment._replace(end=segment.start + position))
+            after.append(segment._replace(start=segment.start + position))
+        position -= length
+    return before, after
+
+
+class StructuralVariantMutator(metaclass=abc.ABCMeta):
+    # Name of the type of mutation, as used by batch_genome_mutator
+    mutation_type = None
+
+    @abc.abstractmethod
+    def _mutation_description_string(self):
+        pass
+
+    @abc.abstractmethod
+    def mutated_genome(self, seq_lengths, mask=None):
+        """Returns tuple (segments, variants). segments is a dictionary of
+        original sequence name -> list of Segments that make the mutated
+        sequence. variants is a list of the variants, in whatever form the
+        method _vcf_records() uses. seq_lengths is a dictionary of name ->
+        length of the original sequences"""
+        pass
+
+    @abc.abstractmethod
+    def _vcf_records(self, variant, names, base, mutated_genome=False):
+        """Returns list of VcfRecords of one variant. names is a dictionary
+        of original -> mutated sequence names, base(name, position) returns
+        the base at a zero-based position of a sequence (original, or
+        mutated if mutated_genome is True)"""
+        pass
+
+    def mutated_name(self, name):
+        return name + "__simutator__" + self._mutation_description_string()
+
+    def _write_vcf(self, filehandle, seq_lengths, records, mutated_genome=False):
+        print("##fileformat=VCFv4.2", file=filehandle)
+        genome = "mutated" if mutated_genome else "original"
+        print(
+            f"##source=simutator, ref in this file is {genome} genome. Mutations added: {self._mutation_description_string()}",
+            file=filehandle,
+        )
+        for name, length in sorted(seq_lengths.items()):
+            print(f"##contig=<ID={name},length={length}>", file=filehandle)
+        for line in VCF_HEADER_LINES:
+            print(line, file=filehandle)
+        print(
+            "#CHROM",
+            "POS",
+            "ID",
+            "REF",
+            "ALT",
+            "QUAL",
+            "FILTER",
+            "INFO",
+            "FORMAT",
+            "sample",
+            sep="\t",
+            file=filehandle,
+        )
+        for record in sorted(records, key=lambda x: (x.chrom, x.pos)):
+            print(
+                record.chrom,
+                record.pos,
+                record.id,
+                record.ref,
+                record.alt,
+                ".",
+                "PASS",
+                record.info,
+                "GT",
+                "1/1",
+                sep="\t",
+                file=filehandle,
+            )
+
+    def mutate_fasta_file(
+        self,
+        fasta_in,
+        fasta_out,
+        vcf_out_wrt_original_seq,
+        vcf_out_wrt_mutated_seq,
+        mask=None,
+        progress=None,
+    ):
+        """Adds structural variants to the genome in fasta_in, which must be
+        an uncompressed FASTA file, because it is read using random access.
+        Writes the mutated genome to fasta_out, and VCF files of the variants
+        with respect to the original and mutated genomes. Any of the output
+        files can be None, in which case that file is not written, or "-"
+        to write to stdout. If mask is not None, it should be an
+        interval_index.Mask, and variants are only put where the mask
+        allows them. If progress is not None, it is a
+        progress.ProgressReporter, which is updated after writing each
+        sequence"""
+        if fasta_in == "-" or fasta_in.endswith(".gz"):
+            raise ValueError(
+                f"Structural variants need an uncompressed FASTA file, because it is read using random access. Got: {fasta_in}. Cannot continue"
+            )
+
+        with fasta_index.FastaIndex(fasta_in) as fasta_idx:
+            seq_lengths = {x: fasta_idx.length(x) for x in fasta_idx.names()}
+            segments, variants = self.mutated_genome(seq_lengths, mask=mask)
+            names = {x: self.mutated_name(x) for x in seq_lengths}
+            logging.info(
+                f"Added {len(variants)} structural variants of type {self.mutation_type}"
+            )
+            if progress is not None:
+                progress.update(variants=len(variants))
+
+            if fasta_out is not None:
+                with utils.open_output(fasta_out) as f:
+                    for name in fasta_idx.names():
+                        bytes_written = write_segments(
+                            fasta_idx, names[name], segments[name], f
+                        )
+                        if progress is not None:
+                            progress.update(
+                                bases=seq_lengths[name],
+                                bytes_written=bytes_written,
+                                contig=name,
+                            )
+
+            if vcf_out_wrt_original_seq is not None:
+                records = []
+                for variant in variants:
+                    records.extend(
+                        self._vcf_records(
+                            variant,
+                            names,
+                            lambda name, i: fasta_idx.fetch(name, i, i + 1),
+                            mutated_genome=False,
+                        )
+                    )
+                with utils.open_output(vcf_out_wrt_original_seq) as f:
+                    self._write_vcf(f, seq_lengths, records, mutated_genome=False)
+
+            if vcf_out_wrt_mutated_seq is not None:
+                mutated_segments = {names[x]: v for x, v in segments.items()}
+                starts = {x: segment_starts(v) for x, v in mutated_segments.items()}
+                records = []
+                for variant in variants:
+                    records.extend(
+                        self._vcf_records(
+                            variant,
+                            names,
+                            lambda name, i: segments_base(
+                                fasta_idx, mutated_segments[name], i, starts[name]
+                            ),
+                            mutated_genome=True,
+                        )
+                    )
+                with utils.open_output(vcf_out_wrt_mutated_seq) as f:
+                    self._write_vcf(
+                        f,
+                        {x: segments_length(v) for x, v in mutated_segments.items()},
+                        records,
+                        mutated_genome=True,
+                    )
+
+
+class _RegularMutator(StructuralVariantMutator):
+    """Puts one variant of length variant_length every
+    distance_between_variants bases of each sequence. Variants are stored
+    as tuples (name, start, end, mutated start), where start and end are
+    zero-based, end not included, in the original sequence"""
+
+    def __init__(self, distance_between_variants, variant_length):
+        if distance_between_variants < 1 or variant_length < 1:
+            raise ValueError(
+                f"Distance between variants and variant length must be positive. Got: {distance_between_variants}, {variant_length}. Cannot continue"
+            )
+        self.distance_between_mutations = distance_between_variants
+        self.variant_length = variant_length
+
+    @abc.abstractmethod
+    def _variant_segments(self, name, start, end):
+        """Returns list of Segments that replace start to end of a sequence"""
+        pass
+
+    def mutated_genome(self, seq_lengths, mask=None):
+        segments = {}
+        variants = []
+        for name, length in seq_lengths.items():
+            contig_mask = None if mask is None else mask.get_contig(name)
+            contig_segments = []
+            previous_end = 0
+            length_change = 0
+            start = self.distance_between_mutations
+            while start + self.variant_length < length:
+                end = start + self.variant_length
+                # The base before the variant is the VCF padding base, so
+                # is included when checking the mask
+                if contig_mask is None or contig_mask.allowed(start - 1, end):
+                    contig_segments.append(Segment(name, previous_end, start, False))
+                    new_segments = self._variant_segments(name, start, end)
+                    contig_segments.extend(new_segments)
+                    variants.append((name, start, end, start + length_change))
+                    length_change += segments_length(new_segments) - (end - start)
+                    previous_end = end
+                start = end + self.distance_between_mutations
+            contig_segments.append(Segment(name, previous_end, length, False))
+            segments[name] = [x for x in contig_segments if x.start < x.end]
+        return segments, variants
+
+
+class InversionMutator(_RegularMutator):
+    mutation_type = "inversion"
+
+    def _mutation_description_string(self):
+        return (
+            f"INV_length_{self.variant_length}_every_{self.distance_between_mutations}"
+        )
+
+    def _variant_segments(self, name, start, end):
+        return [Segment(name, start, end, True)]
+
+    def _vcf_records(self, variant, names, base, mutated_genome=False):
+        name, start, end, mutated_start = variant
+        if mutated_genome:
+            name = names[name]
+            start, end = mutated_start, mutated_start + end - start
+        return [
+            VcfRecord(
+                name,
+                start,
+                ".",
+                base(name, start - 1),
+                "<INV>",
+                f"SVTYPE=INV;END={end};SVLEN={end - start}",
+            )
+        ]
+
+
+class TandemDuplicationMutator(_RegularMutator):
+    mutation_type = "tandem_dup"
+
+    def __init__(self, distance_between_variants, variant_length, copies=2):
+        super().__init__(distance_between_variants, variant_length)
+        if copies < 2:
+            raise ValueError(
+                f"Number of copies of tandem duplications must be at least 2. Got: {copies}. Cannot continue"
+            )
+        self.copies = copies
+
+    def _mutation_description_string(self):
+        return f"DUP_length_{self.variant_length}_copies_{self.copies}_every_{self.distance_between_mutations}"
+
+    def _variant_segments(self, name, start, end):
+        return [Segment(name, start, end, False)] * self.copies
+
+    def _vcf_records(self, variant, names, base, mutated_genome=False):
+        name, start, end, mutated_start = variant
+        added = (end - start) * (self.copies - 1)
+        if mutated_genome:
+            # The extra copies are deleted to get back to the original
+            name = names[name]
+            start = mutated_start + end - start
+            return [
+                VcfRecord(
+                    name,
+                    start,
+                    ".",
+                    base(name, start - 1),
+                    "<DEL>",
+                    f"SVTYPE=DEL;END={start + added};SVLEN={-added}",
+                )
+            ]
+        return [
+            VcfRecord(
+                name,
+                start,
+                ".",
+                base(name, start - 1),
+                "<DUP:TANDEM>",
+                f"SVTYPE=DUP;END={end};SVLEN={added};COPIES={self.copies}",
+            )
+        ]
+
+
+class TranslocationMutator(StructuralVariantMutator):
+    """Makes reciprocal translocations between pairs of different sequences.
+    Each sequence is in at most one translocation. The pairs of sequences
+    and the breakpoints are chosen at random. A translocation between
+    sequences A and B, with breakpoints a and b, makes the sequences
+    A[:a] + B[b:] and B[:b] + A[a:], which are named after A and B.
+    Variants are stored as tuples (ID, name A, a, name B, b)"""
+
+    mutation_type = "translocation"
+
+    def __init__(self, number_of_translocations, seed=None):
+        if number_of_translocations < 1:
+            raise ValueError(
+                f"Number of translocations must be positive. Got: {number_of_translocations}. Cannot continue"
+            )
+        self.number_of_translocations = number_of_translocations
+        self.rng = random.Random(seed)
+
+    def _mutation_description_string(self):
+        return f"TRA_{self.number_of_translocations}"
+
+    def _breakpoint(self, name, length, mask, tries=100):
+        """Returns random breakpoint in the sequence, or None if one could
+        not be found that the mask allows"""
+        contig_mask = None if mask is None else mask.get_contig(name)
+        for _ in range(tries):
+            position = self.rng.randrange(1, length)
+            if contig_mask is None or contig_mask.allowed(position - 1, position + 1):
+                return position
+        return None
+
+    def mutated_genome(self, seq_lengths, mask=None):
+        segments = {x: [Segment(x, 0, v, False)] for x, v in seq_lengths.items()}
+        breakpoints = {}
+        for name in sorted(seq_lengths):
+            if seq_lengths[name] > 1:
+                position = self._breakpoint(name, seq_lengths[name], mask)
+                if position is not None:
+                    breakpoints[name] = position
+        names = sorted(breakpoints)
+        self.rng.shuffle(names)
+        if len(names) < 2 * self.number_of_translocations:
+            logging.warning(
+                f"Only enough sequences for {len(names) // 2} translocations, but {self.number_of_translocations} were asked for"
+            )
+
+        variants = []
+        for i in range(min(self.number_of_translocations, len(names) // 2)):
+            name_a, name_b = sorted(names[2 * i : 2 * i + 2])
+            a, b = breakpoints[name_a], breakpoints[name_b]
+            a_start, a_end = _split_at(segments[name_a], a)
+            b_start, b_end = _split_at(segments[name_b], b)
+            segments[name_a] = a_start + b_end
+            segments[name_b] = b_start + a_end
+            variants.append((f"TRA{i + 1}", name_a, a, name_b, b))
+        return segments, variants
+
+    def _vcf_records(self, variant, names, base, mutated_genome=False):
+        # Four breakends: A:a is joined to B:b+1, and B:b to A:a+1. The
+        # mutated genome has the same breakpoints, because swapping the
+        # ends back again gets the original genome
+        variant_id, name_a, a, name_b, b = variant
+        if mutated_genome:
+            name_a, name_b = names[name_a], names[name_b]
+        ids = [f"{variant_id}_{i}" for i in range(1, 5)]
+        before_a, after_a = base(name_a, a - 1), base(name_a, a)
+        before_b, after_b = base(name_b, b - 1), base(name_b, b)
+        return [
+            VcfRecord(
+                name_a,
+                a,
+                ids[0],
+                before_a,
+                f"{before_a}[{name_b}:{b + 1}[",
+                f"SVTYPE=BND;MATEID={ids[1]}",
+            ),
+            VcfRecord(
+                name_b,
+                b + 1,
+                ids[1],
+                after_b,
+                f"]{name_a}:{a}]{after_b}",
+                f"SVTYPE=BND;MATEID={ids[0]}",
+            ),
+            VcfRecord(
+                name_b,
+                b,
+                ids[2],
+                before_b,
+                f"{before_b}[{name_a}:{a + 1}[",
+                f"SVTYPE=BND;MATEID={ids[3]}",
+            ),
+            VcfRecord(
+                name_a,
+                a + 1,
+                ids[3],
+                after_a,
+                f"]{name_b}:{b}]{after_a}",
+                f"SVTYPE=BND;MATEID={ids[2]}",
+            ),
+        ]
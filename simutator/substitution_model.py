@@ -0,0 +1,110 @@
+import itertools
+
+BASES = ["A", "C", "G", "T"]
+TRANSITIONS = {"A": "G", "C": "T", "G": "A", "T": "C"}
+
+
+class SubstitutionModel:
+    """Chooses the new base of each SNP. weights is a dictionary of
+    dictionaries, where weights[x][y] is the relative chance that base x
+    is changed to base y. Weights of a base changing to itself are
+    ignored. If weights is None, all three other bases are equally likely.
+    The weights are turned into lookup tables of alternative bases and
+    their cumulative weights, one table per base"""
+
+    def __init__(self, weights=None):
+        self.uniform = weights is None
+        self.alternatives = {b: [x for x in BASES if x != b] for b in BASES}
+        self.cumulative_weights = {}
+        if weights is None:
+            return
+
+        for ref in BASES:
+            ref_weights = [
+                weights.get(ref, {}).get(x, 0) for x in self.alternatives[ref]
+            ]
+            if any(x < 0 for x in ref_weights) or sum(ref_weights) <= 0:
+                raise ValueError(
+                    f"Substitution weights from base {ref} must be non-negative, and at least one must be positive. Got: {ref_weights}"
+                )
+            self.cumulative_weights[ref] = list(itertools.accumulate(ref_weights))
+
+    @classmethod
+    def from_ts_tv(cls, ts_tv_ratio):
+        """Returns model where transitions are ts_tv_ratio times as likely as
+        transversions. Both transversions from a base are equally likely"""
+        if ts_tv_ratio <= 0:
+            raise ValueError(
+                f"Transition/transversion ratio must be positive. Got: {ts_tv_ratio}"
+            )
+        return cls(
+            {
+                ref: {
+                    x: 2 * ts_tv_ratio if x == TRANSITIONS[ref] else 1
+                    for x in BASES
+                    if x != ref
+                }
+                for ref in BASES
+            }
+        )
+
+    @classmethod
+    def from_matrix_file(cls, filename):
+        """Returns model made from a file of a 4x4 matrix. Each line has a
+        base, followed by the weights of changing that base to A, C, G, T.
+        Lines starting with # are ignored"""
+        weights = {}
+        with open(filename) as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    continue
+                fields = line.split()
+                try:
+                    weights[fields[0].upper()] = {
+                        base: float(x) for base, x in zip(BASES, fields[1:5])
+                    }
+                    assert len(fields) == 5
+                except (AssertionError, ValueError):
+                    raise ValueError(
+                        f"Error parsing this line of substitution matrix file {filename}: {line}"
+                    )
+        if sorted(weights) != BASES:
+            raise ValueError(
+                f"Substitution matrix file must have one line for each of A, C, G, T: {filename}"
+            )
+        return cls(weights)
+
+    def mutate_base(self, ref, rng):
+        """Returns a new base for ref, which must be one of A, C, G, T,
+        using random number generator rng"""
+        if self.uniform:
+            return rng.choice(self.alternatives[ref])
+        return rng.choices(
+            self.alternatives[ref], cum_weights=self.cumulative_weights[ref]
+        )[0]
+
+    def mutate_bases(self, refs, rng):
+        """Returns list of new bases, one for each base in refs (each one
+        must be one of A, C, G, T), using random number generator rng. When
+        the model is not uniform, all the new bases for each ref base are
+        drawn in one batch"""
+        if self.uniform:
+            # Same random numbers as calling mutate_base for each base,
+            # so that the output is the same as older versions
+            return [rng.choice(self.alternatives[x]) for x in refs]
+
+        indexes = {b: [] for b in BASES}
+        for i, ref in enumerate(refs):
+            indexes[ref].append(i)
+        new_bases = [None] * len(refs)
+        for ref in BASES:
+            if len(indexes[ref]) == 0:
+                continue
+            chosen = rng.choices(
+                self.alternatives[ref],
+                cum_weights=self.cumulative_weights[ref],
+                k=len(indexes[ref]),
+            )
+            for i, base in zip(indexes[ref], chosen):
+                new_bases[i] = base
+        return new_bases
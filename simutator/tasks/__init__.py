@@ -1,3 +1,3 @@
-__all__ = ["mutate_fasta", "simulate_reads"]
+__all__ = ["evaluate", "liftover", "materialize", "mutate_fasta", "simulate_reads"]
 
 from simutator.tasks import *
@@ -0,0 +1,11 @@
+from simutator import evaluate
+
+
+def run(options):
+    evaluate.evaluate_vcf_to_json(
+        options.truth_vcf,
+        options.calls_vcf,
+        options.json_out,
+        ref_fasta=options.ref_fasta,
+        include_filtered=options.include_filtered,
+    )
@@ -0,0 +1,11 @@
+import logging
+
+from simutator import liftover
+
+
+def run(options):
+    lift = liftover.Liftover.from_file(options.liftover_in)
+    failed = lift.lift_bed_file(
+        options.bed_in, options.bed_out, to_original=options.to_original
+    )
+    logging.info(f"Number of BED lines that could not be lifted: {failed}")
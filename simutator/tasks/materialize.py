@@ -0,0 +1,7 @@
+from simutator import delta
+
+
+def run(options):
+    delta.materialize_fasta(
+        options.fasta_in, options.delta_in, options.fasta_out, regions=options.region
+    )
@@ -3,6 +3,29 @@ from simutator import batch_genome_mutator
 
 def run(options):
     mutations = batch_genome_mutator.mutations_from_options(options)
+    substitution = batch_genome_mutator.substitution_model_from_options(options)
     batch_genome_mutator.run_all_mutations(
-        options.fasta_in, options.outprefix, mutations, seed=options.seed
+        options.fasta_in,
+        options.outprefix,
+        mutations,
+        seed=options.seed,
+        delta_only=options.delta,
+        liftover=options.liftover,
+        table_format=options.table,
+        write_vcf=not options.no_vcf,
+        pipelined=options.pipeline,
+        reference_cache=True if options.reference_cache else None,
+        include_bed=options.include_bed,
+        exclude_bed=options.exclude_bed,
+        regions=batch_genome_mutator.regions_from_options(options),
+        regions_full_genome=options.regions_full_genome,
+        processes=options.processes,
+        substitution=substitution,
+        fasta_out=options.fasta_out,
+        vcf_original_out=options.vcf_original,
+        vcf_mutated_out=options.vcf_mutated,
+        resume=options.resume,
+        max_memory=options.max_memory,
+        progress_interval=options.progress_interval,
+        metrics_dir=options.metrics_dir,
     )
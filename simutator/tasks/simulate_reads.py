@@ -1,18 +1,76 @@
+import contextlib
 import json
 
-from simutator import simulate_reads
+from simutator import simulate_reads, utils
 
 
 def run(options):
-    data = simulate_reads.iterative_simulate_reads(
-        options.fasta_in,
-        options.outprefix,
-        options.machine,
-        options.read_length,
-        options.read_depth,
-        options.fragment_length,
-        options.fragment_length_sd,
-        random_seed=options.seed,
-    )
-    with open(options.outprefix + ".json", "w") as f:
-        json.dump(data, f, indent=2, sort_keys=True)
+    if options.long_reads:
+        if options.output_shards != 1:
+            raise ValueError(
+                "--output_shards cannot be used with --long_reads. Cannot continue"
+            )
+        if options.truth_vcf is not None:
+            raise ValueError(
+                "--truth_vcf cannot be used with --long_reads. Cannot continue"
+            )
+
+    reads_out = "-" if options.stdout else None
+    with contextlib.ExitStack() as stack:
+        if options.fasta_in == "-":
+            # ART needs a file, and the genome is read once per set of reads
+            ref_fasta = stack.enter_context(
+                utils.stdin_to_file(options.outprefix + ".tmp.stdin.fa")
+            )
+        else:
+            ref_fasta = options.fasta_in
+
+        if options.long_reads:
+            try:
+                sub_rate, ins_rate, del_rate = [
+                    float(x) for x in options.long_read_errors.split(":")
+                ]
+            except:
+                raise ValueError(
+                    f"Cannot parse --long_read_errors option: '{options.long_read_errors}'"
+                )
+            data = simulate_reads.iterative_simulate_long_reads(
+                ref_fasta,
+                options.outprefix,
+                options.read_depth,
+                options.long_read_length,
+                options.long_read_length_sd,
+                substitution_rate=sub_rate,
+                insertion_rate=ins_rate,
+                deletion_rate=del_rate,
+                random_seed=options.seed,
+                reads_out=reads_out,
+                resume=options.resume,
+                processes=options.processes,
+                max_memory=options.max_memory,
+                progress_interval=options.progress_interval,
+                metrics_dir=options.metrics_dir,
+            )
+        else:
+            data = simulate_reads.iterative_simulate_reads(
+                ref_fasta,
+                options.outprefix,
+                options.machine,
+                options.read_length,
+                options.read_depth,
+                options.fragment_length,
+                options.fragment_length_sd,
+                random_seed=options.seed,
+                output_shards=options.output_shards,
+                truth_vcf=options.truth_vcf,
+                interleaved_out=reads_out,
+                resume=options.resume,
+                processes=options.processes,
+                max_memory=options.max_memory,
+                progress_interval=options.progress_interval,
+                metrics_dir=options.metrics_dir,
+            )
+    json_file = options.outprefix + ".json"
+    with utils.atomic_outputs([json_file]) as tmp_files:
+        with open(tmp_files[0], "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
@@ -1,6 +1,13 @@
+import asyncio
+import collections
+import contextlib
 import logging
+import os
+import queue
+import shutil
 import subprocess
 import sys
+import threading
 
 
 def syscall(command, allow_fail=False):
@@ -27,3 +34,293 @@ def syscall(command, allow_fail=False):
     logging.info(f"stdout:\n{completed_process.stdout.rstrip()}")
     logging.info(f"stderr:\n{completed_process.stderr.rstrip()}")
     return completed_process
+
+
+# Output of commands is read in chunks of this many bytes. A line that is
+# longer than this (eg a progress bar updated using carriage returns) is
+# logged in pieces, instead of making StreamReader.readline() fail
+STREAM_CHUNK_SIZE = 65536
+
+
+async def _log_stream(stream, name, last_lines):
+    def log_line(line):
+        line = line.decode(errors="replace").rstrip()
+        if line:
+            last_lines.append(line)
+            logging.info(f"{name}: {line}")
+
+    partial_line = b""
+    while True:
+        chunk = await stream.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        lines = (partial_line + chunk).replace(b"\r", b"\n").split(b"\n")
+        partial_line = lines.pop()
+        for line in lines:
+            log_line(line)
+        if len(partial_line) >= STREAM_CHUNK_SIZE:
+            log_line(partial_line)
+            partial_line = b""
+    log_line(partial_line)
+
+
+async def async_syscall(command, allow_fail=False, timeout=None):
+    """Runs a command, logging each line of its stdout and stderr as soon as
+    it is written, instead of storing all the output. command can be a list
+    of arguments, in which case no shell is used, or a string that is run
+    using the shell. Kills the command if it takes longer than timeout
+    seconds, or if this coroutine is cancelled. Returns a
+    subprocess.CompletedProcess, where stdout and stderr are None"""
+    if isinstance(command, str):
+        command_string = command
+        process = await asyncio.create_subprocess_shell(
+            command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    else:
+        command = [str(x) for x in command]
+        command_string = " ".join(command)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise RuntimeError(f"Command not found: {command[0]}. Cannot continue")
+    logging.info(f"Run command (pid {process.pid}): {command_string}")
+    last_lines = collections.deque(maxlen=20)
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                _log_stream(process.stdout, f"{process.pid} stdout", last_lines),
+                _log_stream(process.stderr, f"{process.pid} stderr", last_lines),
+                process.wait(),
+            ),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise RuntimeError(
+            f"Timeout after {timeout} seconds running command: {command_string}"
+        )
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+
+    logging.info(f"Return code (pid {process.pid}): {process.returncode}")
+    if (not allow_fail) and process.returncode != 0:
+        print("Error running this command:", command_string, file=sys.stderr)
+        print("Return code:", process.returncode, file=sys.stderr)
+        print(
+            "Last lines of output from stdout and stderr:",
+            *last_lines,
+            sep="\n",
+            file=sys.stderr,
+        )
+        raise RuntimeError("Error in system call. Cannot continue")
+
+    return subprocess.CompletedProcess(command, process.returncode)
+
+
+async def _run_with_semaphore(semaphore, command, allow_fail, timeout):
+    async with semaphore:
+        return await async_syscall(command, allow_fail=allow_fail, timeout=timeout)
+
+
+async def async_syscalls(commands, max_concurrent=1, allow_fail=False, timeout=None):
+    """Runs the commands, with at most max_concurrent running at the same
+    time. If a command fails, the others are cancelled. Returns list of
+    subprocess.CompletedProcess, in the same order as the commands"""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    tasks = [
+        asyncio.ensure_future(
+            _run_with_semaphore(semaphore, command, allow_fail, timeout)
+        )
+        for command in commands
+    ]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def streaming_syscall(command, allow_fail=False, timeout=None):
+    """Same as async_syscall, but blocks until the command has finished"""
+    return asyncio.run(async_syscall(command, allow_fail=allow_fail, timeout=timeout))
+
+
+def streaming_syscalls(commands, max_concurrent=1, allow_fail=False, timeout=None):
+    """Same as async_syscalls, but blocks until the commands have finished"""
+    return asyncio.run(
+        async_syscalls(
+            commands,
+            max_concurrent=max_concurrent,
+            allow_fail=allow_fail,
+            timeout=timeout,
+        )
+    )
+
+
+def format_memory(n):
+    """Returns number of bytes n as a string such as 1.5G, using units that
+    are powers of 1024"""
+    for power, unit in ((4, "T"), (3, "G"), (2, "M"), (1, "K")):
+        if n >= 1024**power:
+            return f"{n / 1024**power:.1f}{unit}"
+    return str(n)
+
+
+@contextlib.contextmanager
+def open_output(filename, mode="w"):
+    """Opens filename for writing. If filename is "-", then stdout is used
+    instead, which is flushed but not closed at the end"""
+    if filename == "-":
+        f = sys.stdout.buffer if "b" in mode else sys.stdout
+        try:
+            yield f
+        finally:
+            f.flush()
+    else:
+        with open(filename, mode) as f:
+            yield f
+
+
+def tmp_filename(filename):
+    """Returns the temporary filename used by atomic_outputs"""
+    return filename + ".tmp"
+
+
+@contextlib.contextmanager
+def atomic_outputs(filenames):
+    """Use this to write files so that they only have their final name once
+    they are complete. Yields list of temporary filenames to write instead
+    of filenames. When the with block finishes without an error, each
+    temporary file is renamed to its final name. None and "-" (ie stdout)
+    are not changed. If there is an error, the temporary files are left,
+    so that writing them can be continued"""
+    tmp_filenames = [x if x in {None, "-"} else tmp_filename(x) for x in filenames]
+    yield tmp_filenames
+    for filename, tmp_name in zip(filenames, tmp_filenames):
+        if tmp_name != filename and os.path.exists(tmp_name):
+            os.replace(tmp_name, filename)
+
+
+@contextlib.contextmanager
+def stdin_to_file(filename):
+    """Copies everything from stdin to filename, which is deleted at the
+    end. Use this when stdin is needed as a file, for example because it
+    is read more than once, or by another program"""
+    with open(filename, "wb") as f:
+        shutil.copyfileobj(sys.stdin.buffer, f)
+    try:
+        yield filename
+    finally:
+        os.unlink(filename)
+
+
+_END_OF_QUEUE = object()
+
+
+def prefetch_iterator(iterable, queue_size=2):
+    """Iterates over iterable in a background thread, keeping up to
+    queue_size items ready. Use this so that reading the next item from a
+    file happens at the same time as processing the current item. If this
+    generator is closed early (or the code using it raises an exception),
+    the background thread stops and closes iterable, if it has a close()
+    method (eg it is a generator reading a file)"""
+    item_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Returns False if stopped before there was room in the queue
+        while not stop.is_set():
+            try:
+                item_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    break
+            else:
+                put((_END_OF_QUEUE, None))
+        except Exception as error:
+            put((None, error))
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = item_queue.get()
+            if error is not None:
+                raise error
+            if item is _END_OF_QUEUE:
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class BackgroundWriter:
+    """Wraps an open file, so that calls to write() put the data in a queue
+    and return straight away. A background thread writes the data to the
+    file. The queue holds at most queue_size items, so that memory use is
+    bounded if writing is slower than making the data"""
+
+    def __init__(self, filehandle, queue_size=4):
+        self.filehandle = filehandle
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self._consumer, daemon=True)
+        self.thread.start()
+
+    def _consumer(self):
+        while True:
+            data = self.queue.get()
+            if data is _END_OF_QUEUE:
+                self.queue.task_done()
+                break
+            if self.error is None:
+                try:
+                    self.filehandle.write(data)
+                except Exception as error:
+                    self.error = error
+            self.queue.task_done()
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(data)
+
+    def flush(self):
+        """Waits until everything in the queue has been written, then
+        flushes the file"""
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+        self.filehandle.flush()
+
+    def close(self):
+        self.queue.put(_END_OF_QUEUE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
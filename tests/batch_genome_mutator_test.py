@@ -1,8 +1,11 @@
+import argparse
+import filecmp
+import gzip
 import os
 import pytest
 import shutil
 
-from simutator import batch_genome_mutator
+from simutator import batch_genome_mutator, scheduler
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(this_dir, "data", "batch_genome_mutator")
@@ -33,6 +36,45 @@ def test_parse_complex_option_string():
     assert got == expect
 
 
+def test_parse_random_option_string():
+    with pytest.raises(Exception):
+        batch_genome_mutator._parse_random_option_string("totally_unexpected")
+
+    got = batch_genome_mutator._parse_random_option_string(
+        "0.001:0.0001:0.0002:10,0.01:0:0:1"
+    )
+    expect = [
+        {"snp": 0.001, "ins": 0.0001, "del": 0.0002, "max_indel_len": 10},
+        {"snp": 0.01, "ins": 0.0, "del": 0.0, "max_indel_len": 1},
+    ]
+    assert got == expect
+
+
+def test_parse_tandem_dups_option_string():
+    with pytest.raises(ValueError):
+        batch_genome_mutator._parse_tandem_dups_option_string("100:10")
+    got = batch_genome_mutator._parse_tandem_dups_option_string("100:10:2,50:5:3")
+    expect = [
+        {"dist": 100, "len": 10, "copies": 2},
+        {"dist": 50, "len": 5, "copies": 3},
+    ]
+    assert got == expect
+
+
+def test_regions_from_options():
+    options = argparse.Namespace(regions=None)
+    assert batch_genome_mutator.regions_from_options(options) is None
+    options.regions = " chr1:1,000-2,000;chr2  chr3:5-10; "
+    assert batch_genome_mutator.regions_from_options(options) == [
+        "chr1:1,000-2,000",
+        "chr2",
+        "chr3:5-10",
+    ]
+    options.regions = " ; "
+    with pytest.raises(ValueError):
+        batch_genome_mutator.regions_from_options(options)
+
+
 def test_run_all_mutations():
     infile = os.path.join(data_dir, "run_all_mutations.fa")
     mutations = {
@@ -42,6 +84,7 @@ def test_run_all_mutations():
         "complex": [
             {"dist": 500, "len": 20, "snp": 2, "ins": 3, "del": 4, "max_indel_len": 5}
         ],
+        "random": [{"snp": 0.01, "ins": 0.001, "del": 0.001, "max_indel_len": 3}],
     }
     outdir = "tmp.run_all_mutations"
     if os.path.exists(outdir):
@@ -56,6 +99,7 @@ def test_run_all_mutations():
             "complex.del-4.dist-500.ins-3.len-20.max_indel_len-5.snp-2",
             "del.dist-250.len-5",
             "ins.dist-200.len-10",
+            "random.del-0.001.ins-0.001.max_indel_len-3.snp-0.01",
             "snp.dist-200",
             "snp.dist-300",
         ]
@@ -66,3 +110,273 @@ def test_run_all_mutations():
             assert os.path.exists(f"{prefix}.{suffix}")
 
     shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_delta_only():
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_delta_only"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    outprefix = os.path.join(outdir, "out")
+    batch_genome_mutator.run_all_mutations(
+        infile, outprefix, {"snp": [{"dist": 100}]}, delta_only=True
+    )
+    prefix = f"{outprefix}.snp.dist-100"
+    for suffix in "delta", "delta.idx", "mutated.vcf", "original.vcf":
+        assert os.path.exists(f"{prefix}.{suffix}")
+    assert not os.path.exists(f"{prefix}.fa")
+    shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_table_no_vcf():
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_table_no_vcf"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    outprefix = os.path.join(outdir, "out")
+    batch_genome_mutator.run_all_mutations(
+        infile,
+        outprefix,
+        {"insertion": [{"dist": 100, "len": 2}]},
+        table_format="tsv",
+        write_vcf=False,
+    )
+    prefix = f"{outprefix}.insertion.dist-100.len-2"
+    assert os.path.exists(f"{prefix}.fa")
+    assert os.path.exists(f"{prefix}.mutations.tsv.gz")
+    assert not os.path.exists(f"{prefix}.original.vcf")
+    assert not os.path.exists(f"{prefix}.mutated.vcf")
+    shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_include_and_exclude_bed():
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_include_and_exclude_bed"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    outprefix = os.path.join(outdir, "out")
+    include_bed = os.path.join(outdir, "include.bed")
+    with open(include_bed, "w") as f:
+        print("1", 200, 600, sep="\t", file=f)
+    exclude_bed = os.path.join(outdir, "exclude.bed")
+    with open(exclude_bed, "w") as f:
+        print("1", 300, 400, sep="\t", file=f)
+    batch_genome_mutator.run_all_mutations(
+        infile,
+        outprefix,
+        {"snp": [{"dist": 10}]},
+        include_bed=include_bed,
+        exclude_bed=exclude_bed,
+    )
+    with open(f"{outprefix}.snp.dist-10.original.vcf") as f:
+        positions = [int(x.split("\t")[1]) - 1 for x in f if not x.startswith("#")]
+    assert positions == list(range(209, 300, 10)) + list(range(409, 600, 10))
+    shutil.rmtree(outdir)
+
+
+def test_estimate_memory():
+    lengths = [1000000, 2000000]
+    snp = batch_genome_mutator.estimate_memory("snp", {"dist": 100}, lengths)
+    assert snp == scheduler.PROCESS_MEMORY + 4 * 2000000 + 30000 * 302
+    complex_mutation = {
+        "dist": 100,
+        "len": 20,
+        "snp": 2,
+        "ins": 3,
+        "del": 4,
+        "max_indel_len": 5,
+    }
+    assert batch_genome_mutator.estimate_memory(
+        "complex", complex_mutation, lengths
+    ) > batch_genome_mutator.estimate_memory("snp", {"dist": 100}, lengths)
+    inversion = batch_genome_mutator.estimate_memory(
+        "inversion", {"dist": 100, "len": 1000000}, lengths
+    )
+    assert inversion < snp
+    random_mutation = {"snp": 0.01, "ins": 0.001, "del": 0.001, "max_indel_len": 3}
+    assert batch_genome_mutator.expected_mutations(
+        "random", random_mutation, 1000000
+    ) == (12000, 5)
+
+
+def test_run_all_mutations_processes():
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_processes"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    mutations = {
+        "snp": [{"dist": 100}, {"dist": 50}],
+        "deletion": [{"dist": 100, "len": 2}],
+        "complex": [
+            {"dist": 100, "len": 10, "snp": 2, "del": 1, "ins": 1, "max_indel_len": 3}
+        ],
+    }
+    serial_prefix = os.path.join(outdir, "serial")
+    batch_genome_mutator.run_all_mutations(infile, serial_prefix, mutations, seed=1)
+    parallel_prefix = os.path.join(outdir, "parallel")
+    batch_genome_mutator.run_all_mutations(
+        infile, parallel_prefix, mutations, seed=1, processes=3
+    )
+    assert not os.path.exists(f"{parallel_prefix}.tmp.simutator_cache")
+    # Memory limit is less than any job, so they run one at a time
+    limited_prefix = os.path.join(outdir, "limited")
+    batch_genome_mutator.run_all_mutations(
+        infile, limited_prefix, mutations, seed=1, processes=3, max_memory=1
+    )
+    serial_files = sorted(x for x in os.listdir(outdir) if x.startswith("serial."))
+    assert len(serial_files) == 12
+    for filename in serial_files:
+        parallel_file = os.path.join(outdir, "parallel" + filename[len("serial") :])
+        assert filecmp.cmp(os.path.join(outdir, filename), parallel_file, shallow=False)
+        limited_file = os.path.join(outdir, "limited" + filename[len("serial") :])
+        assert filecmp.cmp(os.path.join(outdir, filename), limited_file, shallow=False)
+    shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_structural_variants():
+    outdir = "tmp.run_all_mutations_structural_variants"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    # Copy the input, because an index file is made next to it
+    infile = os.path.join(outdir, "in.fa")
+    shutil.copyfile(os.path.join(data_dir, "run_all_mutations.fa"), infile)
+    outprefix = os.path.join(outdir, "out")
+    mutations = {
+        "inversion": [{"dist": 100, "len": 20}],
+        "tandem_dup": [{"dist": 100, "len": 10, "copies": 2}],
+        "snp": [{"dist": 100}],
+    }
+    with pytest.raises(ValueError):
+        batch_genome_mutator.run_all_mutations(
+            infile, outprefix, mutations, delta_only=True
+        )
+    metrics_dir = os.path.join(outdir, "metrics")
+    batch_genome_mutator.run_all_mutations(
+        infile, outprefix, mutations, seed=1, processes=2, metrics_dir=metrics_dir
+    )
+    assert sorted(os.listdir(metrics_dir)) == [
+        "out.inversion.dist-100.len-20.prom",
+        "out.snp.dist-100.prom",
+        "out.tandem_dup.copies-2.dist-100.len-10.prom",
+    ]
+    with open(os.path.join(metrics_dir, "out.snp.dist-100.prom")) as f:
+        assert "simutator_finished{" in f.read()
+    for prefix in [
+        "out.inversion.dist-100.len-20",
+        "out.tandem_dup.copies-2.dist-100.len-10",
+        "out.snp.dist-100",
+    ]:
+        for suffix in ["fa", "original.vcf", "mutated.vcf"]:
+            assert os.path.exists(os.path.join(outdir, f"{prefix}.{suffix}"))
+    assert not os.path.exists(outprefix + ".journal")
+    shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_output_filenames():
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_output_filenames"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    outprefix = os.path.join(outdir, "out")
+    fasta_out = os.path.join(outdir, "mutated.fa")
+    vcf_out = os.path.join(outdir, "mutated.vcf")
+    with pytest.raises(ValueError):
+        batch_genome_mutator.run_all_mutations(
+            infile,
+            outprefix,
+            {"snp": [{"dist": 100}, {"dist": 50}]},
+            fasta_out=fasta_out,
+        )
+    with pytest.raises(ValueError):
+        batch_genome_mutator.run_all_mutations(
+            infile,
+            outprefix,
+            {"snp": [{"dist": 100}]},
+            fasta_out="-",
+            vcf_mutated_out="-",
+        )
+    batch_genome_mutator.run_all_mutations(
+        infile,
+        outprefix,
+        {"snp": [{"dist": 100}]},
+        seed=1,
+        fasta_out=fasta_out,
+        vcf_mutated_out=vcf_out,
+    )
+    assert sorted(os.listdir(outdir)) == [
+        "mutated.fa",
+        "mutated.vcf",
+        "out.snp.dist-100.original.vcf",
+    ]
+    shutil.rmtree(outdir)
+
+
+def test_run_all_mutations_resume(monkeypatch):
+    infile = os.path.join(data_dir, "run_all_mutations.fa")
+    outdir = "tmp.run_all_mutations_resume"
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.mkdir(outdir)
+    mutations = {
+        "snp": [{"dist": 100}, {"dist": 50}],
+        "complex": [
+            {"dist": 100, "len": 10, "snp": 2, "del": 1, "ins": 1, "max_indel_len": 3}
+        ],
+    }
+    expect_prefix = os.path.join(outdir, "expect")
+    batch_genome_mutator.run_all_mutations(
+        infile, expect_prefix, mutations, seed=1, table_format="tsv"
+    )
+    expect_files = sorted(x for x in os.listdir(outdir))
+    assert len(expect_files) == 12
+
+    # Stop while making the second mutated genome
+    run_one_mutation = batch_genome_mutator._run_one_mutation
+    calls = []
+
+    def stop_at_second_mutation(mutation_type, mutation, **kwargs):
+        calls.append((mutation_type, mutation))
+        if calls == [("snp", {"dist": 100}), ("snp", {"dist": 50})]:
+            raise RuntimeError("stopped")
+        return run_one_mutation(mutation_type, mutation, **kwargs)
+
+    outprefix = os.path.join(outdir, "out")
+    with monkeypatch.context() as m:
+        m.setattr(batch_genome_mutator, "_run_one_mutation", stop_at_second_mutation)
+        with pytest.raises(RuntimeError):
+            batch_genome_mutator.run_all_mutations(
+                infile, outprefix, mutations, seed=1, table_format="tsv"
+            )
+        assert os.path.exists(f"{outprefix}.journal")
+        assert len([x for x in os.listdir(outdir) if x.startswith("out.")]) == 5
+
+        # Resuming with different options is not allowed
+        with pytest.raises(ValueError):
+            batch_genome_mutator.run_all_mutations(
+                infile, outprefix, mutations, seed=2, table_format="tsv", resume=True
+            )
+
+        calls.clear()
+        batch_genome_mutator.run_all_mutations(
+            infile, outprefix, mutations, seed=1, table_format="tsv", resume=True
+        )
+        assert calls == [("snp", {"dist": 50}), ("complex", mutations["complex"][0])]
+
+    got_files = sorted(x for x in os.listdir(outdir) if x.startswith("out."))
+    assert got_files == ["out" + x[len("expect") :] for x in expect_files]
+    for filename in expect_files:
+        got_file = os.path.join(outdir, "out" + filename[len("expect") :])
+        if filename.endswith(".gz"):
+            with gzip.open(got_file) as f1, gzip.open(
+                os.path.join(outdir, filename)
+            ) as f2:
+                assert f1.read() == f2.read()
+        else:
+            assert filecmp.cmp(os.path.join(outdir, filename), got_file, shallow=False)
+    shutil.rmtree(outdir)
@@ -0,0 +1,88 @@
+import os
+import pytest
+import shutil
+
+import pyfastaq
+
+from simutator import delta, genome_mutator
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "delta")
+
+
+def test_parse_region_string():
+    assert delta.parse_region_string("seq1") == ("seq1", None, None)
+    assert delta.parse_region_string("seq1:11-20") == ("seq1", 10, 20)
+    assert delta.parse_region_string("seq:1:1,001-2,000") == ("seq:1", 1000, 2000)
+    with pytest.raises(ValueError):
+        delta.parse_region_string("seq1:20-11")
+
+
+def test_mutated_segments():
+    mutations = [
+        genome_mutator.Mutation(2, 2, "A", "T"),
+        genome_mutator.Mutation(5, 5, "CGT", "C"),
+        genome_mutator.Mutation(10, 8, "G", "GAA"),
+    ]
+    got = list(delta.mutated_segments(mutations, 15))
+    expect = [
+        (0, 2, 0, None),
+        (2, 3, None, "T"),
+        (3, 5, 3, None),
+        (5, 6, None, "C"),
+        (6, 8, 8, None),
+        (8, 11, None, "GAA"),
+        (11, 15, 11, None),
+    ]
+    assert got == expect
+    assert list(delta.mutated_segments([], 15)) == [(0, 15, 0, None)]
+
+
+@pytest.mark.parametrize(
+    "mutator",
+    [
+        genome_mutator.SnpMutator(30, seed=42),
+        genome_mutator.DeletionMutator(50, 3, seed=42),
+        genome_mutator.InsertionMutator(50, 4, seed=42),
+        genome_mutator.ComplexMutator(100, 20, 2, 2, 2, 3, seed=42),
+    ],
+)
+def test_mutate_and_materialize(mutator):
+    tmpdir = "tmp.delta_mutate_and_materialize"
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.mkdir(tmpdir)
+    # Copy the input FASTA, so that the .fai file gets made in the tmp dir
+    shutil.copy(os.path.join(data_dir, "genome.fa"), tmpdir)
+    fasta_in = os.path.join(tmpdir, "genome.fa")
+    expect_fa = os.path.join(tmpdir, "expect.fa")
+    delta_file = os.path.join(tmpdir, "out.delta")
+    vcf_original = os.path.join(tmpdir, "out.original.vcf")
+    vcf_mutated = os.path.join(tmpdir, "out.mutated.vcf")
+    mutator.mutate_fasta_file(
+        fasta_in, expect_fa, vcf_original, vcf_mutated, delta_out=delta_file
+    )
+    expect_seqs = {}
+    pyfastaq.tasks.file_to_dict(expect_fa, expect_seqs)
+    expect_seqs = {k: v.seq for k, v in expect_seqs.items()}
+
+    got_fa = os.path.join(tmpdir, "got.fa")
+    delta.materialize_fasta(fasta_in, delta_file, got_fa)
+    got_seqs = {}
+    pyfastaq.tasks.file_to_dict(got_fa, got_seqs)
+    assert {k: v.seq for k, v in got_seqs.items()} == expect_seqs
+
+    seq1 = [x for x in expect_seqs if x.startswith("seq1_")][0]
+    seq2 = [x for x in expect_seqs if x.startswith("seq2_")][0]
+    seq2_length = len(expect_seqs[seq2])
+    regions = ["seq1:42-451", f"{seq2}:1-10", "seq2:400-10000"]
+    delta.materialize_fasta(fasta_in, delta_file, got_fa, regions=regions)
+    got_seqs = {}
+    pyfastaq.tasks.file_to_dict(got_fa, got_seqs)
+    expect = {
+        f"{seq1}:42-451": expect_seqs[seq1][41:451],
+        f"{seq2}:1-10": expect_seqs[seq2][:10],
+        f"{seq2}:400-{seq2_length}": expect_seqs[seq2][399:],
+    }
+    assert {k: v.seq for k, v in got_seqs.items()} == expect
+    shutil.rmtree(tmpdir)
@@ -0,0 +1,113 @@
+import json
+import os
+import pytest
+import shutil
+
+from simutator import evaluate
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "evaluate")
+
+
+def test_normalize():
+    assert evaluate.normalize("x", 10, "A", "C") == (10, "A", "C")
+    assert evaluate.normalize("x", 10, "acgt", "aggt") == (11, "C", "G")
+    assert evaluate.normalize("x", 10, "ACC", "AC") == (10, "AC", "A")
+    assert evaluate.normalize("x", 10, "TACG", "TCG") == (10, "TA", "T")
+
+    ref_bases = lambda name, position: "ACGTAAAAAC"[position]
+    assert evaluate.normalize("x", 6, "AA", "A", ref_bases=ref_bases) == (
+        3,
+        "TA",
+        "T",
+    )
+    assert evaluate.normalize("x", 7, "A", "AA", ref_bases=ref_bases) == (
+        3,
+        "T",
+        "TA",
+    )
+    assert evaluate.normalize("x", 1, "C", "G", ref_bases=ref_bases) == (1, "C", "G")
+
+
+def test_variant_type():
+    assert evaluate.variant_type("A", "C") == "SNP"
+    assert evaluate.variant_type("A", "AC") == "INS"
+    assert evaluate.variant_type("AC", "A") == "DEL"
+    assert evaluate.variant_type("AC", "GT") == "COMPLEX"
+    assert evaluate.variant_type("A", "CT") == "COMPLEX"
+
+
+def test_evaluate_vcf():
+    truth_vcf = os.path.join(data_dir, "truth.vcf")
+    calls_vcf = os.path.join(data_dir, "calls.vcf")
+    got = evaluate.evaluate_vcf(truth_vcf, calls_vcf)
+    # Without the reference, the left-shifted deletion call does not match
+    assert got["ALL"] == {
+        "TP_truth": 2,
+        "FN": 2,
+        "TP_call": 3,
+        "FP": 2,
+        "recall": 0.5,
+        "precision": 0.6,
+    }
+    assert got["DEL"]["FN"] == 1
+    assert got["DEL"]["FP"] == 1
+    assert got["COMPLEX"]["TP_truth"] == 1
+    assert got["SNP"]["TP_call"] == 2
+    assert got["INS"]["FN"] == 1
+
+    tmp_ref = "tmp.evaluate_vcf.ref.fa"
+    shutil.copy(os.path.join(data_dir, "ref.fa"), tmp_ref)
+    tmp_json = "tmp.evaluate_vcf.json"
+    got = evaluate.evaluate_vcf_to_json(
+        truth_vcf, calls_vcf, tmp_json, ref_fasta=tmp_ref
+    )
+    with open(tmp_json) as f:
+        assert json.load(f) == got
+    os.unlink(tmp_json)
+    os.unlink(tmp_ref)
+    os.unlink(tmp_ref + ".fai")
+    assert got["ALL"] == {
+        "TP_truth": 3,
+        "FN": 1,
+        "TP_call": 4,
+        "FP": 1,
+        "recall": 0.75,
+        "precision": 0.8,
+    }
+    assert got["DEL"]["TP_truth"] == 1
+    assert got["DEL"]["TP_call"] == 1
+
+    got = evaluate.evaluate_vcf(truth_vcf, calls_vcf, include_filtered=True)
+    assert got["SNP"]["FP"] == 2
+
+
+def test_evaluate_vcf_unsorted():
+    tmp_vcf = "tmp.evaluate_vcf_unsorted.vcf"
+    with open(tmp_vcf, "w") as f:
+        print("seq1", 10, ".", "A", "C", ".", "PASS", ".", sep="\t", file=f)
+        print("seq1", 5, ".", "A", "C", ".", "PASS", ".", sep="\t", file=f)
+    with pytest.raises(ValueError):
+        evaluate.evaluate_vcf(os.path.join(data_dir, "truth.vcf"), tmp_vcf)
+    os.unlink(tmp_vcf)
+
+
+def test_evaluate_vcf_self_with_ref():
+    # The two deletions are in the same run of A's, so both normalize to the
+    # same variant. Each one should match one call
+    tmp_vcf = "tmp.evaluate_vcf_self_with_ref.vcf"
+    with open(tmp_vcf, "w") as f:
+        print("seq1", 3, ".", "G", "T", ".", "PASS", ".", sep="\t", file=f)
+        print("seq1", 9, ".", "AA", "A", ".", "PASS", ".", sep="\t", file=f)
+        print("seq1", 12, ".", "AA", "A", ".", "PASS", ".", sep="\t", file=f)
+    tmp_ref = "tmp.evaluate_vcf_self_with_ref.ref.fa"
+    shutil.copy(os.path.join(data_dir, "ref.fa"), tmp_ref)
+    got = evaluate.evaluate_vcf(tmp_vcf, tmp_vcf, ref_fasta=tmp_ref)
+    assert got["ALL"]["TP_truth"] == 3
+    assert got["ALL"]["TP_call"] == 3
+    assert got["ALL"]["FN"] == 0
+    assert got["ALL"]["FP"] == 0
+    assert got["DEL"]["TP_truth"] == 2
+    os.unlink(tmp_vcf)
+    os.unlink(tmp_ref)
+    os.unlink(tmp_ref + ".fai")
@@ -0,0 +1,64 @@
+import filecmp
+import os
+import pytest
+
+from simutator import fasta_index
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "fasta_index")
+
+
+def test_build_fai():
+    infile = os.path.join(data_dir, "index.fa")
+    expect = os.path.join(data_dir, "index.fa.fai.expect")
+    tmp_fai = "tmp.build_fai.fai"
+    fasta_index.build_fai(infile, tmp_fai)
+    assert filecmp.cmp(tmp_fai, expect, shallow=False)
+    os.unlink(tmp_fai)
+
+
+def test_build_fai_bad_line_lengths():
+    tmp_fa = "tmp.build_fai_bad_line_lengths.fa"
+    with open(tmp_fa, "w") as f:
+        print(">seq", "ACG", "ACGT", "A", sep="\n", file=f)
+    with pytest.raises(ValueError):
+        fasta_index.build_fai(tmp_fa, tmp_fa + ".fai")
+    os.unlink(tmp_fa)
+
+
+def test_sequence_lengths():
+    tmp_fa = "tmp.sequence_lengths.fa"
+    with open(tmp_fa, "w") as f:
+        print(">seq1", "ACGT", "A", ">seq2", "AC", sep="\n", file=f)
+    assert fasta_index.sequence_lengths(tmp_fa) is None
+    fasta_index.build_fai(tmp_fa, tmp_fa + ".fai")
+    assert fasta_index.sequence_lengths(tmp_fa) == [5, 2]
+    os.utime(tmp_fa, (0, os.path.getmtime(tmp_fa + ".fai") + 10))
+    assert fasta_index.sequence_lengths(tmp_fa) is None
+    os.unlink(tmp_fa)
+    os.unlink(tmp_fa + ".fai")
+
+
+def test_FastaIndex():
+    infile = os.path.join(data_dir, "index.fa")
+    tmp_fai = "tmp.FastaIndex.fai"
+    with fasta_index.FastaIndex(infile, fai_file=tmp_fai) as fasta_idx:
+        assert fasta_idx.names() == ["seq1", "seq2", "seq3"]
+        assert "seq2" in fasta_idx
+        assert "seq4" not in fasta_idx
+        assert fasta_idx.length("seq1") == 12
+        assert fasta_idx.fetch("seq1") == "ACGTACGTACGT"
+        assert fasta_idx.fetch("seq1", 3, 8) == "TACGT"
+        assert fasta_idx.fetch("seq1", 4, 5) == "A"
+        assert fasta_idx.fetch("seq1", 5, 5) == ""
+        assert fasta_idx.fetch("seq1", 10, 100) == "GT"
+        assert fasta_idx.fetch("seq2", 2) == "ccggtt"
+        assert fasta_idx.fetch("seq3", 0, 3) == "NNN"
+        tmp_out = "tmp.FastaIndex.copy_sequence"
+        with open(tmp_out, "wb") as f:
+            fasta_idx.copy_sequence("seq1", f)
+            fasta_idx.copy_sequence("seq2", f)
+        with open(tmp_out) as f:
+            assert f.read() == "ACGTA\nCGTAC\nGT\naacc\nggtt\n"
+        os.unlink(tmp_out)
+    os.unlink(tmp_fai)
@@ -1,10 +1,11 @@
 import filecmp
 import os
+import random
 import pytest
 
 import pyfastaq
 
-from simutator import genome_mutator
+from simutator import genome_mutator, interval_index, progress
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(this_dir, "data", "genome_mutator")
@@ -140,10 +141,12 @@ def test_ComplexMutator_mutate_sequence():
     got_mutations, got_sequence = mutator.mutate_sequence(sequence)
     print(got_sequence)
     assert sequence.seq == original_seq
-    assert got_sequence == "abcdefghijklmnopqrstAuwAyabTdefghijklmnTqCtTuvwxyzabcdefgh"
+    # SNPs are only made at A, C, G, T (upper or lower case). The other
+    # letters are left unchanged
+    assert got_sequence == "abcdefghijklmnopqrstAuwxyabTdefghijklmnopqrAtuvxyzabcdefgh"
     expect_mutations = [
-        genome_mutator.Mutation(19, 19, "tuvwxyzabc", "tAuwAyabT"),
-        genome_mutator.Mutation(39, 38, "nopqrstuvw", "nTqCtTuvw"),
+        genome_mutator.Mutation(19, 19, "tuvwxyzabc", "tAuwxyabT"),
+        genome_mutator.Mutation(39, 38, "nopqrstuvw", "nopqrAtuv"),
     ]
     assert got_mutations == expect_mutations
 
@@ -166,3 +169,356 @@ def test_ComplexMutator_mutate_fasta_file():
     os.unlink(tmp_out_fa)
     os.unlink(tmp_out_vcf_ref)
     os.unlink(tmp_out_vcf_mutated)
+
+
+def test_mutate_fasta_file_pipelined():
+    infile = os.path.join(data_dir, "ComplexMutator_mutate_fasta.in.fa")
+    expected_fa = os.path.join(data_dir, "ComplexMutator_mutate_fasta.out.fa")
+    expected_vcf_ref = os.path.join(data_dir, "ComplexMutator_mutate_fasta.out.ref.vcf")
+    expected_vcf_mutated = os.path.join(
+        data_dir, "ComplexMutator_mutate_fasta.out.mutated.vcf"
+    )
+    mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=42)
+    tmp_out_fa = "tmp.mutate_fasta_file_pipelined.out.fa"
+    tmp_out_vcf_ref = "tmp.mutate_fasta_file_pipelined.out.ref.vcf"
+    tmp_out_vcf_mutated = "tmp.mutate_fasta_file_pipelined.out.mutated.vcf"
+    mutator.mutate_fasta_file(
+        infile, tmp_out_fa, tmp_out_vcf_ref, tmp_out_vcf_mutated, pipelined=True
+    )
+    assert filecmp.cmp(tmp_out_fa, expected_fa, shallow=False)
+    assert filecmp.cmp(tmp_out_vcf_ref, expected_vcf_ref, shallow=False)
+    assert filecmp.cmp(tmp_out_vcf_mutated, expected_vcf_mutated, shallow=False)
+    os.unlink(tmp_out_fa)
+    os.unlink(tmp_out_vcf_ref)
+    os.unlink(tmp_out_vcf_mutated)
+
+
+def test_mutate_sequence_with_mask():
+    mask = interval_index.Mask(exclude=interval_index.IntervalIndex())
+    mask.exclude.contigs["name"] = interval_index.ContigIntervals.from_intervals(
+        [(4, 7)]
+    )
+    mask = mask.get_contig("name")
+
+    mutator = genome_mutator.SnpMutator(3, seed=42)
+    sequence = pyfastaq.sequences.Fasta("name", "AGTAGGCAG")
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence, mask=mask)
+    assert got_sequence == "AGGAGGCAG"
+    assert got_mutations == [genome_mutator.Mutation(2, 2, "T", "G")]
+
+    mutator = genome_mutator.DeletionMutator(3, 1)
+    sequence = pyfastaq.sequences.Fasta("name", "1234567890ABCDE")
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence, mask=mask)
+    assert got_sequence == "12456780ACDE"
+    assert got_mutations == [
+        genome_mutator.Mutation(1, 1, "23", "2"),
+        genome_mutator.Mutation(7, 6, "89", "8"),
+        genome_mutator.Mutation(10, 8, "AB", "A"),
+    ]
+
+    mutator = genome_mutator.InsertionMutator(3, 1, seed=42)
+    sequence = pyfastaq.sequences.Fasta("name", "1234567890ABCDE")
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence, mask=mask)
+    assert [x.original_position for x in got_mutations] == [2, 8]
+    got_sequence = got_sequence[:3] + got_sequence[4:10] + got_sequence[11:]
+    assert got_sequence == "1234567890ABCDE"
+
+    mutator = genome_mutator.ComplexMutator(3, 2, 1, 0, 0, 1, seed=42)
+    sequence = pyfastaq.sequences.Fasta("name", "AAAAAAAAAAAAAAA")
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence, mask=mask)
+    assert [x.original_position for x in got_mutations] == [2, 8, 11]
+    assert got_sequence[4:8] == "AAAA"
+
+
+def test_mutate_fasta_regions():
+    infile = "tmp.mutate_fasta_regions.in.fa"
+    seqs = [
+        pyfastaq.sequences.Fasta("seq1", "ACGTACGTAC" * 10),
+        pyfastaq.sequences.Fasta("seq2", "AAAAACCCCCGGGGGTTTTT" * 2),
+    ]
+    with open(infile, "w") as f:
+        for seq in seqs:
+            print(seq, file=f)
+        # A sequence with line lengths that would be changed if it was
+        # parsed and written again, to check it is copied unchanged
+        print(">seq3", "ACGTA", "CGTAC", "G", sep="\n", file=f)
+    tmp_prefix = "tmp.mutate_fasta_regions.out"
+    mutator = genome_mutator.SnpMutator(5)
+    suffix = "__simutator__" + mutator._mutation_description_string()
+
+    mutator.mutate_fasta_regions(
+        infile,
+        ["seq1:21-40", "seq1:61-70"],
+        f"{tmp_prefix}.fa",
+        f"{tmp_prefix}.original.vcf",
+        f"{tmp_prefix}.mutated.vcf",
+    )
+    got_seqs = {}
+    pyfastaq.tasks.file_to_dict(f"{tmp_prefix}.fa", got_seqs)
+    assert sorted(got_seqs) == [f"seq1:21-40{suffix}", f"seq1:61-70{suffix}"]
+    with open(f"{tmp_prefix}.original.vcf") as f:
+        got_orig = [x.split("\t")[:2] for x in f if not x.startswith("#")]
+    assert got_orig == [
+        ["seq1", "25"],
+        ["seq1", "30"],
+        ["seq1", "35"],
+        ["seq1", "65"],
+    ]
+    with open(f"{tmp_prefix}.mutated.vcf") as f:
+        got_mut = [x.split("\t")[:2] for x in f if not x.startswith("#")]
+    assert got_mut == [
+        [f"seq1:21-40{suffix}", "5"],
+        [f"seq1:21-40{suffix}", "10"],
+        [f"seq1:21-40{suffix}", "15"],
+        [f"seq1:61-70{suffix}", "5"],
+    ]
+
+    mutator.mutate_fasta_regions(
+        infile,
+        ["seq1:61-70", "seq1:21-40"],
+        f"{tmp_prefix}.fa",
+        f"{tmp_prefix}.original.vcf",
+        f"{tmp_prefix}.mutated.vcf",
+        full_genome=True,
+    )
+    with open(f"{tmp_prefix}.fa") as f:
+        assert f.read().endswith(f">seq3{suffix}\nACGTA\nCGTAC\nG\n")
+    got_seqs = {}
+    pyfastaq.tasks.file_to_dict(f"{tmp_prefix}.fa", got_seqs)
+    assert got_seqs[f"seq2{suffix}"].seq == seqs[1].seq
+    got_seq1 = got_seqs[f"seq1{suffix}"].seq
+    with open(f"{tmp_prefix}.original.vcf") as f:
+        got_orig = [int(x.split("\t")[1]) - 1 for x in f if not x.startswith("#")]
+    assert got_orig == [24, 29, 34, 64]
+    for i, (original, mutated) in enumerate(zip(seqs[0].seq, got_seq1)):
+        assert (original != mutated) == (i in got_orig)
+
+    with pytest.raises(ValueError):
+        mutator.mutate_fasta_regions(
+            infile, ["seq1:21-40", "seq1:31-50"], None, None, None
+        )
+    with pytest.raises(ValueError):
+        mutator.mutate_fasta_regions(infile, ["seq4"], None, None, None)
+
+    for filename in ["fa", "original.vcf", "mutated.vcf"]:
+        os.unlink(f"{tmp_prefix}.{filename}")
+    os.unlink(infile)
+    os.unlink(infile + ".fai")
+
+
+def test_SnpMutator_skips_non_acgt():
+    mutator = genome_mutator.SnpMutator(2, seed=42)
+    sequence = pyfastaq.sequences.Fasta("name", "ANANAcAtATA")
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence)
+    assert [x.original_position for x in got_mutations] == [5, 7]
+    assert [x.original_seq for x in got_mutations] == ["C", "T"]
+    assert got_sequence[:5] == "ANANA"
+    assert got_sequence[6] == "A"
+    assert got_sequence[8:] == "ATA"
+
+
+def test_RandomMutator_mutate_sequence():
+    with pytest.raises(ValueError):
+        genome_mutator.RandomMutator(0.5, 0.3, 0.2, 5)
+    with pytest.raises(ValueError):
+        genome_mutator.RandomMutator(-0.1, 0, 0, 5)
+
+    random_seq = random.Random(1)
+    original_seq = "".join(random_seq.choices("ACGT", k=100000))
+    original_seq = original_seq[:500] + "N" * 1000 + original_seq[1500:]
+    sequence = pyfastaq.sequences.Fasta("name", original_seq)
+    mutator = genome_mutator.RandomMutator(0.005, 0.001, 0.002, 5, seed=42)
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence)
+    assert sequence.seq == original_seq
+    mutator = genome_mutator.RandomMutator(0.005, 0.001, 0.002, 5, seed=42)
+    assert mutator.mutate_sequence(sequence) == (got_mutations, got_sequence)
+
+    counts = {"snp": 0, "ins": 0, "del": 0}
+    previous_end = 0
+    length_change = 0
+    for mutation in got_mutations:
+        assert mutation.original_position >= previous_end
+        assert mutation.new_position == mutation.original_position + length_change
+        assert not 500 <= mutation.original_position < 1500
+        ref, alt = mutation.original_seq, mutation.new_seq
+        pos = mutation.original_position
+        assert original_seq[pos : pos + len(ref)] == ref
+        new_pos = mutation.new_position
+        assert got_sequence[new_pos : new_pos + len(alt)] == alt
+        if len(ref) == len(alt):
+            counts["snp"] += 1
+            assert ref != alt
+        elif len(ref) < len(alt):
+            counts["ins"] += 1
+            assert alt[0] == ref and len(alt) <= 6
+        else:
+            counts["del"] += 1
+            assert ref[0] == alt and len(ref) <= 6
+        previous_end = pos + len(ref)
+        length_change += len(alt) - len(ref)
+    assert len(got_sequence) == len(original_seq) + length_change
+    assert 400 < counts["snp"] < 600
+    assert 60 < counts["ins"] < 140
+    assert 140 < counts["del"] < 260
+
+    mask = interval_index.Mask(exclude=interval_index.IntervalIndex())
+    mask.exclude.contigs["name"] = interval_index.ContigIntervals.from_intervals(
+        [(0, 50000)]
+    )
+    got_mutations, _ = mutator.mutate_sequence(sequence, mask.get_contig("name"))
+    assert len(got_mutations) > 0
+    assert min(x.original_position for x in got_mutations) >= 50000
+
+
+def test_RandomMutator_mutate_sequence_keeps_case():
+    original_seq = "".join(random.Random(2).choices("acgt", k=10000))
+    sequence = pyfastaq.sequences.Fasta("name", original_seq)
+    mutator = genome_mutator.RandomMutator(0, 0.005, 0.005, 5, seed=42)
+    got_mutations, got_sequence = mutator.mutate_sequence(sequence)
+    assert len(got_mutations) > 0
+    expect = []
+    previous_end = 0
+    for mutation in got_mutations:
+        ref, alt = mutation.original_seq, mutation.new_seq
+        pos = mutation.original_position
+        assert ref == original_seq[pos : pos + len(ref)].upper()
+        expect.append(original_seq[previous_end:pos])
+        expect.append(original_seq[pos] + alt[1:])
+        previous_end = pos + len(ref)
+    expect.append(original_seq[previous_end:])
+    assert got_sequence == "".join(expect)
+
+
+def test_mutated_sequences():
+    infile = os.path.join(data_dir, "SnpMutator_mutate_fasta.in.fa")
+    expected_fa = os.path.join(data_dir, "SnpMutator_mutate_fasta.out.fa")
+    expected_vcf_ref = os.path.join(data_dir, "SnpMutator_mutate_fasta.out.ref.vcf")
+    expected_seqs = {}
+    pyfastaq.tasks.file_to_dict(expected_fa, expected_seqs)
+
+    # Input from file, no writers
+    mutator = genome_mutator.SnpMutator(30, seed=42)
+    got = list(mutator.mutated_sequences(infile))
+    assert len(got) == len(expected_seqs)
+    for contig in got:
+        assert contig.mutated_seq == expected_seqs[contig.mutated_seq.id]
+        assert len(contig.mutations) > 0
+
+    # Input from (name, sequence) tuples, and only ask for the first one
+    in_seqs = {}
+    pyfastaq.tasks.file_to_dict(infile, in_seqs)
+    in_seqs = [(x.id, x.seq) for x in in_seqs.values()]
+    mutator = genome_mutator.SnpMutator(30, seed=42)
+    generator = mutator.mutated_sequences(x for x in in_seqs)
+    contig_id, mutated_seq, mutations, original_length = next(generator)
+    assert (contig_id, original_length) == (in_seqs[0][0], len(in_seqs[0][1]))
+    assert mutated_seq == expected_seqs[mutated_seq.id]
+
+    # Using writers gives the same files as mutate_fasta_file
+    tmp_out_fa = "tmp.mutated_sequences.out.fa"
+    tmp_out_vcf_ref = "tmp.mutated_sequences.out.ref.vcf"
+    mutator = genome_mutator.SnpMutator(30, seed=42)
+    with genome_mutator.FastaWriter(tmp_out_fa) as fa_writer:
+        with genome_mutator.MutationFilesWriter(
+            mutator, tmp_out_vcf_ref, None
+        ) as files_writer:
+            got = mutator.mutated_sequences(infile, writers=[fa_writer, files_writer])
+            assert len(list(got)) == len(expected_seqs)
+    assert filecmp.cmp(tmp_out_fa, expected_fa, shallow=False)
+    assert filecmp.cmp(tmp_out_vcf_ref, expected_vcf_ref, shallow=False)
+    os.unlink(tmp_out_fa)
+    os.unlink(tmp_out_vcf_ref)
+
+
+def test_mutate_fasta_file_progress():
+    infile = os.path.join(data_dir, "SnpMutator_mutate_fasta.in.fa")
+    tmp_out_fa = "tmp.mutate_fasta_file_progress.fa"
+    reporter = progress.ProgressReporter("test", interval=None)
+    mutator = genome_mutator.SnpMutator(30, seed=42)
+    mutator.mutate_fasta_file(infile, tmp_out_fa, None, None, progress=reporter)
+    seqs = {}
+    pyfastaq.tasks.file_to_dict(infile, seqs)
+    assert reporter.bases == sum(len(x) for x in seqs.values())
+    assert reporter.contigs == len(seqs)
+    assert reporter.variants > 0
+    assert reporter.bytes_written == os.path.getsize(tmp_out_fa)
+    os.unlink(tmp_out_fa)
+
+
+def test_mutate_fasta_file_resume_from_checkpoint(monkeypatch):
+    tmp_prefix = "tmp.mutate_fasta_file_resume_from_checkpoint"
+    infile = f"{tmp_prefix}.in.fa"
+    pyfastaq.tasks.make_random_contigs(5, 500, infile)
+    outfiles = [f"{tmp_prefix}.{x}" for x in ("fa", "original.vcf", "mutated.vcf")]
+    checkpoint = f"{tmp_prefix}.checkpoint"
+    mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=42)
+    expect_reporter = progress.ProgressReporter("expect", interval=None)
+    mutator.mutate_fasta_file(
+        infile, *[x + ".expect" for x in outfiles], progress=expect_reporter
+    )
+
+    # Stop while mutating the fourth sequence, then resume
+    mutate_sequence = genome_mutator.ComplexMutator.mutate_sequence
+    calls = []
+
+    def stop_at_fourth_sequence(self, sequence, mask=None):
+        calls.append(sequence.id)
+        if len(calls) == 4:
+            raise RuntimeError("stopped")
+        return mutate_sequence(self, sequence, mask=mask)
+
+    with monkeypatch.context() as m:
+        m.setattr(
+            genome_mutator.ComplexMutator, "mutate_sequence", stop_at_fourth_sequence
+        )
+        mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=42)
+        with pytest.raises(RuntimeError):
+            mutator.mutate_fasta_file(
+                infile, *outfiles, checkpoint=checkpoint, checkpoint_bases=1
+            )
+    assert not os.path.exists(outfiles[1])
+
+    # Use a different seed, to check the random state is loaded from the
+    # checkpoint. Progress includes the sequences done before stopping
+    mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=1)
+    reporter = progress.ProgressReporter("test", total_bases=2500, interval=None)
+    mutator.mutate_fasta_file(
+        infile, *outfiles, checkpoint=checkpoint, checkpoint_bases=1, progress=reporter
+    )
+    assert reporter.resumed_bases == 1500
+    assert reporter.bases == 2500
+    assert reporter.contigs == 5
+    assert reporter.variants == expect_reporter.variants
+    assert reporter.bytes_written == os.path.getsize(outfiles[0])
+    for filename in outfiles:
+        assert filecmp.cmp(filename, filename + ".expect", shallow=False)
+        os.unlink(filename)
+    os.unlink(checkpoint)
+
+    # If the FASTA file is shorter than at the last checkpoint (eg the
+    # machine crashed before it was written to disk), start again
+    with monkeypatch.context() as m:
+        calls.clear()
+        m.setattr(
+            genome_mutator.ComplexMutator, "mutate_sequence", stop_at_fourth_sequence
+        )
+        mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=42)
+        with pytest.raises(RuntimeError):
+            mutator.mutate_fasta_file(
+                infile, *outfiles, checkpoint=checkpoint, checkpoint_bases=1
+            )
+    tmp_fasta = outfiles[0]
+    with pytest.raises(ValueError):
+        with genome_mutator.FastaWriter(tmp_fasta, resume_bytes=1000000):
+            pass
+    os.truncate(tmp_fasta, 10)
+    mutator = genome_mutator.ComplexMutator(30, 10, 2, 2, 1, 2, seed=42)
+    mutator.mutate_fasta_file(
+        infile, *outfiles, checkpoint=checkpoint, checkpoint_bases=1
+    )
+    for filename in outfiles:
+        assert filecmp.cmp(filename, filename + ".expect", shallow=False)
+        os.unlink(filename)
+        os.unlink(filename + ".expect")
+    os.unlink(checkpoint)
+    os.unlink(infile)
@@ -0,0 +1,67 @@
+import os
+
+from simutator import interval_index
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "interval_index")
+
+
+def test_ContigIntervals_from_intervals():
+    intervals = interval_index.ContigIntervals.from_intervals(
+        [(10, 20), (5, 12), (30, 40), (40, 45), (50, 50)]
+    )
+    assert list(intervals.starts) == [5, 30]
+    assert list(intervals.ends) == [20, 45]
+    assert len(intervals) == 2
+
+
+def test_ContigIntervals_overlaps_and_contains():
+    intervals = interval_index.ContigIntervals.from_intervals([(5, 20), (30, 45)])
+    assert not intervals.overlaps(0, 5)
+    assert intervals.overlaps(0, 6)
+    assert intervals.overlaps(19, 21)
+    assert not intervals.overlaps(20, 30)
+    assert intervals.overlaps(20, 31)
+    assert not intervals.overlaps(45, 50)
+    assert not intervals.contains(4, 6)
+    assert intervals.contains(5, 6)
+    assert intervals.contains(5, 20)
+    assert not intervals.contains(5, 21)
+    assert not intervals.contains(19, 31)
+    assert intervals.contains(44, 45)
+    assert not intervals.contains(45, 46)
+
+
+def test_IntervalIndex_from_bed():
+    index = interval_index.IntervalIndex.from_bed(
+        os.path.join(data_dir, "intervals.bed")
+    )
+    assert sorted(index.contigs) == ["chr1", "chr2"]
+    assert list(index.contigs["chr1"].starts) == [5, 30]
+    assert list(index.contigs["chr1"].ends) == [20, 45]
+    assert index.get_contig("chr2 description") is index.contigs["chr2"]
+    assert index.get_contig("chr3") is None
+
+
+def test_Mask():
+    include = interval_index.IntervalIndex()
+    include.contigs["chr1"] = interval_index.ContigIntervals.from_intervals([(0, 100)])
+    exclude = interval_index.IntervalIndex()
+    exclude.contigs["chr1"] = interval_index.ContigIntervals.from_intervals([(10, 20)])
+    exclude.contigs["chr2"] = interval_index.ContigIntervals.from_intervals([(10, 20)])
+
+    mask = interval_index.Mask(exclude=exclude).get_contig("chr1")
+    assert mask.allowed(9, 10)
+    assert not mask.allowed(9, 11)
+    assert mask.allowed(150, 151)
+    mask = interval_index.Mask(exclude=exclude).get_contig("chr3")
+    assert mask.allowed(10, 11)
+
+    mask = interval_index.Mask(include=include, exclude=exclude).get_contig("chr1")
+    assert mask.allowed(0, 1)
+    assert not mask.allowed(15, 16)
+    assert not mask.allowed(99, 101)
+    mask = interval_index.Mask(include=include, exclude=exclude).get_contig("chr2")
+    assert not mask.allowed(0, 1)
+
+    assert interval_index.Mask.from_bed_files() is None
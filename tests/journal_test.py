@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from simutator import journal
+
+
+def test_journal():
+    tmp_file = "tmp.journal"
+    if os.path.exists(tmp_file):
+        os.unlink(tmp_file)
+    assert journal.journal_filename("tmp") == tmp_file
+
+    j = journal.Journal(tmp_file)
+    assert j.entries == []
+    j.add({"x": 1})
+    j.finish("unit1")
+    j.finish("unit2", files={"fastq": "reads.fq.gz"})
+    expect_finished = {
+        "unit1": {"unit": "unit1"},
+        "unit2": {"unit": "unit2", "files": {"fastq": "reads.fq.gz"}},
+    }
+    assert j.finished() == expect_finished
+
+    # Incomplete last line, as if stopped while writing it
+    with open(tmp_file, "a") as f:
+        f.write('{"unit": "unit3"')
+    j = journal.Journal(tmp_file, resume=True)
+    assert j.entries[0] == {"x": 1}
+    assert j.finished() == expect_finished
+    j.finish("unit3")
+    j = journal.Journal(tmp_file, resume=True)
+    assert sorted(j.finished()) == ["unit1", "unit2", "unit3"]
+
+    # Not resuming starts again
+    j = journal.Journal(tmp_file)
+    assert j.entries == []
+    with open(tmp_file) as f:
+        assert f.read() == ""
+
+    with open(tmp_file, "w") as f:
+        print('{"unit": "unit1"', '{"unit": "unit2"}', sep="\n", file=f)
+    with pytest.raises(ValueError):
+        journal.Journal(tmp_file, resume=True)
+    j.remove()
+    assert not os.path.exists(tmp_file)
+
+
+def test_journal_check_options():
+    tmp_file = "tmp.journal_check_options"
+    j = journal.Journal(tmp_file)
+    options = {"seed": 42, "regions": ("chr1", "chr2")}
+    j.check_options(options)
+    j.finish("unit1")
+    j = journal.Journal(tmp_file, resume=True)
+    j.check_options(options)
+    assert list(j.finished()) == ["unit1"]
+    with pytest.raises(ValueError):
+        j.check_options({"seed": 1, "regions": ("chr1", "chr2")})
+    j.remove()
@@ -0,0 +1,116 @@
+import os
+import pytest
+
+import pyfastaq
+
+from simutator import genome_mutator, liftover
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "liftover")
+
+
+def _make_liftover():
+    # original:  0123456789ABCDE
+    # mutated:   01X3 6789GAAbCDE  (X=SNP, deleted 45, inserted AA after 9)
+    mutations = [
+        genome_mutator.Mutation(2, 2, "2", "X"),
+        genome_mutator.Mutation(3, 3, "345", "3"),
+        genome_mutator.Mutation(9, 7, "9", "9AA"),
+    ]
+    lift = liftover.Liftover()
+    lift.add_sequence("seq", "seq_mutated", 15, 15, mutations)
+    return lift
+
+
+def test_lift_position():
+    lift = _make_liftover()
+    expect = [0, 1, 2, 3, None, None, 4, 5, 6, 7, 10, 11, 12, 13, 14]
+    got = [lift.lift_position("seq", i) for i in range(15)]
+    assert got == expect
+    assert lift.lift_positions("seq", list(reversed(range(15)))) == list(
+        reversed(expect)
+    )
+
+    expect = [0, 1, 2, 3, 6, 7, 8, 9, None, None, 10, 11, 12, 13, 14]
+    got = [lift.lift_position("seq_mutated", i, to_original=True) for i in range(15)]
+    assert got == expect
+    got = lift.lift_positions("seq_mutated", [14, 0, 9, 6, 3], to_original=True)
+    assert got == [14, 0, None, 8, 3]
+
+    with pytest.raises(ValueError):
+        lift.lift_position("seq", 15)
+    with pytest.raises(KeyError):
+        lift.lift_position("not_a_seq", 1)
+
+
+def test_lift_interval():
+    lift = _make_liftover()
+    assert lift.lift_interval("seq", 0, 15) == (0, 15)
+    assert lift.lift_interval("seq", 4, 6) is None
+    assert lift.lift_interval("seq", 4, 7) == (4, 5)
+    assert lift.lift_interval("seq", 2, 6) == (2, 4)
+    assert lift.lift_interval("seq", 9, 11) == (7, 11)
+    assert lift.lift_interval("seq_mutated", 8, 10, to_original=True) is None
+    assert lift.lift_interval("seq_mutated", 7, 11, to_original=True) == (9, 11)
+
+
+def test_write_and_load_and_lift_bed_file():
+    lift = _make_liftover()
+    tmp_liftover = "tmp.liftover_write_and_load.liftover"
+    lift.write(tmp_liftover)
+    got = liftover.Liftover.from_file(tmp_liftover)
+    os.unlink(tmp_liftover)
+    assert list(got.contigs) == ["seq"]
+    assert got.mutated_names == {"seq_mutated": "seq"}
+    got_contig = got.contigs["seq"]
+    expect_contig = lift.contigs["seq"]
+    assert got_contig.__dict__ == expect_contig.__dict__
+
+    tmp_bed_out = "tmp.liftover_lift_bed_file.bed"
+    failed = got.lift_bed_file(os.path.join(data_dir, "in.bed"), tmp_bed_out)
+    assert failed == 2
+    with open(tmp_bed_out) as f:
+        got_lines = f.readlines()
+    os.unlink(tmp_bed_out)
+    assert got_lines == ["seq_mutated\t0\t3\tname1\n", "seq_mutated\t2\t11\tname2\n"]
+
+
+def test_mutate_fasta_file_liftover():
+    """Checks that lifting the position of every base of the original genome
+    gets the same base in the mutated genome"""
+    infile = os.path.join(data_dir, "mutate.in.fa")
+    mutator = genome_mutator.ComplexMutator(50, 10, 1, 2, 2, 3, seed=42)
+    tmp_prefix = "tmp.mutate_fasta_file_liftover"
+    mutator.mutate_fasta_file(
+        infile,
+        f"{tmp_prefix}.fa",
+        f"{tmp_prefix}.original.vcf",
+        f"{tmp_prefix}.mutated.vcf",
+        liftover_out=f"{tmp_prefix}.liftover",
+    )
+    lift = liftover.Liftover.from_file(f"{tmp_prefix}.liftover")
+    original_seqs = {}
+    pyfastaq.tasks.file_to_dict(infile, original_seqs)
+    mutated_seqs = {}
+    pyfastaq.tasks.file_to_dict(f"{tmp_prefix}.fa", mutated_seqs)
+    with open(f"{tmp_prefix}.original.vcf") as f:
+        variant_positions = {
+            (x.split("\t")[0], int(x.split("\t")[1]) - 1)
+            for x in f
+            if not x.startswith("#")
+        }
+    for suffix in "fa", "original.vcf", "mutated.vcf", "liftover":
+        os.unlink(f"{tmp_prefix}.{suffix}")
+
+    for name, original_seq in original_seqs.items():
+        contig = lift.get_contig(name)
+        mutated_seq = mutated_seqs[contig.mutated_name]
+        lifted = lift.lift_positions(name, list(range(len(original_seq))))
+        for i, j in enumerate(lifted):
+            # Only check bases that are outside complex variants, since
+            # bases inside them can be changed
+            if j is not None and not any(
+                (name, k) in variant_positions for k in range(i - 10, i + 1)
+            ):
+                assert original_seq[i] == mutated_seq[j]
+                assert lift.lift_position(contig.mutated_name, j, True) == i
@@ -0,0 +1,113 @@
+import gzip
+import math
+import os
+import random
+
+import pyfastaq
+import pytest
+
+from simutator import long_reads, progress
+
+
+def test_lognormal_parameters():
+    mu, sigma = long_reads.lognormal_parameters(10000, 5000)
+    assert math.exp(mu + sigma**2 / 2) == pytest.approx(10000)
+    variance = (math.exp(sigma**2) - 1) * math.exp(2 * mu + sigma**2)
+    assert math.sqrt(variance) == pytest.approx(5000)
+
+
+def test_add_errors():
+    with pytest.raises(ValueError):
+        long_reads.LongReadSimulator(substitution_rate=1)
+    seq = "".join(random.Random(1).choices("ACGT", k=100000))
+
+    simulator = long_reads.LongReadSimulator(
+        substitution_rate=0, insertion_rate=0, deletion_rate=0, seed=1
+    )
+    assert simulator.add_errors(seq, simulator._errors()) == seq
+
+    simulator = long_reads.LongReadSimulator(
+        substitution_rate=0.01, insertion_rate=0, deletion_rate=0, seed=1
+    )
+    got = simulator.add_errors(seq, simulator._errors())
+    assert len(got) == len(seq)
+    differences = sum(x != y for x, y in zip(seq, got))
+    assert 800 < differences < 1200
+
+    simulator = long_reads.LongReadSimulator(
+        substitution_rate=0, insertion_rate=0.01, deletion_rate=0.02, seed=1
+    )
+    got = simulator.add_errors(seq, simulator._errors())
+    # Expect about 1000 insertions and 2000 deletions
+    assert 98500 < len(got) < 99500
+
+
+def test_simulate_reads():
+    random_seq = random.Random(2)
+    sequences = [
+        ("seq1", "".join(random_seq.choices("ACGT", k=50000))),
+        ("seq2", "".join(random_seq.choices("ACGT", k=20000))),
+    ]
+    simulator = long_reads.LongReadSimulator(
+        mean_read_length=5000, read_length_sd=2000, seed=3
+    )
+    total_length = 0
+    for read in simulator.simulate_reads(sequences, 140000):
+        number, name, start, end, strand = read.id.split("_")
+        start, end = int(start) - 1, int(end)
+        total_length += end - start
+        original = dict(sequences)[name][start:end]
+        if strand == "-":
+            original = pyfastaq.sequences.Fasta("x", original)
+            original.revcomp()
+            original = original.seq
+        assert len(read.seq) == len(read.qual)
+        # Error rate is 1%, so expect the read and reference to be similar
+        assert abs(len(read.seq) - len(original)) < 0.05 * len(original) + 10
+        assert read.seq[:5] == original[:5] or read.seq[-5:] == original[-5:]
+    assert 140000 <= total_length < 140000 + 50000
+
+
+def test_simulate_reads_start_positions():
+    sequences = [("seq", "".join(random.Random(4).choices("ACGT", k=10000)))]
+    simulator = long_reads.LongReadSimulator(
+        mean_read_length=5000, read_length_sd=100, seed=5
+    )
+    starts = []
+    for read in simulator.simulate_reads(sequences, 1000000):
+        start = read.id.split("_")[2]
+        starts.append(int(start))
+    # Starts should be spread out, not stuck at the end of the sequence
+    assert max(starts.count(x) for x in set(starts)) < 5
+    assert sum(x < 2500 for x in starts) > 0.35 * len(starts)
+
+
+def test_simulate_long_reads_from_fasta():
+    tmp_ref = "tmp.simulate_long_reads_from_fasta.ref.fa"
+    tmp_reads = "tmp.simulate_long_reads_from_fasta.fq.gz"
+    pyfastaq.tasks.make_random_contigs(2, 10000, tmp_ref)
+    got = long_reads.simulate_long_reads_from_fasta(
+        tmp_ref, tmp_reads, read_depth=2, mean_read_length=1000, random_seed=42
+    )
+    with gzip.open(tmp_reads, "rt") as f:
+        first_run = f.read()
+    assert first_run.count("\n+\n") == got
+    long_reads.simulate_long_reads_from_fasta(
+        tmp_ref, tmp_reads, read_depth=2, mean_read_length=1000, random_seed=42
+    )
+    with gzip.open(tmp_reads, "rt") as f:
+        assert f.read() == first_run
+    reporter = progress.ProgressReporter("test", interval=None)
+    long_reads.simulate_long_reads_from_fasta(
+        tmp_ref,
+        tmp_reads,
+        read_depth=2,
+        mean_read_length=1000,
+        random_seed=42,
+        progress=reporter,
+    )
+    assert reporter.total_bases == 40000
+    assert reporter.bytes_written == len(first_run)
+    assert reporter.bases == sum(len(x) for x in first_run.split("\n")[1::4])
+    os.unlink(tmp_ref)
+    os.unlink(tmp_reads)
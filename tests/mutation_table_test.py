@@ -0,0 +1,60 @@
+import gzip
+import os
+import pytest
+
+from simutator import genome_mutator, mutation_table
+
+sequences = [
+    (
+        "seq1",
+        "seq1_mut",
+        100,
+        99,
+        [
+            genome_mutator.Mutation(9, 9, "A", "G"),
+            genome_mutator.Mutation(19, 19, "CT", "C"),
+        ],
+    ),
+    ("seq2", "seq2_mut", 50, 50, []),
+    ("seq3", "seq3_mut", 50, 52, [genome_mutator.Mutation(0, 0, "T", "TAA")]),
+]
+
+
+def test_table_filename():
+    assert mutation_table.table_filename("out", "tsv") == "out.mutations.tsv.gz"
+    assert mutation_table.table_filename("out", "parquet") == "out.mutations.parquet"
+
+
+def test_write_mutation_table_tsv():
+    tmp_out = "tmp.write_mutation_table.tsv.gz"
+    mutation_table.write_mutation_table(tmp_out, sequences, "type", "config")
+    with gzip.open(tmp_out, "rt") as f:
+        got = [line.rstrip("\n").split("\t") for line in f]
+    os.unlink(tmp_out)
+    expect = [
+        mutation_table.COLUMNS,
+        ["seq1", "seq1_mut", "10", "10", "A", "G", "type", "config"],
+        ["seq1", "seq1_mut", "20", "20", "CT", "C", "type", "config"],
+        ["seq3", "seq3_mut", "1", "1", "T", "TAA", "type", "config"],
+    ]
+    assert got == expect
+
+
+def test_write_mutation_table_parquet():
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    tmp_out = "tmp.write_mutation_table.parquet"
+    mutation_table.write_mutation_table(
+        tmp_out, sequences, "type", "config", file_format="parquet", row_group_size=2
+    )
+    got = pyarrow_parquet.read_table(tmp_out)
+    assert pyarrow_parquet.ParquetFile(tmp_out).num_row_groups == 2
+    os.unlink(tmp_out)
+    assert got.column_names == mutation_table.COLUMNS
+    assert got.column("original_pos").to_pylist() == [10, 20, 1]
+    assert got.column("alt").to_pylist() == ["G", "C", "TAA"]
+    assert got.column("configuration").to_pylist() == ["config"] * 3
+
+
+def test_write_mutation_table_bad_format():
+    with pytest.raises(ValueError):
+        mutation_table.write_mutation_table("x", sequences, "t", "c", "not_a_format")
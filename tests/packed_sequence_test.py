@@ -0,0 +1,85 @@
+import filecmp
+import os
+import pytest
+
+import pyfastaq
+
+from simutator import genome_mutator, packed_sequence
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "packed_sequence")
+
+
+def test_pack():
+    assert packed_sequence.pack("") == b""
+    assert packed_sequence.pack("ACGT") == bytes([0b00011011])
+    assert packed_sequence.pack("TTTTGa") == bytes([0b11111111, 0b10000000])
+    assert packed_sequence.pack("N") == bytes([0])
+
+
+def test_PackedSequence():
+    seqs = [
+        "",
+        "A",
+        "n",
+        "ACGTACGTAC",
+        "acgNNNNNNnnnnACGTRYKMacgtAnT",
+        "NNNNacgtACGT",
+    ]
+    for seq in seqs:
+        packed_seq = packed_sequence.PackedSequence.from_string(seq)
+        assert len(packed_seq) == len(seq)
+        assert str(packed_seq) == seq
+        assert packed_seq == seq
+        for i in range(len(seq)):
+            assert packed_seq[i] == seq[i]
+            assert packed_seq[-i - 1] == seq[-i - 1]
+            for j in range(i, len(seq) + 2):
+                assert packed_seq[i:j] == seq[i:j]
+        assert packed_seq[:] == seq
+        assert packed_seq[-3:] == seq[-3:]
+
+    packed_seq = packed_sequence.PackedSequence.from_string("ACGT")
+    with pytest.raises(IndexError):
+        packed_seq[4]
+    with pytest.raises(ValueError):
+        packed_seq[::2]
+
+
+def test_cache():
+    fasta_in = os.path.join(data_dir, "ref.fa")
+    tmp_cache = "tmp.packed_sequence_cache"
+    if os.path.exists(tmp_cache):
+        os.unlink(tmp_cache)
+    assert not packed_sequence.cache_is_valid(fasta_in, tmp_cache)
+    got = packed_sequence.load_reference(fasta_in, cache_file=tmp_cache)
+    assert packed_sequence.cache_is_valid(fasta_in, tmp_cache)
+    expect = [(x.id, x.seq) for x in pyfastaq.sequences.file_reader(fasta_in)]
+    assert [x[0] for x in expect] == ["seq1 description", "seq2", "seq3"]
+    assert [(x[0], str(x[1])) for x in got] == expect
+
+    # Loading again should use the cache, not remake it
+    cache_mtime = os.path.getmtime(tmp_cache)
+    got = list(packed_sequence.file_reader(fasta_in, cache_file=tmp_cache))
+    assert os.path.getmtime(tmp_cache) == cache_mtime
+    assert [(x.id, str(x.seq)) for x in got] == expect
+    os.unlink(tmp_cache)
+
+
+def test_mutate_fasta_file_with_reference_cache():
+    genome_mutator_data_dir = os.path.join(this_dir, "data", "genome_mutator")
+    infile = os.path.join(genome_mutator_data_dir, "SnpMutator_mutate_fasta.in.fa")
+    expected_fa = os.path.join(
+        genome_mutator_data_dir, "SnpMutator_mutate_fasta.out.fa"
+    )
+    tmp_cache = "tmp.mutate_fasta_file_with_reference_cache.cache"
+    tmp_out_fa = "tmp.mutate_fasta_file_with_reference_cache.fa"
+    tmp_vcf_ref = "tmp.mutate_fasta_file_with_reference_cache.ref.vcf"
+    tmp_vcf_mutated = "tmp.mutate_fasta_file_with_reference_cache.mutated.vcf"
+    mutator = genome_mutator.SnpMutator(30, seed=42)
+    mutator.mutate_fasta_file(
+        infile, tmp_out_fa, tmp_vcf_ref, tmp_vcf_mutated, reference_cache=tmp_cache
+    )
+    assert filecmp.cmp(tmp_out_fa, expected_fa, shallow=False)
+    for filename in tmp_cache, tmp_out_fa, tmp_vcf_ref, tmp_vcf_mutated:
+        os.unlink(filename)
@@ -0,0 +1,134 @@
+import logging
+import os
+
+
+from simutator import progress
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def _load_metrics(filename):
+    metrics = {}
+    with open(filename) as f:
+        for line in f:
+            if not line.startswith("#"):
+                name_and_labels, value = line.rstrip("\n").rsplit(" ", 1)
+                metrics[name_and_labels.split("{")[0]] = float(value)
+    return metrics
+
+
+def test_metrics_filename():
+    assert (
+        progress.metrics_filename("dir", "path/to/out", "snp.dist-100")
+        == "dir/out.snp.dist-100.prom"
+    )
+
+
+def test_format_duration():
+    assert progress.format_duration(0) == "0:00:00"
+    assert progress.format_duration(3725.8) == "1:02:05"
+
+
+def test_ProgressReporter(caplog):
+    caplog.set_level(logging.INFO)
+    clock = FakeClock()
+    reporter = progress.ProgressReporter(
+        "test", total_bases=1000, interval=10, clock=clock
+    )
+    assert reporter.eta() is None
+    clock.time = 5
+    reporter.update(bases=100, variants=2, bytes_written=50, contig="ctg1")
+    assert len(caplog.records) == 0
+    assert reporter.rate() == 20
+    assert reporter.eta() == 45
+    clock.time = 10
+    reporter.update(bases=100, variants=3, bytes_written=60, contig="ctg2")
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith("Progress test: 200/1000 bases (20.0%), 5 variants")
+    assert message.endswith("ETA 0:00:40 (last sequence: ctg2)")
+    clock.time = 15
+    reporter.update(bases=800)
+    assert len(caplog.records) == 1
+    reporter.finish()
+    assert len(caplog.records) == 2
+    assert caplog.records[1].getMessage().startswith("Finished test: 1000/1000")
+    assert reporter.eta() == 0
+
+
+def test_ProgressReporter_resume():
+    clock = FakeClock()
+    reporter = progress.ProgressReporter(
+        "test", total_bases=1000, interval=None, clock=clock
+    )
+    reporter.resume(bases=600, variants=6, bytes_written=700, contigs=3)
+    assert (reporter.bases, reporter.variants) == (600, 6)
+    assert (reporter.bytes_written, reporter.contigs) == (700, 3)
+    clock.time = 10
+    reporter.update(bases=100, contig="ctg4")
+    # Only the bases from after resuming count towards the rate
+    assert reporter.rate() == 10
+    assert reporter.eta() == 30
+    assert reporter.contigs == 4
+
+
+def test_ProgressReporter_no_interval(caplog):
+    caplog.set_level(logging.INFO)
+    clock = FakeClock()
+    reporter = progress.ProgressReporter("test", interval=None, clock=clock)
+    clock.time = 1000
+    reporter.update(bases=100)
+    assert len(caplog.records) == 0
+    assert reporter.eta() is None
+    reporter.finish()
+    assert len(caplog.records) == 1
+
+
+def test_ProgressReporter_metrics_file():
+    metrics_file = "tmp.ProgressReporter_metrics_file.prom"
+    if os.path.exists(metrics_file):
+        os.unlink(metrics_file)
+    clock = FakeClock()
+    reporter = progress.ProgressReporter(
+        "test",
+        total_bases=1000,
+        interval=10,
+        metrics_file=metrics_file,
+        labels={"configuration": 'a"b'},
+        clock=clock,
+    )
+    metrics = _load_metrics(metrics_file)
+    assert metrics["simutator_bases_processed"] == 0
+    assert metrics["simutator_finished"] == 0
+    assert "simutator_eta_seconds" not in metrics
+
+    clock.time = 10
+    reporter.update(bases=500, variants=10, bytes_written=600, contig="ctg1")
+    metrics = _load_metrics(metrics_file)
+    assert metrics["simutator_bases_processed"] == 500
+    assert metrics["simutator_bases_total"] == 1000
+    assert metrics["simutator_variants"] == 10
+    assert metrics["simutator_bytes_written"] == 600
+    assert metrics["simutator_contigs_processed"] == 1
+    assert metrics["simutator_bases_per_second"] == 50
+    assert metrics["simutator_eta_seconds"] == 10
+    assert metrics["simutator_peak_memory_bytes"] > 0
+    update_time = reporter.last_update_time
+    assert metrics["simutator_last_update_time_seconds"] == update_time
+    with open(metrics_file) as f:
+        lines = f.readlines()
+    assert "# TYPE simutator_variants gauge\n" in lines
+    assert 'simutator_variants{configuration="a\\"b"} 10\n' in lines
+
+    reporter.finish()
+    metrics = _load_metrics(metrics_file)
+    assert metrics["simutator_finished"] == 1
+    assert metrics["simutator_last_update_time_seconds"] == update_time
+    assert not os.path.exists(metrics_file + ".tmp")
+    os.unlink(metrics_file)
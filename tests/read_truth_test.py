@@ -0,0 +1,49 @@
+import gzip
+import os
+
+from simutator import read_truth
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "read_truth")
+
+
+def test_MutatedGenomeVariants():
+    variants = read_truth.MutatedGenomeVariants.from_vcf(
+        os.path.join(data_dir, "mutated.vcf")
+    )
+    name = "ctg__simutator__X"
+    assert list(variants.starts[name]) == [9, 19, 32]
+    assert list(variants.ends[name]) == [10, 22, 33]
+    assert variants.original_positions[name] == [9, 19, 30]
+    assert variants.overlapping_variants(name, 0, 9) == []
+    assert variants.overlapping_variants(name, 0, 10) == [9]
+    assert variants.overlapping_variants(name, 9, 33) == [9, 19, 30]
+    assert variants.overlapping_variants(name, 22, 32) == []
+    assert variants.overlapping_variants("other__simutator__X", 0, 20) == []
+    contig = variants.liftover.get_contig(name)
+    assert contig.name == "ctg"
+    assert contig.original_length == 50
+
+
+def test_art_aln_reads():
+    got = list(read_truth.art_aln_reads(os.path.join(data_dir, "reads.1.aln")))
+    assert got == [
+        ("read1", "ctg__simutator__X", 5, 15, "+"),
+        ("read2", "ctg__simutator__X", 15, 25, "-"),
+        ("read3", "ctg__simutator__X", 20, 29, "+"),
+    ]
+
+
+def test_write_truth_table():
+    tmp_out = "tmp.write_truth_table.tsv.gz"
+    read_truth.write_truth_table(
+        [os.path.join(data_dir, f"reads.{i}.aln") for i in (1, 2)],
+        os.path.join(data_dir, "mutated.vcf"),
+        tmp_out,
+    )
+    with gzip.open(tmp_out, "rt") as f:
+        got = f.read()
+    with open(os.path.join(data_dir, "truth.tsv.expect")) as f:
+        expect = f.read()
+    assert got == expect
+    os.unlink(tmp_out)
@@ -0,0 +1,84 @@
+import os
+import signal
+import time
+
+import pytest
+
+from simutator import scheduler
+
+
+def test_parse_memory():
+    assert scheduler.parse_memory("1000") == 1000
+    assert scheduler.parse_memory("2k") == 2048
+    assert scheduler.parse_memory("1.5G") == 1.5 * 1024**3
+    assert scheduler.parse_memory("16GB") == 16 * 1024**3
+    assert scheduler.parse_memory("1T") == 1024**4
+    for s in "", "G", "1X", "1.2.3M":
+        with pytest.raises(ValueError):
+            scheduler.parse_memory(s)
+
+
+def _sleep(name, seconds):
+    start = time.time()
+    time.sleep(seconds)
+    if name == "bad":
+        raise ValueError("oops")
+    return name, start, time.time()
+
+
+def _die(name):
+    if name == "killed":
+        os.kill(os.getpid(), signal.SIGKILL)
+    time.sleep(0.1)
+    return name
+
+
+def test_run_jobs():
+    memory = {"a": 60, "b": 50, "c": 40, "d": 10, "e": 150}
+    jobs = [(x, 0.2) for x in memory]
+    got = dict(
+        scheduler.run_jobs(
+            _sleep, jobs, list(memory.values()), processes=3, max_memory=100
+        )
+    )
+    assert sorted(got) == list(range(len(jobs)))
+    intervals = [got[i] for i in range(len(jobs))]
+    assert [x[0] for x in intervals] == list(memory)
+    # At the time each job started, check the memory of the jobs that were
+    # running. e is bigger than the maximum, so must have run on its own
+    for name, start, _ in intervals:
+        running = [x for x, s, e in intervals if s <= start < e]
+        assert len(running) <= 3
+        if name == "e":
+            assert running == ["e"]
+        else:
+            assert sum(memory[x] for x in running) <= 100
+
+    with pytest.raises(ValueError):
+        list(scheduler.run_jobs(_sleep, [("bad", 0), ("ok", 0)], [1, 1], processes=2))
+
+
+def test_run_jobs_process_killed():
+    with pytest.raises(RuntimeError):
+        list(scheduler.run_jobs(_die, [("killed",), ("ok",)], [1, 1], processes=2))
+
+
+def _touch_after(filename, seconds):
+    time.sleep(seconds)
+    if filename == "bad":
+        raise ValueError("oops")
+    with open(filename, "w"):
+        pass
+
+
+def test_run_jobs_stops_running_jobs_on_error():
+    # The slow job is killed when the other one fails, instead of being
+    # left to finish and write its file
+    tmp_file = "tmp.run_jobs_stops_running_jobs_on_error"
+    if os.path.exists(tmp_file):
+        os.unlink(tmp_file)
+    jobs = [("bad", 0.1), (tmp_file, 1)]
+    with pytest.raises(ValueError):
+        list(scheduler.run_jobs(_touch_after, jobs, [1, 1], processes=2))
+    time.sleep(1.5)
+    assert not os.path.exists(tmp_file)
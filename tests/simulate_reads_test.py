@@ -1,10 +1,11 @@
+import gzip
 import os
 import pytest
 import shutil
 
 import pyfastaq
 
-from simutator import simulate_reads, utils
+from simutator import journal, simulate_reads, utils
 
 
 def test_simulate_illumina_paired_reads_from_fasta():
@@ -78,3 +79,152 @@ def test_iterative_simulate_reads():
         assert os.path.exists(d["fastq1"])
         assert os.path.exists(d["fastq2"])
     shutil.rmtree(tmpdir)
+
+
+def test_shard_paired_fastq():
+    tmp_prefix = "tmp.shard_paired_fastq"
+    utils.syscall(f"rm -rf {tmp_prefix}.*")
+    for i in (1, 2):
+        with open(f"{tmp_prefix}.{i}.fq", "w") as f:
+            for j in range(5):
+                print(f"@read{j}/{i}", "ACGT", "+", "IIII", sep="\n", file=f)
+
+    got = simulate_reads.shard_paired_fastq(
+        f"{tmp_prefix}.1.fq", f"{tmp_prefix}.2.fq", f"{tmp_prefix}.out", 2
+    )
+    assert got == [
+        (f"{tmp_prefix}.out.shard1of2.1.fq.gz", f"{tmp_prefix}.out.shard1of2.2.fq.gz"),
+        (f"{tmp_prefix}.out.shard2of2.1.fq.gz", f"{tmp_prefix}.out.shard2of2.2.fq.gz"),
+    ]
+    assert got == simulate_reads.shard_filenames(f"{tmp_prefix}.out", 2)
+    for shard, read_numbers in zip(got, ([0, 2, 4], [1, 3])):
+        for i, filename in enumerate(shard):
+            got_ids = [x.id for x in pyfastaq.sequences.file_reader(filename)]
+            assert got_ids == [f"read{j}/{i + 1}" for j in read_numbers]
+
+    with open(f"{tmp_prefix}.2.fq", "a") as f:
+        print("@read5/2", "ACGT", "+", "IIII", sep="\n", file=f)
+    with pytest.raises(ValueError):
+        simulate_reads.shard_paired_fastq(
+            f"{tmp_prefix}.1.fq", f"{tmp_prefix}.2.fq", f"{tmp_prefix}.out", 2
+        )
+    utils.syscall(f"rm -rf {tmp_prefix}.*")
+
+
+def test_reads_files_to_json():
+    f = simulate_reads.reads_files_to_json
+    assert f(("a.1.fq.gz", "a.2.fq.gz")) == {
+        "fastq1": "a.1.fq.gz",
+        "fastq2": "a.2.fq.gz",
+    }
+    assert f([("a1", "a2"), ("b1", "b2")], output_shards=2) == {
+        "shards": [{"fastq1": "a1", "fastq2": "a2"}, {"fastq1": "b1", "fastq2": "b2"}]
+    }
+    assert f("-", interleaved_out="-") == {"interleaved_fastq": "-"}
+
+
+def test_output_shards_must_be_positive():
+    for shards in 0, -1:
+        with pytest.raises(ValueError):
+            simulate_reads.simulate_illumina_paired_reads_from_fasta(
+                "ref.fa", "out", output_shards=shards
+            )
+        with pytest.raises(ValueError):
+            simulate_reads.iterative_simulate_reads(
+                "ref.fa", "out", ["HS25"], [50], [1], [300], 10, output_shards=shards
+            )
+
+
+def test_interleave_paired_fastq(capsys):
+    tmp_prefix = "tmp.interleave_paired_fastq"
+    utils.syscall(f"rm -rf {tmp_prefix}.*")
+    for i in (1, 2):
+        with open(f"{tmp_prefix}.{i}.fq", "w") as f:
+            for j in range(3):
+                print(f"@read{j}/{i}", "ACGT", "+", "IIII", sep="\n", file=f)
+
+    simulate_reads.interleave_paired_fastq(
+        f"{tmp_prefix}.1.fq", f"{tmp_prefix}.2.fq", f"{tmp_prefix}.out.fq"
+    )
+    got_ids = [x.id for x in pyfastaq.sequences.file_reader(f"{tmp_prefix}.out.fq")]
+    assert got_ids == [f"read{j}/{i}" for j in range(3) for i in (1, 2)]
+    simulate_reads.interleave_paired_fastq(
+        f"{tmp_prefix}.1.fq", f"{tmp_prefix}.2.fq", "-"
+    )
+    with open(f"{tmp_prefix}.out.fq") as f:
+        assert capsys.readouterr().out == f.read()
+    utils.syscall(f"rm -rf {tmp_prefix}.*")
+
+
+def test_iterative_simulate_long_reads():
+    tmp_ref = "tmp.iterative_simulate_long_reads.ref.fa"
+    outprefix = "tmp.iterative_simulate_long_reads.out"
+    pyfastaq.tasks.make_random_contigs(1, 5000, tmp_ref)
+    got = simulate_reads.iterative_simulate_long_reads(
+        tmp_ref, outprefix, [1, 2], [1000], 500
+    )
+    assert [x["read_depth"] for x in got] == [1, 2]
+    parallel_prefix = outprefix + ".parallel"
+    metrics_dir = outprefix + ".metrics"
+    got_parallel = simulate_reads.iterative_simulate_long_reads(
+        tmp_ref,
+        parallel_prefix,
+        [1, 2],
+        [1000],
+        500,
+        processes=2,
+        metrics_dir=metrics_dir,
+    )
+    prefix = os.path.basename(parallel_prefix)
+    assert sorted(os.listdir(metrics_dir)) == [
+        f"{prefix}.all.prom",
+        f"{prefix}.long.1000.500.1.prom",
+        f"{prefix}.long.1000.500.2.prom",
+    ]
+    shutil.rmtree(metrics_dir)
+    for x, y in zip(got, got_parallel):
+        assert y["fastq"] == parallel_prefix + x["fastq"][len(outprefix) :]
+        with gzip.open(x["fastq"]) as f1, gzip.open(y["fastq"]) as f2:
+            assert f1.read() == f2.read()
+        os.unlink(y["fastq"])
+    for x in got:
+        assert x["fastq"] == f"{outprefix}.long.1000.500.{x['read_depth']}.fq.gz"
+        assert os.path.exists(x["fastq"])
+        os.unlink(x["fastq"])
+    os.unlink(tmp_ref)
+    os.unlink(tmp_ref + ".fai")
+
+
+def test_iterative_simulate_long_reads_to_stdout(capsys):
+    tmp_ref = "tmp.iterative_simulate_long_reads_to_stdout.ref.fa"
+    outprefix = "tmp.iterative_simulate_long_reads_to_stdout.out"
+    pyfastaq.tasks.make_random_contigs(1, 5000, tmp_ref)
+    with pytest.raises(ValueError):
+        simulate_reads.iterative_simulate_long_reads(
+            tmp_ref, outprefix, [1, 2], [1000], 500, reads_out="-"
+        )
+    got = simulate_reads.iterative_simulate_long_reads(
+        tmp_ref, outprefix, [1], [1000], 500, reads_out="-"
+    )
+    assert got[0]["fastq"] == "-"
+    assert capsys.readouterr().out.startswith("@1_1_")
+    os.unlink(tmp_ref)
+
+
+def test_iterative_simulate_long_reads_resume():
+    tmp_ref = "tmp.iterative_simulate_long_reads_resume.ref.fa"
+    outprefix = "tmp.iterative_simulate_long_reads_resume.out"
+    pyfastaq.tasks.make_random_contigs(1, 5000, tmp_ref)
+    # Make journal as if the first set of reads finished before stopping
+    finished_file = f"{outprefix}.long.1000.500.1.fq.gz"
+    sweep_journal = journal.Journal(journal.journal_filename(outprefix))
+    sweep_journal.finish(finished_file, files={"fastq": finished_file})
+    got = simulate_reads.iterative_simulate_long_reads(
+        tmp_ref, outprefix, [1, 2], [1000], 500, resume=True
+    )
+    assert got[0] == {"fastq": finished_file}
+    assert got[1]["fastq"] == f"{outprefix}.long.1000.500.2.fq.gz"
+    assert not os.path.exists(finished_file)
+    assert not os.path.exists(journal.journal_filename(outprefix))
+    os.unlink(got[1]["fastq"])
+    os.unlink(tmp_ref)
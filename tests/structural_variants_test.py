@@ -0,0 +1,222 @@
+import os
+import random
+
+import pyfastaq
+import pytest
+
+from simutator import fasta_index, interval_index, structural_variants
+
+Segment = structural_variants.Segment
+
+
+def _write_genome(filename, seqs):
+    with open(filename, "w") as f:
+        for name, seq in seqs.items():
+            print(pyfastaq.sequences.Fasta(name, seq), file=f)
+
+
+def _load_fasta(filename):
+    seqs = {}
+    pyfastaq.tasks.file_to_dict(filename, seqs)
+    return {k: v.seq for k, v in seqs.items()}
+
+
+def _load_vcf_records(filename):
+    with open(filename) as f:
+        return [x.rstrip("\n").split("\t") for x in f if not x.startswith("#")]
+
+
+def _clean_up(fasta_file, outfiles):
+    for filename in [fasta_file, fasta_file + ".fai"] + outfiles:
+        os.unlink(filename)
+
+
+def test_reverse_complement():
+    assert structural_variants.reverse_complement("AACGTNacgt") == "acgtNACGTT"
+
+
+def test_split_at():
+    segments = [Segment("a", 0, 5, False), Segment("b", 10, 20, True)]
+    assert structural_variants._split_at(segments, 0) == ([], segments)
+    assert structural_variants._split_at(segments, 5) == (segments[:1], segments[1:])
+    assert structural_variants._split_at(segments, 15) == (segments, [])
+    assert structural_variants._split_at(segments, 2) == (
+        [Segment("a", 0, 2, False)],
+        [Segment("a", 2, 5, False), segments[1]],
+    )
+    assert structural_variants._split_at(segments, 8) == (
+        [segments[0], Segment("b", 17, 20, True)],
+        [Segment("b", 10, 17, True)],
+    )
+
+
+def test_write_segments():
+    tmp_fa = "tmp.write_segments.fa"
+    seq = "".join(random.Random(1).choices("ACGT", k=100))
+    _write_genome(tmp_fa, {"seq": seq})
+    segments = [
+        Segment("seq", 0, 17, False),
+        Segment("seq", 17, 60, True),
+        Segment("seq", 5, 20, False),
+    ]
+    expect = seq[:17] + structural_variants.reverse_complement(seq[17:60]) + seq[5:20]
+    tmp_out = "tmp.write_segments.out.fa"
+    starts = structural_variants.segment_starts(segments)
+    assert starts == [0, 17, 60]
+    with fasta_index.FastaIndex(tmp_fa) as fasta_idx:
+        for i in range(len(expect)):
+            assert (
+                structural_variants.segments_base(fasta_idx, segments, i) == expect[i]
+            )
+            assert (
+                structural_variants.segments_base(fasta_idx, segments, i, starts)
+                == expect[i]
+            )
+        with pytest.raises(IndexError):
+            structural_variants.segments_base(fasta_idx, segments, len(expect))
+        with open(tmp_out, "w") as f:
+            structural_variants.write_segments(
+                fasta_idx, "new", segments, f, line_length=10, chunk_size=7
+            )
+    with open(tmp_out) as f:
+        lines = f.read().rstrip("\n").split("\n")
+    assert lines[0] == ">new"
+    assert lines[1:] == [expect[i : i + 10] for i in range(0, len(expect), 10)]
+    _clean_up(tmp_fa, [tmp_out])
+
+
+def test_InversionMutator():
+    tmp_fa = "tmp.InversionMutator.fa"
+    rng = random.Random(2)
+    seqs = {
+        "seq1": "".join(rng.choices("ACGT", k=100)),
+        "seq2": "".join(rng.choices("ACGT", k=30)),
+    }
+    _write_genome(tmp_fa, seqs)
+    mutator = structural_variants.InversionMutator(20, 10)
+    outfiles = [f"tmp.InversionMutator.{x}" for x in ["out.fa", "orig.vcf", "mut.vcf"]]
+    mutator.mutate_fasta_file(tmp_fa, *outfiles)
+
+    rc = structural_variants.reverse_complement
+    s = seqs["seq1"]
+    expect = {
+        "seq1__simutator__INV_length_10_every_20": s[:20]
+        + rc(s[20:30])
+        + s[30:50]
+        + rc(s[50:60])
+        + s[60:80]
+        + rc(s[80:90])
+        + s[90:],
+        "seq2__simutator__INV_length_10_every_20": seqs["seq2"],
+    }
+    assert _load_fasta(outfiles[0]) == expect
+
+    expect_vcf = [
+        ["seq1", str(x), ".", s[x - 1], "<INV>", ".", "PASS"]
+        + [f"SVTYPE=INV;END={x + 10};SVLEN=10", "GT", "1/1"]
+        for x in [20, 50, 80]
+    ]
+    assert _load_vcf_records(outfiles[1]) == expect_vcf
+    for record in expect_vcf:
+        record[0] = "seq1__simutator__INV_length_10_every_20"
+    assert _load_vcf_records(outfiles[2]) == expect_vcf
+    with open(outfiles[1]) as f:
+        assert '##ALT=<ID=INV,Description="Inversion">\n' in f.readlines()
+    _clean_up(tmp_fa, outfiles)
+
+
+def test_InversionMutator_with_mask():
+    include = interval_index.IntervalIndex()
+    include.contigs["seq1"] = interval_index.ContigIntervals.from_intervals([(40, 70)])
+    mask = interval_index.Mask(include=include)
+    mutator = structural_variants.InversionMutator(20, 10)
+    segments, variants = mutator.mutated_genome({"seq1": 100, "seq2": 50}, mask=mask)
+    assert variants == [("seq1", 50, 60, 50)]
+    assert segments == {
+        "seq1": [
+            Segment("seq1", 0, 50, False),
+            Segment("seq1", 50, 60, True),
+            Segment("seq1", 60, 100, False),
+        ],
+        "seq2": [Segment("seq2", 0, 50, False)],
+    }
+
+
+def test_TandemDuplicationMutator():
+    with pytest.raises(ValueError):
+        structural_variants.TandemDuplicationMutator(20, 10, copies=1)
+    tmp_fa = "tmp.TandemDuplicationMutator.fa"
+    s = "".join(random.Random(3).choices("ACGT", k=70))
+    _write_genome(tmp_fa, {"seq": s})
+    mutator = structural_variants.TandemDuplicationMutator(20, 5, copies=3)
+    outfiles = [
+        f"tmp.TandemDuplicationMutator.{x}" for x in ["out.fa", "orig.vcf", "mut.vcf"]
+    ]
+    mutator.mutate_fasta_file(tmp_fa, *outfiles)
+    name = "seq__simutator__DUP_length_5_copies_3_every_20"
+    mutated = s[:25] + s[20:25] * 2 + s[25:50] + s[45:50] * 2 + s[50:]
+    assert _load_fasta(outfiles[0]) == {name: mutated}
+    assert _load_vcf_records(outfiles[1]) == [
+        ["seq", str(x), ".", s[x - 1], "<DUP:TANDEM>", ".", "PASS"]
+        + [f"SVTYPE=DUP;END={x + 5};SVLEN=10;COPIES=3", "GT", "1/1"]
+        for x in [20, 45]
+    ]
+    assert _load_vcf_records(outfiles[2]) == [
+        [name, str(x), ".", mutated[x - 1], "<DEL>", ".", "PASS"]
+        + [f"SVTYPE=DEL;END={x + 10};SVLEN=-10", "GT", "1/1"]
+        for x in [25, 60]
+    ]
+    _clean_up(tmp_fa, outfiles)
+
+
+def test_TranslocationMutator():
+    tmp_fa = "tmp.TranslocationMutator.fa"
+    rng = random.Random(4)
+    seqs = {f"seq{i}": "".join(rng.choices("ACGT", k=50 + i)) for i in range(5)}
+    _write_genome(tmp_fa, seqs)
+    mutator = structural_variants.TranslocationMutator(2, seed=42)
+    outfiles = [
+        f"tmp.TranslocationMutator.{x}" for x in ["out.fa", "orig.vcf", "mut.vcf"]
+    ]
+    mutator.mutate_fasta_file(tmp_fa, *outfiles)
+    mutated = _load_fasta(outfiles[0])
+    assert len(mutated) == 5
+    assert sum(len(x) for x in mutated.values()) == sum(len(x) for x in seqs.values())
+    original_records = _load_vcf_records(outfiles[1])
+    assert len(original_records) == 8
+
+    mutated_seqs = {k.split("__")[0]: v for k, v in mutated.items()}
+    translocated = set()
+    for record in original_records:
+        if record[2].endswith("_1"):
+            name_a, a = record[0], int(record[1])
+            assert record[3] == seqs[name_a][a - 1]
+            name_b, b = record[4].split("[")[1].split(":")
+            b = int(b) - 1
+            assert mutated_seqs[name_a] == seqs[name_a][:a] + seqs[name_b][b:]
+            assert mutated_seqs[name_b] == seqs[name_b][:b] + seqs[name_a][a:]
+            translocated.update([name_a, name_b])
+    assert len(translocated) == 4
+    for name in set(seqs).difference(translocated):
+        assert mutated_seqs[name] == seqs[name]
+
+    # Swapping the ends back gets the original genome, so the mutated VCF has
+    # the same breakpoints
+    mutated_records = _load_vcf_records(outfiles[2])
+    assert [x[1:3] for x in mutated_records] == [x[1:3] for x in original_records]
+    _clean_up(tmp_fa, outfiles)
+
+
+def test_TranslocationMutator_not_enough_sequences():
+    mutator = structural_variants.TranslocationMutator(2, seed=1)
+    segments, variants = mutator.mutated_genome({"seq1": 100, "seq2": 100, "s3": 1})
+    assert len(variants) == 1
+    assert segments["s3"] == [Segment("s3", 0, 1, False)]
+
+
+def test_mutate_fasta_file_needs_uncompressed_fasta():
+    mutator = structural_variants.InversionMutator(20, 10)
+    with pytest.raises(ValueError):
+        mutator.mutate_fasta_file("in.fa.gz", "out.fa", None, None)
+    with pytest.raises(ValueError):
+        mutator.mutate_fasta_file("-", "out.fa", None, None)
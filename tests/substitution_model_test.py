@@ -0,0 +1,64 @@
+import collections
+import os
+import random
+
+import pytest
+
+from simutator import substitution_model
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(this_dir, "data", "substitution_model")
+
+
+def test_uniform_model():
+    model = substitution_model.SubstitutionModel()
+    refs = list("ACGTTGCA" * 10)
+    # Should get the same as the old way of choosing the new base
+    rng = random.Random(42)
+    expect = [
+        rng.choice(sorted(list({"A", "C", "G", "T"}.difference({x})))) for x in refs
+    ]
+    assert model.mutate_bases(refs, random.Random(42)) == expect
+    rng = random.Random(42)
+    assert [model.mutate_base(x, rng) for x in refs] == expect
+
+
+def test_from_ts_tv():
+    model = substitution_model.SubstitutionModel.from_ts_tv(2)
+    assert model.alternatives["A"] == ["C", "G", "T"]
+    assert model.cumulative_weights["A"] == [1, 5, 6]
+    assert model.cumulative_weights["C"] == [1, 2, 6]
+    counts = collections.Counter(model.mutate_bases(["A"] * 12000, random.Random(1)))
+    # Expect 2/3 transitions, 1/6 each transversion
+    assert 7500 < counts["G"] < 8500
+    assert 1500 < counts["C"] < 2500
+    assert 1500 < counts["T"] < 2500
+    with pytest.raises(ValueError):
+        substitution_model.SubstitutionModel.from_ts_tv(0)
+
+
+def test_from_matrix_file():
+    model = substitution_model.SubstitutionModel.from_matrix_file(
+        os.path.join(data_dir, "matrix.tsv")
+    )
+    assert model.cumulative_weights == {
+        "A": [0, 1, 1],
+        "C": [1, 1, 2],
+        "G": [1, 2, 3],
+        "T": [0, 2, 3],
+    }
+    refs = list("ACGTACGTACGTACGT")
+    got = model.mutate_bases(refs, random.Random(3))
+    assert got[0::4] == ["G"] * 4
+    assert set(got[1::4]).issubset({"A", "T"})
+    assert set(got[2::4]).issubset({"A", "C", "T"})
+    assert set(got[3::4]).issubset({"C", "G"})
+
+    with pytest.raises(ValueError):
+        substitution_model.SubstitutionModel.from_matrix_file(
+            os.path.join(data_dir, "matrix_missing_row.tsv")
+        )
+    with pytest.raises(ValueError):
+        substitution_model.SubstitutionModel.from_matrix_file(
+            os.path.join(data_dir, "matrix_bad_row.tsv")
+        )
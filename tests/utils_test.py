@@ -1,5 +1,10 @@
+import io
+import logging
 import os
 import pytest
+import sys
+import time
+
 from simutator import utils
 
 modules_dir = os.path.dirname(os.path.abspath(utils.__file__))
@@ -24,3 +29,139 @@ def test_syscall_with_error():
     """test syscall when there is an error"""
     with pytest.raises(RuntimeError):
         utils.syscall("notacommandunlessyoumadeitone")
+
+
+def test_prefetch_iterator():
+    assert list(utils.prefetch_iterator(range(10), queue_size=2)) == list(range(10))
+
+    def bad_iterator():
+        yield 1
+        raise ValueError("oops")
+
+    got = []
+    with pytest.raises(ValueError):
+        for x in utils.prefetch_iterator(bad_iterator()):
+            got.append(x)
+    assert got == [1]
+
+    # Stopping early stops the background thread and closes the iterable
+    closed = []
+
+    def endless_iterator():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.append(True)
+
+    prefetcher = utils.prefetch_iterator(endless_iterator(), queue_size=2)
+    assert next(prefetcher) == 0
+    prefetcher.close()
+    assert closed == [True]
+
+
+def test_BackgroundWriter():
+    tmp_file = "tmp.BackgroundWriter.txt"
+    with open(tmp_file, "w") as f, utils.BackgroundWriter(f, queue_size=2) as writer:
+        for i in range(100):
+            writer.write(f"{i}\n")
+            if i == 49:
+                writer.flush()
+                assert os.path.getsize(tmp_file) == len(
+                    "".join([f"{i}\n" for i in range(50)])
+                )
+    with open(tmp_file) as f:
+        assert f.read() == "".join([f"{i}\n" for i in range(100)])
+    os.unlink(tmp_file)
+
+
+def test_open_output(capsys):
+    with utils.open_output("-") as f:
+        f.write("to stdout\n")
+    assert capsys.readouterr().out == "to stdout\n"
+    tmp_file = "tmp.open_output.txt"
+    with utils.open_output(tmp_file, "wb") as f:
+        f.write(b"to file\n")
+    with open(tmp_file) as f:
+        assert f.read() == "to file\n"
+    os.unlink(tmp_file)
+
+
+def test_stdin_to_file(monkeypatch):
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(b"from stdin\n")))
+    tmp_file = "tmp.stdin_to_file.txt"
+    with utils.stdin_to_file(tmp_file) as filename:
+        assert filename == tmp_file
+        with open(tmp_file) as f:
+            assert f.read() == "from stdin\n"
+    assert not os.path.exists(tmp_file)
+
+
+def test_atomic_outputs():
+    tmp_file = "tmp.atomic_outputs.txt"
+    with utils.atomic_outputs([tmp_file, None, "-"]) as got:
+        assert got == [utils.tmp_filename(tmp_file), None, "-"]
+        with open(got[0], "w") as f:
+            print("done", file=f)
+        assert not os.path.exists(tmp_file)
+    assert not os.path.exists(utils.tmp_filename(tmp_file))
+    with open(tmp_file) as f:
+        assert f.read() == "done\n"
+
+    with pytest.raises(ValueError):
+        with utils.atomic_outputs([tmp_file]) as got:
+            with open(got[0], "w") as f:
+                print("not done", file=f)
+            raise ValueError()
+    with open(tmp_file) as f:
+        assert f.read() == "done\n"
+    assert os.path.exists(utils.tmp_filename(tmp_file))
+    os.unlink(tmp_file)
+    os.unlink(utils.tmp_filename(tmp_file))
+
+
+def test_format_memory():
+    assert utils.format_memory(100) == "100"
+    assert utils.format_memory(1536) == "1.5K"
+    assert utils.format_memory(3 * 1024**3) == "3.0G"
+
+
+def test_streaming_syscall(caplog):
+    caplog.set_level(logging.INFO)
+    got = utils.streaming_syscall(["sh", "-c", "echo testing 123; echo oops >&2"])
+    assert got.returncode == 0
+    assert "stdout: testing 123" in caplog.text
+    assert "stderr: oops" in caplog.text
+
+    # Long lines, and lines ended by carriage returns, are fine
+    caplog.clear()
+    command = "import sys; print('x' * 200000); print('a\\rb', end='')"
+    got = utils.streaming_syscall([sys.executable, "-c", command])
+    assert got.returncode == 0
+    assert "stdout: a\n" in caplog.text
+    assert "stdout: b\n" in caplog.text
+    assert caplog.text.count("x") >= 200000
+
+    got = utils.streaming_syscall("exit 1", allow_fail=True)
+    assert got.returncode == 1
+
+    with pytest.raises(RuntimeError):
+        utils.streaming_syscall(["notacommandunlessyoumadeitone"])
+    with pytest.raises(RuntimeError):
+        utils.streaming_syscall("exit 1")
+    with pytest.raises(RuntimeError):
+        utils.streaming_syscall(["sleep", "10"], timeout=0.1)
+
+
+def test_streaming_syscalls():
+    start_time = time.time()
+    got = utils.streaming_syscalls([["sleep", "0.5"]] * 4, max_concurrent=4)
+    assert time.time() - start_time < 1.5
+    assert [x.returncode for x in got] == [0, 0, 0, 0]
+
+    start_time = time.time()
+    with pytest.raises(RuntimeError):
+        utils.streaming_syscalls([["sleep", "10"], "exit 1"], max_concurrent=2)
+    assert time.time() - start_time < 5